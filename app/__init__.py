@@ -1,8 +1,17 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from app.config import config
+from app.database import SQLAlchemy
+from app.kernels import KernelPools
+from app.notebook_cache import NotebookCache, ParsedNotebookCache
+from app.resident import ResidentKernels
+from app.warmup import Warmup
 
 db = SQLAlchemy()
+kernel_pools = KernelPools()
+notebook_cache = NotebookCache()
+parsed_notebooks = ParsedNotebookCache()
+resident_kernels = ResidentKernels()
+warmup = Warmup()
 
 
 def create_app(config_name):
@@ -10,6 +19,11 @@ def create_app(config_name):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     db.init_app(app)
+    kernel_pools.init_app(app)
+    notebook_cache.init_app(app)
+    parsed_notebooks.init_app(app)
+    resident_kernels.init_app(app)
+    warmup.init_app(app)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from distutils.util import strtobool
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -6,6 +8,127 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # connection pool for a server database like Postgres given as DATABASE_URL. Connections are checked
+    # before use and replaced after DATABASE_POOL_RECYCLE seconds so ones closed by the server are not handed out.
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 5)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 10)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+    DATABASE_POOL_PRE_PING = strtobool(os.environ.get('DATABASE_POOL_PRE_PING') or "true")
+    # SQLite connections wait up to SQLITE_BUSY_TIMEOUT seconds for a lock held by another worker. WAL lets
+    # runs read templates while another worker writes them, set SQLITE_JOURNAL_MODE empty to leave it alone.
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT') or 30)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', "NORMAL")
+
+    # pre-started kernels kept per kernelspec for notebook runs. 0 starts a new kernel per run.
+    KERNEL_POOL_SIZE = int(os.environ.get('KERNEL_POOL_SIZE') or 0)
+    # a kernel is replaced after this many runs or once its memory use passes the threshold (0 for no limit)
+    KERNEL_POOL_MAX_USES = int(os.environ.get('KERNEL_POOL_MAX_USES') or 20)
+    KERNEL_POOL_MAX_MEMORY_MB = int(os.environ.get('KERNEL_POOL_MAX_MEMORY_MB') or 0)
+    KERNEL_POOL_START_TIMEOUT = int(os.environ.get('KERNEL_POOL_START_TIMEOUT') or 60)
+
+    # kernels kept per notebook that opted in to resident mode with {"papermill_api": {"resident": true}}, which
+    # run the notebook's 'setup' cells once. 0 turns resident mode off. Kernels of the least recently used
+    # notebooks are shut down once more than RESIDENT_MAX_NOTEBOOKS notebooks have them.
+    RESIDENT_KERNELS = int(os.environ.get('RESIDENT_KERNELS') or 0)
+    RESIDENT_MAX_NOTEBOOKS = int(os.environ.get('RESIDENT_MAX_NOTEBOOKS') or 8)
+
+    # notebooks run with async=true at once, and how many may wait for a free worker
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 4)
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE') or 100)
+
+    # 'local' runs async jobs in the server process. 'database' adds them to a queue in the database that
+    # every 'flask worker' process drains. A worker holds a lease on each run it executes for
+    # QUEUE_LEASE_SECONDS and extends it every QUEUE_HEARTBEAT_SECONDS, runs of a worker that stopped
+    # extending its leases are run again by another worker up to QUEUE_MAX_ATTEMPTS times.
+    JOB_QUEUE = os.environ.get('JOB_QUEUE') or "local"
+    QUEUE_LEASE_SECONDS = float(os.environ.get('QUEUE_LEASE_SECONDS') or 60)
+    QUEUE_HEARTBEAT_SECONDS = float(os.environ.get('QUEUE_HEARTBEAT_SECONDS') or 15)
+    QUEUE_POLL_SECONDS = float(os.environ.get('QUEUE_POLL_SECONDS') or 1)
+    QUEUE_MAX_ATTEMPTS = int(os.environ.get('QUEUE_MAX_ATTEMPTS') or 3)
+
+    # notebooks executed at once (0 for no limit), and how many of them may belong to the same S3 user (0 for no
+    # limit). Runs past the limits wait in a queue of ADMISSION_QUEUE_SIZE for up to ADMISSION_MAX_WAIT seconds.
+    # The slots are counted per process, or shared by the processes using the same ADMISSION_DIR as lock files
+    # in it, which boot.sh sets for the gunicorn workers of an instance.
+    EXECUTION_SLOTS = int(os.environ.get('EXECUTION_SLOTS', os.cpu_count() or 4))
+    USER_EXECUTION_SLOTS = int(os.environ.get('USER_EXECUTION_SLOTS') or 0)
+    ADMISSION_DIR = os.environ.get('ADMISSION_DIR')
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE') or 50)
+    ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT') or 60)
+    # notebooks a 'flask worker' process runs at once
+    QUEUE_WORKER_CONCURRENCY = int(os.environ.get('QUEUE_WORKER_CONCURRENCY') or EXECUTION_SLOTS or 4)
+
+    # warm-up manifest of the notebooks to fetch and parse and the kernelspecs to start kernels for before a
+    # server process takes traffic, as a path to a json file or as json. /ready answers 503 until the process is
+    # warm and, when WARMUP_STATE_DIR is set, until WARMUP_PROCESSES processes of the host are.
+    WARMUP_MANIFEST = os.environ.get('WARMUP_MANIFEST')
+    WARMUP_STATE_DIR = os.environ.get('WARMUP_STATE_DIR')
+    WARMUP_PROCESSES = int(os.environ.get('WARMUP_PROCESSES') or os.environ.get('GUNICORN_WORKERS') or 1)
+    WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT') or 300)
+
+    # on-disk cache of input notebooks read from S3. Entries younger than NOTEBOOK_CACHE_MAX_AGE seconds
+    # are used without asking S3, older ones are revalidated against the notebook's ETag.
+    NOTEBOOK_CACHE = strtobool(os.environ.get('NOTEBOOK_CACHE') or "true")
+    NOTEBOOK_CACHE_DIR = os.environ.get('NOTEBOOK_CACHE_DIR') or \
+        os.path.join(tempfile.gettempdir(), 'papermill-api-notebooks')
+    NOTEBOOK_CACHE_MAX_MB = int(os.environ.get('NOTEBOOK_CACHE_MAX_MB') or 512)
+    NOTEBOOK_CACHE_MAX_AGE = int(os.environ.get('NOTEBOOK_CACHE_MAX_AGE') or 0)
+    # parsed input notebooks kept in memory by each server process. 0 parses the notebook on every run.
+    PARSED_NOTEBOOK_CACHE_MAX_MB = int(os.environ.get('PARSED_NOTEBOOK_CACHE_MAX_MB') or 256)
+
+    # seconds a server process trusts its cached templates before checking the template version again
+    TEMPLATE_VERSION_CHECK_INTERVAL = float(os.environ.get('TEMPLATE_VERSION_CHECK_INTERVAL') or 0)
+    TEMPLATE_CACHE_MAX_COMPILED = int(os.environ.get('TEMPLATE_CACHE_MAX_COMPILED') or 256)
+    # most templates returned by one page of the template listing
+    TEMPLATE_PAGE_MAX = int(os.environ.get('TEMPLATE_PAGE_MAX') or 1000)
+    # most templates created or updated by one request to /template/bulk
+    TEMPLATE_BULK_MAX_ITEMS = int(os.environ.get('TEMPLATE_BULK_MAX_ITEMS') or 10000)
+
+    # scraps are taken from the executed notebook in memory. This also reads the written output notebook
+    # back and checks its scraps match, at the cost of downloading it again when it is on S3.
+    VERIFY_SCRAPS = strtobool(os.environ.get('VERIFY_SCRAPS') or "false")
+
+    # run responses larger than this are encoded and sent in chunks of RESPONSE_CHUNK_KB
+    RESPONSE_STREAM_THRESHOLD_MB = int(os.environ.get('RESPONSE_STREAM_THRESHOLD_MB') or 4)
+    RESPONSE_CHUNK_KB = int(os.environ.get('RESPONSE_CHUNK_KB') or 64)
+
+    # default for the persist run option: write the output notebook 'always', only on 'errors', or 'none'
+    PERSIST = os.environ.get('PERSIST') or "always"
+
+    # default for the persistAsync run option, which responds before the output notebook is written.
+    # writes go through a queue of OUTPUT_WRITER_QUEUE_SIZE notebooks drained by OUTPUT_WRITER_THREADS threads
+    PERSIST_ASYNC = strtobool(os.environ.get('PERSIST_ASYNC') or "false")
+    OUTPUT_WRITER_THREADS = int(os.environ.get('OUTPUT_WRITER_THREADS') or 2)
+    OUTPUT_WRITER_QUEUE_SIZE = int(os.environ.get('OUTPUT_WRITER_QUEUE_SIZE') or 50)
+    OUTPUT_WRITER_RETRIES = int(os.environ.get('OUTPUT_WRITER_RETRIES') or 3)
+    OUTPUT_WRITER_DRAIN_TIMEOUT = int(os.environ.get('OUTPUT_WRITER_DRAIN_TIMEOUT') or 30)
+    OUTPUT_MULTIPART_THRESHOLD_MB = int(os.environ.get('OUTPUT_MULTIPART_THRESHOLD_MB') or 8)
+
+    # seconds results are reused for when a run asks for 'cache=true', and how many results are kept
+    RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL') or 300)
+    RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES') or 10000)
+
+    # runs with the same notebook and parameters arriving while one of them executes wait for it and share its
+    # scraps, when they ask for 'coalesce=true' or COALESCE is on. Followers give up after COALESCE_MAX_WAIT
+    # seconds. The lock and result files in COALESCE_DIR are shared by the processes of the host and removed
+    # after COALESCE_MAX_AGE seconds.
+    COALESCE = strtobool(os.environ.get('COALESCE') or "false")
+    COALESCE_DIR = os.environ.get('COALESCE_DIR') or os.path.join(tempfile.gettempdir(), 'papermill-api-coalesce')
+    COALESCE_MAX_WAIT = float(os.environ.get('COALESCE_MAX_WAIT') or 300)
+    COALESCE_MAX_AGE = int(os.environ.get('COALESCE_MAX_AGE') or 3600)
+
+    # worker processes running the parameter sets of a /run/batch request, and the most sets a batch may have
+    BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES') or 4)
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS') or 1000)
+
+    # slowest cells listed in the profile of a run with returnProfile=true
+    PROFILE_TOP_CELLS = int(os.environ.get('PROFILE_TOP_CELLS') or 5)
+
+    # seconds between keepalive comments of a streamed run when no cell finished in the meantime
+    STREAM_KEEPALIVE = float(os.environ.get('STREAM_KEEPALIVE') or 15)
+
     @staticmethod
     def init_app(app):
         pass
@@ -19,6 +142,8 @@ class DevelopmentConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
+    # slots are shared by the tests of one run only
+    ADMISSION_DIR = tempfile.mkdtemp(prefix='papermill-api-admission-')
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
 
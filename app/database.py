@@ -0,0 +1,53 @@
+import flask_sqlalchemy
+from sqlalchemy import event
+
+
+# pragmas run on every new SQLite connection. In WAL mode readers do not block the writer and the
+# writer does not block readers, so runs reading templates go on while templates change.
+def sqlite_pragmas(config):
+    pragmas = ["PRAGMA busy_timeout = {}".format(int(config["SQLITE_BUSY_TIMEOUT"] * 1000))]
+    if config["SQLITE_JOURNAL_MODE"]:
+        pragmas.append("PRAGMA journal_mode = {}".format(config["SQLITE_JOURNAL_MODE"]))
+    if config["SQLITE_SYNCHRONOUS"]:
+        pragmas.append("PRAGMA synchronous = {}".format(config["SQLITE_SYNCHRONOUS"]))
+
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return connect
+
+
+# Flask-SQLAlchemy with the engine settings of the config. Server databases like Postgres given as
+# DATABASE_URL get a connection pool of DATABASE_POOL_SIZE connections that are checked before use,
+# SQLite connections wait for locks held by other gunicorn workers and run the SQLite pragmas.
+# SQLALCHEMY_ENGINE_OPTIONS still has the final say.
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+
+    # Flask-SQLAlchemy 2.5 returns the url and options it changed, 2.4 changes options in place and returns None
+    def apply_driver_hacks(self, app, sa_url, options):
+        changed = super().apply_driver_hacks(app, sa_url, options)
+        if changed is not None:
+            sa_url, options = changed
+        config = app.config
+
+        if sa_url.drivername.startswith("sqlite"):
+            options.setdefault("connect_args", {})["timeout"] = config["SQLITE_BUSY_TIMEOUT"]
+            options["sqlite_pragmas"] = sqlite_pragmas(config)
+        else:
+            options.update(pool_size=config["DATABASE_POOL_SIZE"],
+                           max_overflow=config["DATABASE_MAX_OVERFLOW"],
+                           pool_timeout=config["DATABASE_POOL_TIMEOUT"],
+                           pool_recycle=config["DATABASE_POOL_RECYCLE"],
+                           pool_pre_ping=config["DATABASE_POOL_PRE_PING"])
+
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop("sqlite_pragmas", None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas is not None:
+            event.listen(engine, "connect", pragmas)
+        return engine
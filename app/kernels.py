@@ -0,0 +1,310 @@
+import atexit
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from jupyter_client import KernelManager
+from papermill.engines import papermill_engines
+from .progress import ObservedEngine, kernel_rss
+
+logger = logging.getLogger(__name__)
+
+# code run in a returned kernel to clear the user namespace before it is leased again
+RESET_CODE = "get_ipython().run_line_magic('reset', '-f')"
+
+
+# kernel manager that remembers the clients handed out so they can be closed when the
+# kernel goes back to the pool. nbconvert does not stop the channels of kernels it did not start.
+class PooledKernelManager(KernelManager):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.uses = 0
+        self.clients = []
+
+    def client(self, **kwargs):
+        kc = super().client(**kwargs)
+        self.clients.append(kc)
+        return kc
+
+    def stop_clients(self):
+        for kc in self.clients:
+            kc.stop_channels()
+        self.clients = []
+
+    def memory_mb(self):
+        return (kernel_rss(self) or 0) / (1024 * 1024)
+
+
+# pre-started kernels for one kernelspec. Kernels are leased to a single execution, then
+# either reset and returned to the idle queue or recycled. Leased kernels count toward the size of
+# the pool, so a kernel is only started in their place once one is retired. Starting, resetting and
+# shutting down kernels is done by a background thread so none of it is paid for by a request.
+class KernelPool:
+
+    def __init__(self, kernel_name, size, max_uses, max_memory_mb, start_timeout):
+        self.kernel_name = kernel_name
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.start_timeout = start_timeout
+
+        self.idle = deque()
+        self.returned = deque()
+        self.retired = deque()
+        self.leased = 0
+        self.starting = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self._maintain, name="kernel-pool-" + kernel_name, daemon=True)
+        self.thread.start()
+
+    def acquire(self):
+        with self.condition:
+            km = self.idle.popleft() if self.idle else None
+            self.leased += 1
+
+        if km is not None and not km.is_alive():
+            self._retire(km)
+            km = None
+
+        # pool is empty, start a kernel for this execution rather than wait for the refill
+        if km is None:
+            try:
+                km = self._start_kernel()
+            except:
+                with self.condition:
+                    self.leased -= 1
+                    self.condition.notify_all()
+                raise
+
+        km.uses += 1
+        return km
+
+    def release(self, km, healthy=True):
+        km.stop_clients()
+
+        retire = not healthy or (self.max_uses and km.uses >= self.max_uses) or \
+            (self.max_memory_mb and km.memory_mb() > self.max_memory_mb)
+
+        with self.condition:
+            self.leased -= 1
+            if retire:
+                self.retired.append(km)
+            else:
+                self.returned.append(km)
+            self.condition.notify_all()
+
+    def shutdown(self):
+        with self.condition:
+            self.closed = True
+            kernels = list(self.idle) + list(self.returned) + list(self.retired)
+            self.idle.clear()
+            self.returned.clear()
+            self.retired.clear()
+            self.condition.notify_all()
+
+        for km in kernels:
+            self._shutdown_kernel(km)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "kernel_name": self.kernel_name,
+                "size": self.size,
+                "idle": len(self.idle),
+                "leased": self.leased,
+                "resetting": len(self.returned),
+                "starting": self.starting,
+            }
+
+    def _retire(self, km):
+        with self.condition:
+            self.retired.append(km)
+            self.condition.notify_all()
+
+    def _start_kernel(self):
+        km = PooledKernelManager(kernel_name=self.kernel_name)
+        km.start_kernel()
+        kc = km.client()
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=self.start_timeout)
+        except RuntimeError:
+            km.stop_clients()
+            km.shutdown_kernel(now=True)
+            raise
+        km.stop_clients()
+        return km
+
+    def _reset_kernel(self, km):
+        if km.kernel_spec.language != "python":
+            return False
+
+        kc = km.client()
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=self.start_timeout)
+            reply = kc.execute_interactive(RESET_CODE, store_history=False, timeout=self.start_timeout)
+            return reply["content"]["status"] == "ok"
+        except Exception:
+            logger.exception("Failed resetting kernel for %s", self.kernel_name)
+            return False
+        finally:
+            km.stop_clients()
+
+    def _shutdown_kernel(self, km):
+        try:
+            km.shutdown_kernel(now=True)
+        except Exception:
+            logger.exception("Failed shutting down kernel for %s", self.kernel_name)
+
+    # kernels of the pool whether idle, leased, resetting or starting
+    def _kernels(self):
+        return len(self.idle) + self.leased + len(self.returned) + self.starting
+
+    def _needs_work(self):
+        if self.closed:
+            return True
+        return self.returned or self.retired or self._kernels() < self.size
+
+    def _maintain(self):
+        while True:
+            with self.condition:
+                while not self._needs_work():
+                    self.condition.wait()
+
+                if self.closed:
+                    return
+
+                retired = self.retired.popleft() if self.retired else None
+                returned = self.returned.popleft() if self.returned and retired is None else None
+                start = retired is None and returned is None
+                if start:
+                    self.starting += 1
+
+            if retired is not None:
+                self._shutdown_kernel(retired)
+            elif returned is not None:
+                # kernels started for a request while the pool was empty can overfill it
+                with self.condition:
+                    full = self._kernels() >= self.size
+                if not full and self._reset_kernel(returned):
+                    with self.condition:
+                        self.idle.append(returned)
+                else:
+                    self._shutdown_kernel(returned)
+            else:
+                try:
+                    km = self._start_kernel()
+                except Exception:
+                    logger.exception("Failed starting kernel for %s", self.kernel_name)
+                    km = None
+
+                with self.condition:
+                    self.starting -= 1
+                    if km is not None:
+                        self.idle.append(km)
+
+                if km is None:
+                    # back off before trying again so a broken kernelspec does not spin
+                    with self.condition:
+                        self.condition.wait(self.start_timeout)
+
+
+# one KernelPool per kernelspec, created on first use. Registered with papermill as the
+# 'pooled' engine when KERNEL_POOL_SIZE is greater than zero.
+class KernelPools:
+
+    def __init__(self, app=None):
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.size = 0
+        self.max_uses = 0
+        self.max_memory_mb = 0
+        self.start_timeout = 60
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config.get("KERNEL_POOL_SIZE", 0),
+                       app.config.get("KERNEL_POOL_MAX_USES", 20),
+                       app.config.get("KERNEL_POOL_MAX_MEMORY_MB", 0),
+                       app.config.get("KERNEL_POOL_START_TIMEOUT", 60))
+
+    # used directly by processes that run notebooks without an app, like batch workers
+    def configure(self, size, max_uses, max_memory_mb, start_timeout):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.start_timeout = start_timeout
+
+        PooledEngine.pools = self
+        papermill_engines.register("pooled", PooledEngine)
+
+    def settings(self):
+        return {
+            "size": self.size,
+            "max_uses": self.max_uses,
+            "max_memory_mb": self.max_memory_mb,
+            "start_timeout": self.start_timeout,
+        }
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    # engine name to hand to pm.execute_notebook
+    @property
+    def engine_name(self):
+        return "pooled" if self.enabled else None
+
+    def get_pool(self, kernel_name):
+        with self.lock:
+            pool = self.pools.get(kernel_name)
+            if pool is None:
+                if not self.pools:
+                    atexit.register(self.shutdown)
+                pool = KernelPool(kernel_name, self.size, self.max_uses, self.max_memory_mb, self.start_timeout)
+                self.pools[kernel_name] = pool
+            return pool
+
+    @contextmanager
+    def lease(self, kernel_name):
+        pool = self.get_pool(kernel_name)
+        km = pool.acquire()
+        try:
+            yield km
+        except BaseException:
+            # a failed or interrupted execution may leave the kernel busy, do not reuse it
+            pool.release(km, healthy=False)
+            raise
+        else:
+            pool.release(km)
+
+    def stats(self):
+        with self.lock:
+            pools = list(self.pools.values())
+        return [pool.stats() for pool in pools]
+
+    def shutdown(self):
+        with self.lock:
+            pools = list(self.pools.values())
+            self.pools = {}
+        for pool in pools:
+            pool.shutdown()
+
+
+# papermill engine executing notebooks on a kernel leased from the pool
+class PooledEngine(ObservedEngine):
+
+    pools = None
+
+    @classmethod
+    def execute_managed_notebook(cls, nb_man, kernel_name, **kwargs):
+        preprocessor, resources = cls.preprocessor(kernel_name, **kwargs)
+
+        with cls.pools.lease(kernel_name) as km:
+            preprocessor.preprocess(nb_man, resources, km=km)
@@ -0,0 +1,220 @@
+import bisect
+import fcntl
+import hashlib
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+from .errors import InvalidUsage
+
+# seconds between checks of a waiting run on the slots other processes of the host may have freed
+POLL_INTERVAL = 0.05
+
+
+# a request waiting for an execution slot
+class Waiter:
+
+    def __init__(self, user, priority, seq):
+        self.user = user
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+
+    # higher priorities first, then in the order they arrived
+    def __lt__(self, other):
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+# the first of count lock files named prefix-<n>.lock in directory that is free, locked, or None if all
+# of them are held. A lock is released by closing the file, also when the process holding it dies.
+def lock_one(directory, prefix, count):
+    for n in range(count):
+        f = open(os.path.join(directory, "{}-{}.lock".format(prefix, n)), "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+        else:
+            return f
+    return None
+
+
+# limits how many notebooks the server processes of a host execute at once. Every run takes one of
+# EXECUTION_SLOTS slots, and at most USER_EXECUTION_SLOTS of them for the same S3 user. Runs that cannot
+# start wait in a priority queue of at most ADMISSION_QUEUE_SIZE entries for up to ADMISSION_MAX_WAIT seconds.
+# A full queue is answered with 429 and a timed out wait with 503, both with a Retry-After estimate.
+# A slot is held as a lock on a file in ADMISSION_DIR, like the locks of app.main.coalesce, so the limits
+# hold across every gunicorn worker of the host. Without ADMISSION_DIR they are counted per process.
+# The queue, its priorities and the counters are kept per process.
+class AdmissionController:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = 0
+        self.running_by_user = {}
+        # lock files of the slots this process holds, by user
+        self.held = {}
+        self.waiters = []
+        self.seq = itertools.count()
+        self.average_run = None
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "timedOut": 0,
+                         "waitSeconds": 0.0, "maxWaitSeconds": 0.0}
+
+    # 'priority' and 'maxWait' options of a run
+    def options(self, args):
+        try:
+            priority = int(args.get("priority") or 0)
+            max_wait = float(args.get("maxWait") or current_app.config["ADMISSION_MAX_WAIT"])
+        except ValueError:
+            raise InvalidUsage("'priority' and 'maxWait' must be numbers")
+        return priority, min(max_wait, current_app.config["ADMISSION_MAX_WAIT"])
+
+    # waits for a slot, max_wait of None waits as long as it takes and is not limited by the queue size
+    def acquire(self, user=None, priority=0, max_wait=None):
+        config = current_app.config
+        slots = config["EXECUTION_SLOTS"]
+        user_slots = config["USER_EXECUTION_SLOTS"]
+        directory = config["ADMISSION_DIR"]
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.condition:
+            if not self.waiters and self._start(user, slots, user_slots, directory):
+                return
+
+            if max_wait is not None and len(self.waiters) >= config["ADMISSION_QUEUE_SIZE"]:
+                self.counters["rejected"] += 1
+                raise self._overloaded("Too many runs waiting for an execution slot", 429, slots)
+
+            waiter = Waiter(user, priority, next(self.seq))
+            bisect.insort(self.waiters, waiter)
+            self.counters["queued"] += 1
+            queued_at = time.time()
+            deadline = queued_at + max_wait if max_wait is not None else None
+
+            while not waiter.granted:
+                self._dispatch(slots, user_slots, directory)
+                if waiter.granted:
+                    break
+
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self.waiters.remove(waiter)
+                    self.counters["timedOut"] += 1
+                    raise self._overloaded("Timed out waiting for an execution slot", 503, slots)
+
+                # other processes do not notify this one when they release a slot
+                if directory:
+                    remaining = min(remaining, POLL_INTERVAL) if remaining is not None else POLL_INTERVAL
+                self.condition.wait(remaining)
+
+            self._record_wait(time.time() - queued_at)
+
+    def release(self, user=None, duration=None):
+        with self.condition:
+            for f in self.held[user].pop():
+                f.close()
+            if not self.held[user]:
+                del self.held[user]
+
+            self.running -= 1
+            if user is not None:
+                self.running_by_user[user] -= 1
+                if not self.running_by_user[user]:
+                    del self.running_by_user[user]
+
+            if duration is not None:
+                self.average_run = duration if self.average_run is None else 0.8 * self.average_run + 0.2 * duration
+
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, user=None, priority=0, max_wait=None):
+        self.acquire(user, priority, max_wait)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.release(user, time.time() - started)
+
+    def stats(self):
+        config = current_app.config
+        with self.condition:
+            stats = dict(self.counters)
+            stats.update({"running": self.running, "waiting": len(self.waiters),
+                          "runningByUser": dict(self.running_by_user),
+                          "averageRunSeconds": self.average_run,
+                          "slots": config["EXECUTION_SLOTS"], "userSlots": config["USER_EXECUTION_SLOTS"],
+                          "queueSize": config["ADMISSION_QUEUE_SIZE"]})
+        stats["averageWaitSeconds"] = stats["waitSeconds"] / max(stats["queued"], 1)
+        return stats
+
+    def _can_run(self, user, slots, user_slots):
+        if slots and self.running >= slots:
+            return False
+        if user is not None and user_slots and self.running_by_user.get(user, 0) >= user_slots:
+            return False
+        return True
+
+    # takes a slot for the user if one is free in this process and, with a directory, on the host
+    def _start(self, user, slots, user_slots, directory):
+        if not self._can_run(user, slots, user_slots):
+            return False
+
+        locks = []
+        if directory and slots:
+            locks.append(lock_one(directory, "slot", slots))
+        if directory and user is not None and user_slots and None not in locks:
+            locks.append(lock_one(directory, "user-" + hashlib.sha256(user.encode()).hexdigest()[:16], user_slots))
+        if None in locks:
+            for f in locks:
+                if f is not None:
+                    f.close()
+            return False
+
+        self.held.setdefault(user, []).append(locks)
+        self.running += 1
+        if user is not None:
+            self.running_by_user[user] = self.running_by_user.get(user, 0) + 1
+        self.counters["admitted"] += 1
+        return True
+
+    # hands free slots to waiters in priority order, skipping those whose user is at its limit
+    def _dispatch(self, slots, user_slots, directory):
+        for waiter in list(self.waiters):
+            if slots and self.running >= slots:
+                break
+            if self._start(waiter.user, slots, user_slots, directory):
+                self.waiters.remove(waiter)
+                waiter.granted = True
+                self.condition.notify_all()
+            elif directory and slots and self._host_full(directory, slots):
+                break
+
+    # whether every slot of the host is taken, so no waiter can start whatever its user
+    def _host_full(self, directory, slots):
+        f = lock_one(directory, "slot", slots)
+        if f is None:
+            return True
+        f.close()
+        return False
+
+    def _record_wait(self, waited):
+        self.counters["waitSeconds"] += waited
+        self.counters["maxWaitSeconds"] = max(self.counters["maxWaitSeconds"], waited)
+
+    # seconds until a slot is likely free, from the average run time and the runs ahead
+    def _retry_after(self, slots):
+        average = self.average_run or 1
+        return max(1, int(math.ceil(average * (len(self.waiters) + 1) / (slots or 1))))
+
+    def _overloaded(self, message, status_code, slots):
+        retry_after = self._retry_after(slots)
+        return InvalidUsage(message, status_code=status_code, payload={"retryAfter": retry_after},
+                            headers={"Retry-After": str(retry_after)})
+
+
+admission = AdmissionController()
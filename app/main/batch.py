@@ -0,0 +1,143 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import scrapbook as sb
+from papermill.exceptions import PapermillExecutionError
+from .. import kernel_pools
+from app.notebook_cache import copy_notebook
+from .errors import InvalidUsage
+from . import runner
+
+# notebook loaded by the parent, set in each worker process by init_worker
+worker_notebook = None
+
+
+# parameter sets of a batch, either given as a list or as the cartesian product of a grid like
+# {"a": [1, 2], "b": ["x", "y"]}
+def parameter_sets(data, max_items):
+
+    if "parameters" in data and "grid" in data:
+        raise InvalidUsage("either 'parameters' or 'grid' is supported not both")
+
+    if "grid" in data:
+        grid = data["grid"]
+        if not isinstance(grid, dict) or not all(isinstance(values, list) for values in grid.values()):
+            raise InvalidUsage("'grid' must map parameter names to lists of values")
+        names = list(grid)
+        sets = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    else:
+        sets = data.get("parameters", None)
+        if not isinstance(sets, list) or not all(isinstance(each, dict) for each in sets):
+            raise InvalidUsage("'parameters' must be a list of parameter objects")
+
+    if len(sets) > max_items:
+        raise InvalidUsage("a batch is limited to {} parameter sets".format(max_items))
+
+    return sets
+
+
+def init_worker(nb, pool_settings):
+    global worker_notebook
+    worker_notebook = nb
+
+    # a worker runs its share of the batch one after another, so one warm kernel is enough
+    if pool_settings["size"] > 0:
+        pool_settings = dict(pool_settings, size=1)
+    kernel_pools.configure(**pool_settings)
+
+
+def run_item(index, in_notebook, outfile, parameters):
+
+    started = time.time()
+    item = {"index": index, "parameters": parameters, "outNotebook": outfile}
+
+    try:
+        result = runner.execute_loaded(copy_notebook(worker_notebook), in_notebook, outfile, parameters,
+                                       progress_bar=False)
+    except PapermillExecutionError as error:
+        item.update({"state": "failed", "error": {"ename": error.ename, "evalue": error.evalue}})
+    except Exception as error:
+        item.update({"state": "failed", "error": {"ename": type(error).__name__, "evalue": str(error)}})
+    else:
+        item.update({"state": "succeeded", "result": sb.read_notebook(result).scraps.data_dict})
+
+    item["duration"] = time.time() - started
+
+    return item
+
+
+# runs the parameter sets on a pool of processes and yields one json line per set as it completes.
+# the notebook is loaded once here and handed to each worker process when it starts. Each set executes in
+# an execution slot: the caller took the slot of the first set, acquire waits for the slot of each of the
+# others before it is handed to a worker, and release is called with the duration of a set once it is over.
+def run_batch(in_notebook, out_path, out_notebook_name, sets, processes, acquire=None, release=None):
+
+    nb = runner.load_notebook(in_notebook)
+
+    if "s3://" not in out_path:
+        os.makedirs(out_path, mode=0o777, exist_ok=True)
+
+    name, extension = os.path.splitext(out_notebook_name)
+
+    # spawned rather than forked, the server process may be running threads
+    executor = ProcessPoolExecutor(max_workers=min(processes, len(sets)) or 1,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker,
+                                   initargs=(nb, kernel_pools.settings()))
+
+    futures = {}
+    pending = set()
+
+    # the slot of the set is given back once its future is done, also when it is cancelled
+    def submit(index):
+        outfile = os.path.join(out_path, "{}_{}{}".format(name, index, extension))
+        started = time.time()
+        future = executor.submit(run_item, index, in_notebook, outfile, sets[index])
+        if release is not None:
+            future.add_done_callback(lambda done: release(time.time() - started))
+        futures[future] = index
+        pending.add(future)
+
+    def lines(done):
+        for future in done:
+            pending.discard(future)
+            try:
+                item = future.result()
+            except Exception as error:
+                # the worker process itself failed
+                item = {"index": futures[future], "state": "failed",
+                        "error": {"ename": type(error).__name__, "evalue": str(error)}}
+            yield json.dumps(item, default=str) + "\n"
+
+    # the first set runs in the slot the caller holds, even if the response is never read
+    if sets:
+        submit(0)
+
+    def generate():
+        completed = False
+        try:
+            for index in range(1, len(sets)):
+                yield from lines([future for future in pending if future.done()])
+                if acquire is not None:
+                    acquire()
+                try:
+                    submit(index)
+                except:
+                    if release is not None:
+                        release(None)
+                    raise
+
+            yield from lines(as_completed(list(pending)))
+
+            completed = True
+        finally:
+            # also reached when the client goes away, so queued items are not run for nobody
+            if not completed:
+                for future in futures:
+                    future.cancel()
+            executor.shutdown(wait=completed)
+
+    return generate()
@@ -0,0 +1,149 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from flask import current_app
+from .errors import InvalidUsage
+from .result_cache import canonical_parameters
+
+# seconds between checks of a follower on the run it waits for
+POLL_INTERVAL = 0.05
+
+
+# runs of the same notebook with the same parameters that arrive while one of them executes share its
+# scraps rather than each executing the notebook. The first run, the leader, holds an exclusive lock on a
+# file named after the run in COALESCE_DIR while it executes and writes its scraps next to it before
+# letting go. The others, followers, wait for the lock and answer with those scraps. The lock is a file
+# lock so runs of every gunicorn worker on the host are coalesced. A run opts in with 'coalesce=true',
+# or every run does with COALESCE.
+class Coalescer:
+
+    def __init__(self):
+        self.counters = {"leaders": 0, "followers": 0}
+        self.lock = threading.Lock()
+        self.pruned_at = 0
+
+    def enabled(self, args):
+        requested = args.get("coalesce")
+        if requested is None:
+            return current_app.config["COALESCE"]
+        return requested.lower() in ("true", "t", "yes", "y", "on", "1")
+
+    def key(self, in_notebook, parameters):
+        if "://" not in in_notebook:
+            in_notebook = os.path.abspath(in_notebook)
+        source = "\n".join([in_notebook, canonical_parameters(parameters)])
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    # ('leader', what execute returned) when this run executed the notebook, or ('follower', scraps) when
+    # it waited for an identical run in flight. A follower whose leader failed tries to lead in turn.
+    def run(self, key, execute):
+        config = current_app.config
+        directory = config["COALESCE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        self.prune(directory, config["COALESCE_MAX_AGE"])
+
+        lock_path = os.path.join(directory, key + ".lock")
+        result_path = os.path.join(directory, key + ".json")
+        arrived = time.time()
+        deadline = arrived + config["COALESCE_MAX_WAIT"]
+
+        while True:
+            with open(lock_path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    pass
+                else:
+                    # prune removed the file after it was opened here, lock the one runs arriving now open
+                    if not same_file(lock_file, lock_path):
+                        continue
+                    self.count("leaders")
+                    os.utime(lock_path)
+                    outcome = execute()
+                    self.publish(result_path, outcome[2])
+                    return "leader", outcome
+
+                self.wait(lock_file, deadline)
+
+            scraps = self.read(result_path, arrived)
+            if scraps is not None:
+                self.count("followers")
+                return "follower", scraps
+
+    # waits for the leader to let go of the lock, which closing the file releases again
+    def wait(self, lock_file, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.time() > deadline:
+                    raise InvalidUsage("Timed out waiting for an identical run in flight", status_code=504)
+                time.sleep(POLL_INTERVAL)
+
+    def publish(self, result_path, scraps):
+        temporary = "{}.{}.{}".format(result_path, os.getpid(), threading.get_ident())
+        with open(temporary, "w") as f:
+            json.dump({"finished": time.time(), "scraps": scraps}, f, default=str)
+        os.replace(temporary, result_path)
+
+    # scraps the leader published after the follower arrived, None if the leader failed
+    def read(self, result_path, arrived):
+        try:
+            with open(result_path) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return published["scraps"] if published["finished"] >= arrived else None
+
+    # removes the files of runs older than max_age seconds, at most once a minute per process. Lock files
+    # still held by a run, like a leader executing for longer than max_age, are left alone.
+    def prune(self, directory, max_age):
+        now = time.time()
+        with self.lock:
+            if now - self.pruned_at < 60:
+                return
+            self.pruned_at = now
+
+        for entry in os.scandir(directory):
+            try:
+                if entry.stat().st_mtime >= now - max_age:
+                    continue
+                if entry.name.endswith(".lock"):
+                    self.remove_lock(entry.path)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    # removes the lock file while holding it, unless a leader or a waiting follower holds it
+    def remove_lock(self, lock_path):
+        with open(lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            if same_file(lock_file, lock_path):
+                os.remove(lock_path)
+
+    def count(self, role):
+        with self.lock:
+            self.counters[role] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+# whether the open file is still the one at path
+def same_file(f, path):
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+coalescer = Coalescer()
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from .. import db as sadb
+from app.metrics import metrics
+from .jobs import complete_job, fail_job, new_job
+from . import runner
+
+logger = logging.getLogger(__name__)
+
+# a notebook reaches its respond point once it glues this scrap with a value other than false or null,
+# or once a cell with this tag completes
+RESPOND_SCRAP = "response_ready"
+RESPOND_TAG = "respond"
+
+
+# whether the run answers at the notebook's respond point. A run opts in with 'respondEarly=true', or the
+# notebook opts in all of its runs with {"papermill_api": {"respond_early": true}} in its metadata.
+# metadata is the notebook's runner.InputNotebook.api_metadata, only called when the run does not say.
+def enabled(metadata, args):
+    requested = args.get("respondEarly")
+    if requested is not None:
+        return requested.lower() in ("true", "t", "yes", "y", "on", "1")
+
+    return bool(metadata().get("respond_early", False))
+
+
+# the Job the run of the notebook reports to once the response is sent, as a dictionary
+def start_job(in_notebook, parameters):
+    job = new_job(in_notebook, parameters)
+    job.state = "running"
+    job.started_at = datetime.utcnow()
+    sadb.session.add(job)
+    sadb.session.commit()
+    return job.as_dict()
+
+
+# runs the notebook on its own thread and waits until it reaches its respond point or is over. Returns
+# (True, scraps glued so far) at the respond point, the run goes on in the background and records how it
+# ended in the Job. Otherwise returns (False, what runner.execute returned) or raises what it raised.
+# release is called with the duration of the run once it is over, observer is told about every event.
+# source is the runner.InputNotebook the run read its metadata from, so the notebook is not loaded again.
+def run(app, job_id, in_notebook, out_path, out_notebook_name, parameters, persist="always", release=None,
+        observer=None, source=None):
+
+    scraps = {}
+    outcome = {}
+    wake = threading.Event()
+    lock = threading.Lock()
+    # scraps of a cell are reported after the cell, so a tagged cell responds when the next one starts
+    tagged = []
+
+    def observe(event, data):
+        if observer is not None:
+            observer(event, data)
+
+        if event == "scrap":
+            with lock:
+                scraps[data["name"]] = data["data"]
+            if data["name"] == RESPOND_SCRAP and data["data"] not in (False, None):
+                wake.set()
+        elif event == "cell_complete" and RESPOND_TAG in data.get("tags", []):
+            tagged.append(data["cell"])
+        elif event == "cell_start" and tagged:
+            wake.set()
+
+    labels = metrics.labels()
+
+    def work():
+        started = time.time()
+        try:
+            with app.app_context(), metrics.run_labels(*labels):
+                try:
+                    result = runner.execute(in_notebook, out_path, out_notebook_name, parameters,
+                                            observer=observe, persist=persist, source=source)
+                except Exception as error:
+                    outcome["error"] = error
+                    fail_job(job_id, error)
+                else:
+                    outcome["result"] = result
+                    complete_job(job_id, result[0], result[2], persist)
+        except Exception:
+            logger.exception("Failed recording the end of job %s", job_id)
+        finally:
+            if release is not None:
+                release(time.time() - started)
+            outcome["done"] = True
+            wake.set()
+
+    threading.Thread(target=work, name="early-response", daemon=True).start()
+    wake.wait()
+
+    if not outcome.get("done"):
+        with lock:
+            return True, dict(scraps)
+    if "error" in outcome:
+        raise outcome["error"]
+    if "result" not in outcome:
+        raise RuntimeError("The run of job {} could not be recorded".format(job_id))
+    return False, outcome["result"]
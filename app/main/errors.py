@@ -3,9 +3,10 @@
 class InvalidUsage(Exception):
     status_code = 400
 
-    def __init__(self, message, status_code=None, payload=None):
+    def __init__(self, message, status_code=None, payload=None, headers=None):
         Exception.__init__(self)
         self.message = message
+        self.headers = headers or {}
 
         if status_code is not None:
                self.status_code = status_code
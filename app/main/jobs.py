@@ -0,0 +1,150 @@
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from botocore.exceptions import ClientError, ParamValidationError
+from .. import db as sadb
+from app.metrics import metrics
+from app.models import Job, QueuedRun
+from .admission import admission
+from .errors import InvalidUsage
+from . import runner
+
+logger = logging.getLogger(__name__)
+
+
+# runs notebooks submitted with 'async=true' on a bounded pool of threads so the HTTP worker
+# can answer right away, or adds them to the shared execution queue when JOB_QUEUE is 'database'.
+# Job state is kept in the Job table and can be polled at /jobs/<id>
+class JobRunner:
+
+    def __init__(self):
+        self.executor = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    # source is the runner.InputNotebook of the run, only reused when the job runs in this process
+    def submit(self, app, paths_dict, out_path, parameters, persist="always", priority=0, source=None):
+
+        # with the database queue any worker process, on any host, may run the job, see app.main.work_queue
+        if app.config["JOB_QUEUE"] == "database":
+            return enqueue(app, paths_dict, out_path, parameters, persist, priority)
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=app.config["JOB_WORKERS"],
+                                                   thread_name_prefix="job")
+
+            if self.pending >= app.config["JOB_QUEUE_SIZE"]:
+                raise InvalidUsage("Job queue is full", status_code=503)
+            self.pending += 1
+
+        try:
+            job = new_job(paths_dict["in_notebook"], parameters)
+            sadb.session.add(job)
+            sadb.session.commit()
+
+            self.executor.submit(self._run, app, job.id, paths_dict["in_notebook"], out_path,
+                                 paths_dict["out_notebook_name"], parameters, paths_dict.get("user"),
+                                 metrics.labels(), persist, source)
+        except:
+            with self.lock:
+                self.pending -= 1
+            raise
+
+        return job
+
+    def _run(self, app, job_id, in_notebook, out_path, out_notebook_name, parameters, user=None, labels=("", ""),
+             persist="always", source=None):
+        try:
+            with app.app_context(), metrics.run_labels(*labels):
+                # jobs were already admitted to the job queue so they wait for a slot as long as it takes
+                with admission.slot(user):
+                    run_job(job_id, in_notebook, out_path, out_notebook_name, parameters, persist, source)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+
+def new_job(in_notebook, parameters):
+    return Job(id=uuid.uuid4().hex,
+               state="queued",
+               in_notebook=in_notebook,
+               parameters=json.dumps(parameters),
+               submitted_at=datetime.utcnow())
+
+
+# adds the job and its run to the shared execution queue in one transaction
+def enqueue(app, paths_dict, out_path, parameters, persist="always", priority=0):
+
+    if QueuedRun.query.filter_by(state="queued").count() >= app.config["JOB_QUEUE_SIZE"]:
+        raise InvalidUsage("Job queue is full", status_code=503)
+
+    job = new_job(paths_dict["in_notebook"], parameters)
+    sadb.session.add(job)
+    sadb.session.add(QueuedRun(id=job.id,
+                               state="queued",
+                               priority=priority,
+                               in_notebook=paths_dict["in_notebook"],
+                               out_path=out_path,
+                               out_notebook_name=paths_dict["out_notebook_name"],
+                               parameters=json.dumps(parameters),
+                               labels=json.dumps(metrics.labels()),
+                               persist=persist,
+                               user=paths_dict.get("user"),
+                               attempts=0,
+                               enqueued_at=datetime.utcnow()))
+    sadb.session.commit()
+
+    return job
+
+
+# executes the notebook of a job and records how it went in the Job table. Needs an app context.
+def run_job(job_id, in_notebook, out_path, out_notebook_name, parameters, persist="always", source=None):
+    try:
+        update_job(job_id, state="running", started_at=datetime.utcnow())
+        outfile, result, scraps = runner.execute(in_notebook, out_path, out_notebook_name, parameters,
+                                                 persist=persist, source=source)
+    except Exception as error:
+        fail_job(job_id, error)
+    else:
+        complete_job(job_id, outfile, scraps, persist)
+
+
+# records the run of a job as failed with the error it raised, called while handling the error
+def fail_job(job_id, error):
+    if isinstance(error, ClientError):
+        update_job(job_id, state="failed", error=json.dumps(error.response["Error"]),
+                   status_code=client_error_status(error), finished_at=datetime.utcnow())
+    elif isinstance(error, ParamValidationError):
+        error.kwargs.update({"message": "Check 'location' parameter."})
+        update_job(job_id, state="failed", error=json.dumps(error.kwargs),
+                   status_code=400, finished_at=datetime.utcnow())
+    else:
+        logger.exception("Job %s failed", job_id)
+        update_job(job_id, state="failed", error=json.dumps({"message": str(error)}),
+                   status_code=500, finished_at=datetime.utcnow())
+
+
+def complete_job(job_id, outfile, scraps, persist="always"):
+    update_job(job_id, state="succeeded", out_notebook=outfile if persist == "always" else None,
+               result=json.dumps(scraps),
+               status_code=scraps.get("statusCode", None) or 200, finished_at=datetime.utcnow())
+
+
+def update_job(job_id, **values):
+    Job.query.filter_by(id=job_id).update(values)
+    sadb.session.commit()
+
+
+# botocore error codes are usually HTTP statuses but can also be names like 'NoSuchKey'
+def client_error_status(error):
+    try:
+        return int(error.response["Error"]["Code"])
+    except (KeyError, ValueError):
+        return error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+
+
+job_runner = JobRunner()
@@ -0,0 +1,114 @@
+import atexit
+import io
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+import boto3
+import nbformat
+from boto3.s3.transfer import TransferConfig
+from papermill.iorw import write_ipynb
+from .. import db as sadb
+from app.metrics import metrics
+from app.models import OutputNotebook
+from app.notebook_cache import split_s3_path
+
+logger = logging.getLogger(__name__)
+
+
+# writes the notebook to a local path or to S3. Notebooks on S3 larger than
+# OUTPUT_MULTIPART_THRESHOLD_MB are sent as a multipart upload.
+def write_notebook(nb, path, multipart_threshold):
+    if path.startswith("s3://"):
+        bucket, key = split_s3_path(path)
+        body = io.BytesIO(nbformat.writes(nb).encode("utf-8"))
+        config = TransferConfig(multipart_threshold=multipart_threshold, multipart_chunksize=multipart_threshold)
+        boto3.client("s3").upload_fileobj(body, bucket, key, Config=config)
+    else:
+        write_ipynb(nb, path)
+
+
+# writes output notebooks on a few background threads so a run can respond before its notebook is
+# stored. Writes are recorded in the OutputNotebook table, which /outputs/<id> reports on. When the
+# queue is full the write is done by the caller instead.
+class OutputWriter:
+
+    def __init__(self):
+        self.queue = None
+        self.lock = threading.Lock()
+
+    def start(self, app):
+        with self.lock:
+            if self.queue is not None:
+                return
+
+            self.queue = queue.Queue(maxsize=app.config["OUTPUT_WRITER_QUEUE_SIZE"])
+            for index in range(app.config["OUTPUT_WRITER_THREADS"]):
+                thread = threading.Thread(target=self._work, name="output-writer-%d" % index, daemon=True)
+                thread.start()
+
+            atexit.register(self.drain, app.config["OUTPUT_WRITER_DRAIN_TIMEOUT"])
+
+    def submit(self, app, nb, path):
+        self.start(app)
+
+        record = OutputNotebook(id=uuid.uuid4().hex, path=path, state="pending", attempts=0,
+                                created_at=datetime.utcnow())
+        sadb.session.add(record)
+        sadb.session.commit()
+
+        try:
+            self.queue.put_nowait((app, record.id, nb, path, metrics.labels()))
+        except queue.Full:
+            logger.warning("Output writer queue is full, writing %s before responding", path)
+            self.write(app, record.id, nb, path)
+            sadb.session.refresh(record)
+
+        return record
+
+    def write(self, app, record_id, nb, path):
+        retries = app.config["OUTPUT_WRITER_RETRIES"]
+        threshold = app.config["OUTPUT_MULTIPART_THRESHOLD_MB"] * 1024 * 1024
+
+        for attempt in range(1, retries + 2):
+            try:
+                with metrics.phase("write_output"):
+                    write_notebook(nb, path, threshold)
+            except Exception as error:
+                logger.warning("Writing %s failed on attempt %d: %s", path, attempt, error)
+                update_output(record_id, attempts=attempt, error=str(error))
+                if attempt <= retries:
+                    time.sleep(2 ** (attempt - 1))
+            else:
+                update_output(record_id, state="written", attempts=attempt, error=None,
+                              finished_at=datetime.utcnow())
+                return
+
+        update_output(record_id, state="failed", finished_at=datetime.utcnow())
+
+    # waits up to timeout seconds for queued writes when the process exits
+    def drain(self, timeout):
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.1)
+
+    def _work(self):
+        while True:
+            app, record_id, nb, path, labels = self.queue.get()
+            try:
+                with app.app_context(), metrics.run_labels(*labels):
+                    self.write(app, record_id, nb, path)
+            except Exception:
+                logger.exception("Output writer failed on %s", path)
+            finally:
+                self.queue.task_done()
+
+
+def update_output(record_id, **values):
+    OutputNotebook.query.filter_by(id=record_id).update(values)
+    sadb.session.commit()
+
+
+output_writer = OutputWriter()
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from .. import db as sadb
+from app.models import CachedResult
+from .errors import InvalidUsage
+
+
+# parameters serialized the same way whatever order their keys were given in
+def canonical_parameters(parameters):
+    return json.dumps(parameters, sort_keys=True, separators=(",", ":"), default=str)
+
+
+# reuses the scraps of earlier runs of the same notebook contents with the same parameters.
+# A run opts in with 'cache=true' or 'cacheTtl=<seconds>', or the notebook opts in all of its runs
+# with {"papermill_api": {"cache_ttl": <seconds>}} in its metadata. Results are kept in the
+# CachedResult table so every server process shares them.
+class ResultCache:
+
+    def __init__(self):
+        self.counters = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    # seconds to keep the result of this run for, or 0 if it should not be cached. metadata is the notebook's
+    # runner.InputNotebook.api_metadata, only called when the run leaves caching to the notebook.
+    def ttl(self, metadata, args):
+        requested = args.get("cache")
+        if requested is not None and requested.lower() in ("false", "f", "no", "n", "off", "0"):
+            return 0
+
+        if args.get("cacheTtl"):
+            try:
+                return int(args["cacheTtl"])
+            except ValueError:
+                raise InvalidUsage("'cacheTtl' must be a number of seconds")
+        if requested is not None:
+            return current_app.config["RESULT_CACHE_TTL"]
+
+        return int(metadata().get("cache_ttl", 0))
+
+    # source is the runner.InputNotebook of the run
+    def key(self, source, parameters):
+        version = source.version()
+        text = "\n".join([source.path, version, canonical_parameters(parameters)])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key):
+        now = datetime.utcnow()
+        cached = CachedResult.query.filter(CachedResult.key == key, CachedResult.expires_at > now).first()
+
+        with self.lock:
+            self.counters["hits" if cached else "misses"] += 1
+
+        if cached:
+            cached.hits += 1
+            cached.last_used_at = now
+            sadb.session.commit()
+
+        return cached
+
+    def put(self, key, in_notebook, scraps, out_notebook, ttl):
+        now = datetime.utcnow()
+
+        sadb.session.merge(CachedResult(key=key, in_notebook=in_notebook, result=json.dumps(scraps),
+                                        out_notebook=out_notebook, hits=0, created_at=now,
+                                        expires_at=now + timedelta(seconds=ttl), last_used_at=now))
+
+        CachedResult.query.filter(CachedResult.expires_at <= now).delete(synchronize_session=False)
+
+        # least recently used results past RESULT_CACHE_MAX_ENTRIES
+        oldest = CachedResult.query.order_by(CachedResult.last_used_at.desc()) \
+            .offset(current_app.config["RESULT_CACHE_MAX_ENTRIES"]).with_entities(CachedResult.key).all()
+        if oldest:
+            CachedResult.query.filter(CachedResult.key.in_([row.key for row in oldest])) \
+                .delete(synchronize_session=False)
+
+        sadb.session.commit()
+
+    # removes the cached results of one input notebook or of all of them
+    def purge(self, in_notebook=None):
+        query = CachedResult.query
+        if in_notebook:
+            query = query.filter_by(in_notebook=in_notebook)
+        count = query.delete(synchronize_session=False)
+        sadb.session.commit()
+        return count
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["entries"] = CachedResult.query.count()
+        return stats
+
+
+result_cache = ResultCache()
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+import os
+import time
+import nbformat
+import scrapbook as sb
+from flask import current_app
+from papermill.engines import papermill_engines
+from papermill.exceptions import PapermillExecutionError
+from papermill.execute import raise_for_execution_errors
+from papermill.iorw import load_notebook_node, write_ipynb
+from papermill.parameterize import add_builtin_parameters, parameterize_path
+from papermill.translators import translate_parameters
+from .. import kernel_pools, notebook_cache, parsed_notebooks, resident_kernels
+from app.metrics import metrics
+from app.notebook_cache import split_s3_path
+from app import resident
+
+logger = logging.getLogger(__name__)
+
+# when the output notebook of a run is written: every time, only if the notebook fails, or never
+PERSIST_MODES = ("always", "errors", "none")
+
+
+# loads the input notebook, going through the S3 and parsed notebook caches when they are enabled.
+# the returned notebook is always a copy that can be changed freely.
+def load_notebook(in_notebook):
+
+    if in_notebook.startswith("s3://"):
+        if not notebook_cache.enabled:
+            with metrics.phase("fetch"):
+                return load_notebook_node(in_notebook)
+
+        # cached S3 notebooks are stored under their content hash so the path is their version
+        with metrics.phase("fetch"):
+            local_path = notebook_cache.fetch(in_notebook)
+        with metrics.phase("parse"):
+            return parsed_notebooks.load(local_path, version=local_path)
+
+    with metrics.phase("parse"):
+        return parsed_notebooks.load(in_notebook)
+
+
+# the input notebook of a run, fetched from S3 and parsed at most once for everything the run reads it
+# for: its papermill_api metadata, its version and the copy that is executed.
+class InputNotebook:
+
+    def __init__(self, path):
+        self.path = path
+        self.local_path = None
+        self.nb = None
+
+    @property
+    def cached(self):
+        return self.path.startswith("s3://") and notebook_cache.enabled
+
+    # path of the notebook in the S3 cache, validated against S3 the first time only
+    def fetch(self):
+        if self.local_path is None:
+            with metrics.phase("fetch"):
+                self.local_path = notebook_cache.fetch(self.path)
+        return self.local_path
+
+    # the run fails when its notebook cannot be read, which may be before it executes
+    def load(self):
+        if self.nb is None:
+            try:
+                if self.cached:
+                    # cached S3 notebooks are stored under their content hash so the path is their version
+                    local_path = self.fetch()
+                    with metrics.phase("parse"):
+                        self.nb = parsed_notebooks.load(local_path, version=local_path)
+                else:
+                    self.nb = load_notebook(self.path)
+            except Exception as error:
+                metrics.error(error)
+                raise
+        return self.nb
+
+    # the loaded notebook for an execution, which changes it. A second execution loads it again.
+    def take(self):
+        nb = self.load()
+        self.nb = None
+        return nb
+
+    # the {"papermill_api": {...}} metadata the notebook sets defaults for its runs with. Reading it loads the
+    # notebook, which the run executes from afterwards.
+    def api_metadata(self):
+        return self.load().metadata.get("papermill_api", {})
+
+    # identifies the contents of the notebook. Notebooks in the S3 cache are already stored under their
+    # sha256, other S3 notebooks use their ETag and local notebooks are hashed.
+    def version(self):
+        try:
+            if self.cached:
+                return os.path.splitext(os.path.basename(self.fetch()))[0]
+
+            if self.path.startswith("s3://"):
+                bucket, key = split_s3_path(self.path)
+                return notebook_cache.client.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+
+            digest = hashlib.sha256()
+            with open(self.path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        except Exception as error:
+            metrics.error(error)
+            raise
+
+
+# adds the injected-parameters cell the way papermill's parameterize_notebook does, without copying
+# the notebook again
+def parameterize(nb, parameters):
+
+    kernel_name = nb.metadata.kernelspec.name
+    language = nb.metadata.kernelspec.language
+
+    newcell = nbformat.v4.new_code_cell(source=translate_parameters(kernel_name, language, parameters))
+    newcell.metadata['tags'] = ['injected-parameters']
+
+    tags = [cell.metadata.get('tags', []) for cell in nb.cells]
+    injected = [index for index, cell_tags in enumerate(tags) if 'injected-parameters' in cell_tags]
+    params = [index for index, cell_tags in enumerate(tags) if 'parameters' in cell_tags]
+
+    if injected:
+        nb.cells = nb.cells[:injected[0]] + [newcell] + nb.cells[injected[0] + 1:]
+    elif params:
+        nb.cells = nb.cells[:params[0] + 1] + [newcell] + nb.cells[params[0] + 1:]
+    else:
+        nb.cells = [newcell] + nb.cells
+
+    nb.metadata.papermill['parameters'] = parameters
+
+    return nb
+
+
+# same steps as papermill's execute_notebook, but the input notebook comes from load_notebook
+# rather than being downloaded, parsed and deep copied twice for every run.
+# without write_output the notebook is only written if it fails, and is left for the caller to store otherwise.
+# without write_errors a failed notebook is not written either. source is the InputNotebook of the run
+# when it was loaded already.
+def execute_notebook(in_notebook, outfile, parameters, write_output=True, observer=None, write_errors=True,
+                     source=None):
+    nb = source.take() if source is not None and source.path == in_notebook else load_notebook(in_notebook)
+    return execute_loaded(nb, in_notebook, outfile, parameters, write_output=write_output,
+                          observer=observer, write_errors=write_errors)
+
+
+# executes a notebook that was already loaded. nb is changed in place and must be a copy.
+# observer is told about each cell as it runs, see app.progress
+def execute_loaded(nb, in_notebook, outfile, parameters, write_output=True, progress_bar=True, observer=None,
+                   write_errors=True):
+
+    # notebooks that opted in run on a kernel that already ran their setup cells, see app.resident
+    engine_options = {}
+    if resident_kernels.enabled and resident.is_resident(nb):
+        engine_options["resident"] = (in_notebook, resident.notebook_version(nb))
+
+    if parameters:
+        nb = parameterize(nb, parameters)
+
+    nb.metadata.papermill['input_path'] = in_notebook
+    nb.metadata.papermill['output_path'] = outfile
+
+    # the kernel is ready when the first cell starts, the rest of the run is spent executing cells.
+    # cells are only described to an observer of the run, which is costly for every cell
+    started = [time.time()]
+
+    def kernel_ready():
+        started.append(time.time())
+        metrics.observe("kernel_start", started[1] - started[0])
+
+    nb = papermill_engines.execute_notebook_with_engine(
+        "resident" if engine_options else kernel_pools.engine_name or "observed",
+        nb,
+        input_path=in_notebook,
+        output_path=outfile if write_output else None,
+        kernel_name=nb.metadata.kernelspec.name,
+        progress_bar=progress_bar,
+        observer=observer,
+        on_kernel_ready=kernel_ready,
+        **engine_options
+    )
+    metrics.observe("execute", time.time() - started[-1])
+
+    # Check for errors first (it saves on error before raising)
+    raise_for_errors(nb, outfile if write_errors else None)
+
+    if write_output:
+        with metrics.phase("write_output"):
+            write_ipynb(nb, outfile)
+
+    return nb
+
+
+# papermill's raise_for_execution_errors, which writes the failed notebook to outfile before raising.
+# the output directory is only created once there is a failure to write, and with no outfile
+# the error is raised without writing anything
+def raise_for_errors(nb, outfile):
+
+    for cell in nb.cells:
+        for output in cell.get("outputs", []):
+            if output.output_type != "error":
+                continue
+
+            if outfile is None:
+                raise PapermillExecutionError(exec_count=cell.execution_count, source=cell.source,
+                                              ename=output.ename, evalue=output.evalue,
+                                              traceback=output.traceback)
+
+            make_output_dir(outfile)
+            raise_for_execution_errors(nb, outfile)
+
+
+# creates the directory of a local output notebook
+def make_output_dir(outfile):
+    if "s3://" not in outfile:
+        os.makedirs(os.path.dirname(outfile) or ".", mode=0o777, exist_ok=True)
+
+
+# reads the scraps from the executed notebook in memory. With VERIFY_SCRAPS the output notebook is
+# also read back from where it was written and its scraps are used if the two differ.
+def read_scraps(result, outfile, verify=True):
+
+    with metrics.phase("read_scraps"):
+        scraps = sb.read_notebook(result).scraps.data_dict
+
+    if verify and current_app.config.get("VERIFY_SCRAPS", False):
+        with metrics.phase("verify_scraps"):
+            written = sb.read_notebook(outfile).scraps.data_dict
+        if written != scraps:
+            logger.warning("Scraps of %s differ from the executed notebook", outfile)
+            return written
+
+    return scraps
+
+
+# creates the output directory if it is local, executes the notebook and gets its scraps.
+# returns the path of the output notebook, the executed notebook and the scraps as a dictionary.
+# persist is one of PERSIST_MODES, with 'errors' and 'none' the notebook is kept in memory after a
+# successful run and the output directory is not created unless a failed notebook is written to it
+def execute(in_notebook, out_path, out_notebook_name, parameters, write_output=True, observer=None,
+            persist="always", source=None):
+
+    # TODO this leaves an empty directory if 'execute_notebook' is unsuccessful
+    if persist == "always" and "s3://" not in out_path:
+        try:
+            os.makedirs(out_path, mode=0o777, exist_ok=False)
+        except:
+            # directory exists
+            pass
+
+    write_output = write_output and persist == "always"
+
+    path_parameters = add_builtin_parameters(parameters)
+    in_notebook = parameterize_path(in_notebook, path_parameters)
+    outfile = parameterize_path(os.path.join(out_path, out_notebook_name), path_parameters)
+
+    try:
+        result = execute_notebook(in_notebook, outfile, parameters, write_output=write_output, observer=observer,
+                                  write_errors=persist != "none", source=source)
+        return outfile, result, read_scraps(result, outfile, verify=write_output)
+    except Exception as error:
+        metrics.error(error)
+        raise
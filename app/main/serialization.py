@@ -0,0 +1,123 @@
+import json
+from .errors import InvalidUsage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# parts of the returned notebook that can be left out with 'stripNotebook'
+STRIP_OPTIONS = ("outputs", "attachments")
+
+
+# json text of obj, compact unless pretty. Uses orjson when it is installed, which only indents by 2.
+def dumps(obj, pretty=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=str, option=option).decode()
+
+    if pretty:
+        return json.dumps(obj, indent=2, default=str)
+    return json.dumps(obj, separators=(",", ":"), default=str)
+
+
+# the json text of obj in pieces, dictionaries and lists are split into their items down to 'split' levels
+# so a notebook is never encoded as a whole, only one cell at a time
+def iter_dumps(obj, split=3):
+    if split and isinstance(obj, dict):
+        yield "{"
+        for index, (key, value) in enumerate(obj.items()):
+            yield ("," if index else "") + dumps(str(key)) + ":"
+            yield from iter_dumps(value, split - 1)
+        yield "}"
+    elif split and isinstance(obj, list):
+        yield "["
+        for index, value in enumerate(obj):
+            if index:
+                yield ","
+            yield from iter_dumps(value, split - 1)
+        yield "]"
+    else:
+        yield dumps(obj)
+
+
+# joins the pieces of iter_dumps into chunks of about chunk_size characters
+def chunks(obj, chunk_size):
+    buffered = []
+    size = 0
+    for piece in iter_dumps(obj):
+        buffered.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffered)
+            buffered = []
+            size = 0
+    if buffered:
+        yield "".join(buffered)
+
+
+# rough size of the json text of obj, from the length of the strings in it. Walking the result is much
+# cheaper than encoding it, and base64 images and long outputs are where the size is.
+def estimate_size(obj):
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(str(key)) + estimate_size(value) for key, value in obj.items())
+    if isinstance(obj, list):
+        return sum(estimate_size(value) for value in obj)
+    return 8
+
+
+# the 'fields' option, comma separated dotted paths like 'result.a,result.b'
+def parse_fields(value):
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    return [field.split(".") for field in fields] or None
+
+
+# only the given fields of obj, keeping their nesting. Fields that do not exist are left out.
+def project(obj, fields):
+    projected = {}
+    for keys in fields:
+        source = obj
+        for key in keys:
+            if not isinstance(source, dict) or key not in source:
+                break
+            source = source[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = source
+    return projected
+
+
+# the 'stripNotebook' option, a comma separated list of STRIP_OPTIONS
+def parse_strip(value):
+    strip = {option.strip() for option in (value or "").split(",") if option.strip()}
+    unknown = strip - set(STRIP_OPTIONS)
+    if unknown:
+        raise InvalidUsage("'stripNotebook' can only contain " + ", ".join(STRIP_OPTIONS))
+    return strip
+
+
+# a copy of the notebook without the outputs or attachments of its cells. The cells are copied
+# shallowly so the executed notebook, which may still be written, is left alone.
+def strip_notebook(nb, strip):
+    if not strip:
+        return nb
+
+    cells = []
+    for cell in nb.cells:
+        cell = cell.copy()
+        if "outputs" in strip and "outputs" in cell:
+            cell["outputs"] = []
+            cell["execution_count"] = None
+        if "attachments" in strip:
+            cell.pop("attachments", None)
+        cells.append(cell)
+
+    stripped = nb.copy()
+    stripped["cells"] = cells
+    return stripped
@@ -0,0 +1,76 @@
+import logging
+import queue
+import threading
+import time
+from botocore.exceptions import ClientError, ParamValidationError
+from papermill.exceptions import PapermillExecutionError
+from app.metrics import metrics
+from .jobs import client_error_status
+from . import runner, serialization
+
+logger = logging.getLogger(__name__)
+
+
+def server_sent_event(event, data):
+    return "event: {}\ndata: {}\n\n".format(event, serialization.dumps(data))
+
+
+# runs the notebook on its own thread and returns a generator of server-sent events: 'cell_start' and
+# 'cell_complete' for every code cell, 'scrap' for every scrap as soon as its cell completes and finally
+# 'result' with the same body as a run that is not streamed, or 'error'. A comment is sent whenever
+# nothing else was for keepalive seconds so idle connections are not closed by proxies.
+# finish is called with the output path, executed notebook and scraps to build the result and
+# release is called with the duration of the run once it is over.
+# observer is also told about every event of the run, persist and source are passed on to runner.execute.
+def stream_run(app, in_notebook, out_path, out_notebook_name, parameters, write_output, finish, keepalive,
+               release=None, observer=None, persist="always", source=None):
+
+    events = queue.Queue()
+
+    def send(event, data):
+        if observer is not None:
+            observer(event, data)
+        events.put(server_sent_event(event, data))
+
+    labels = metrics.labels()
+
+    def work():
+        started = time.time()
+        try:
+            with app.app_context(), metrics.run_labels(*labels):
+                outfile, result, scraps = runner.execute(in_notebook, out_path, out_notebook_name, parameters,
+                                                         write_output=write_output, observer=send,
+                                                         persist=persist, source=source)
+                send("result", finish(outfile, result, scraps))
+
+        except PapermillExecutionError as error:
+            send("error", {"message": str(error), "ename": error.ename, "evalue": error.evalue,
+                           "execCount": error.exec_count, "statusCode": 500})
+        except ClientError as error:
+            send("error", dict(error.response["Error"], statusCode=client_error_status(error)))
+        except ParamValidationError as error:
+            error.kwargs.update({"message": "Check 'location' parameter.", "statusCode": 400})
+            send("error", error.kwargs)
+        except Exception as error:
+            logger.exception("Streamed run of %s failed", in_notebook)
+            send("error", {"message": str(error), "statusCode": 500})
+        finally:
+            if release is not None:
+                release(time.time() - started)
+            events.put(None)
+
+    threading.Thread(target=work, name="stream", daemon=True).start()
+
+    def generate():
+        while True:
+            try:
+                event = events.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+
+            if event is None:
+                return
+            yield event
+
+    return generate()
@@ -0,0 +1,146 @@
+import json
+from distutils.util import strtobool
+from flask import current_app
+from jinja2 import TemplateSyntaxError
+from .. import db as sadb
+from app.models import DefaultTemplate, Template
+from .errors import InvalidUsage
+from .template_cache import bump_template_version
+
+# names looked up per query when checking which templates exist already
+LOOKUP_BATCH = 500
+
+# templates with these names could not be read at /template/<name>, the routes of the bulk import and export
+RESERVED_NAMES = ("bulk", "export")
+# longest name the Template table stores
+NAME_MAX_LENGTH = Template.__table__.c.name.type.length
+
+
+# why name cannot be the name of a template, or None if it can
+def name_error(name):
+    if not isinstance(name, str) or not name:
+        return "'name' must be a non-empty string"
+    if len(name) > NAME_MAX_LENGTH:
+        return "'name' is limited to {} characters".format(NAME_MAX_LENGTH)
+    if name in RESERVED_NAMES:
+        return "'{}' is the name of a template route and cannot be used".format(name)
+    return None
+
+
+# template records of a bulk import, given either as a json array or as one json object per line
+def parse_records(body, max_items):
+
+    body = body.strip()
+    if body.startswith("["):
+        try:
+            records = json.loads(body)
+        except ValueError as error:
+            raise InvalidUsage("Invalid json: {}".format(error))
+    else:
+        records = []
+        for number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as error:
+                raise InvalidUsage("Invalid json on line {}: {}".format(number, error))
+
+    if len(records) > max_items:
+        raise InvalidUsage("a bulk import is limited to {} templates".format(max_items))
+
+    return records
+
+
+# checks every record before anything is written: names are unique and valid as in name_error, contents are
+# strings that compile as jinja templates, and at most one template is the default. Returns the name of the default.
+def validate(records):
+
+    errors = []
+    names = set()
+    defaults = []
+
+    for index, record in enumerate(records):
+        name = record.get("name") if isinstance(record, dict) else None
+        content = record.get("content") if isinstance(record, dict) else None
+
+        message = name_error(name)
+        if message is not None:
+            errors.append({"index": index, "message": message})
+            continue
+        if name in names:
+            errors.append({"index": index, "name": name, "message": "Duplicate template"})
+            continue
+        names.add(name)
+
+        if not isinstance(content, str):
+            errors.append({"index": index, "name": name, "message": "'content' must be a string"})
+            continue
+        try:
+            current_app.jinja_env.compile(content)
+        except TemplateSyntaxError as error:
+            errors.append({"index": index, "name": name, "message": "Invalid template: {}".format(error)})
+            continue
+
+        try:
+            if strtobool(str(record.get("default") or "false")):
+                defaults.append(name)
+        except ValueError as error:
+            errors.append({"index": index, "name": name, "message": str(error)})
+
+    if len(defaults) > 1:
+        errors.append({"message": "Only one template can be the default, got " + ", ".join(defaults)})
+
+    if errors:
+        raise InvalidUsage("Invalid templates, nothing was imported", payload={"errors": errors})
+
+    return defaults[0] if defaults else None
+
+
+# creates or updates the templates of the records in a single transaction, looking up the existing
+# ones in batches rather than one query per template
+def upsert(records):
+
+    default = validate(records)
+
+    contents = {record["name"]: record["content"] for record in records}
+    names = list(contents)
+
+    existing = {}
+    for start in range(0, len(names), LOOKUP_BATCH):
+        for template in Template.query.filter(Template.name.in_(names[start:start + LOOKUP_BATCH])):
+            existing[template.name] = template
+
+    try:
+        for name, content in contents.items():
+            if name in existing:
+                existing[name].content = content
+            else:
+                sadb.session.add(Template(name=name, content=content))
+
+        if default is not None:
+            sadb.session.flush()
+            default_record = DefaultTemplate.query.first() or DefaultTemplate()
+            default_record.template_id = Template.query.filter_by(name=default).one().id
+            sadb.session.add(default_record)
+
+        bump_template_version()
+        sadb.session.commit()
+    except:
+        sadb.session.rollback()
+        raise
+
+    return {"created": len(names) - len(existing), "updated": len(existing), "default": default}
+
+
+# every template as a line of json in the format upsert takes, read from the database in batches
+def export_lines():
+
+    default = DefaultTemplate.query.first()
+    default_id = default.template_id if default else None
+
+    for template in Template.query.order_by(Template.name).yield_per(LOOKUP_BATCH):
+        record = template.as_dict()
+        if template.id == default_id:
+            record["default"] = "true"
+        yield json.dumps(record) + "\n"
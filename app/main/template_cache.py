@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .. import db as sadb
+from app.models import DefaultTemplate, Template, TemplateVersion
+
+
+# marks templates as changed. Called in the same transaction as the change so processes never see
+# the new templates with the old version.
+def bump_template_version():
+    updated = TemplateVersion.query.update({TemplateVersion.version: TemplateVersion.version + 1},
+                                           synchronize_session=False)
+    if not updated:
+        sadb.session.add(TemplateVersion(version=1))
+
+
+def current_template_version():
+    row = TemplateVersion.query.first()
+    return row.version if row else 0
+
+
+# per application state of the TemplateCache
+class TemplateCacheState:
+
+    def __init__(self, max_compiled):
+        self.version = None
+        self.checked_at = 0
+        self.contents = {}
+        self.default = None
+        self.default_loaded = False
+        self.compiled = OrderedDict()
+        self.max_compiled = max_compiled
+        self.lock = threading.Lock()
+
+
+# process-local cache of template contents, the default template and compiled jinja templates.
+# Template contents are dropped whenever the TemplateVersion row changes, so changes made through
+# any server process are seen by all of them. Compiled templates are keyed by their source and
+# never go stale.
+class TemplateCache:
+
+    @property
+    def state(self):
+        state = current_app.extensions.get("template_cache")
+        if state is None:
+            state = TemplateCacheState(current_app.config.get("TEMPLATE_CACHE_MAX_COMPILED", 256))
+            current_app.extensions["template_cache"] = state
+        return state
+
+    # drops cached contents if the templates changed. The version is read at most once every
+    # TEMPLATE_VERSION_CHECK_INTERVAL seconds
+    def sync(self):
+        state = self.state
+        interval = current_app.config.get("TEMPLATE_VERSION_CHECK_INTERVAL", 0)
+        now = time.time()
+
+        if state.version is not None and now - state.checked_at < interval:
+            return state
+
+        version = current_template_version()
+
+        with state.lock:
+            state.checked_at = now
+            if version != state.version:
+                state.version = version
+                state.contents = {}
+                state.default = None
+                state.default_loaded = False
+
+        return state
+
+    # content of the named template, raises NoResultFound if it does not exist
+    def content(self, name):
+        state = self.sync()
+
+        with state.lock:
+            if name in state.contents:
+                return state.contents[name]
+
+        content = Template.query.filter_by(name=name).one().content
+
+        with state.lock:
+            state.contents[name] = content
+
+        return content
+
+    # content of the default template or None if there is no default
+    def default_content(self):
+        state = self.sync()
+
+        with state.lock:
+            if state.default_loaded:
+                return state.default
+
+        default = DefaultTemplate.query.first()
+        content = default.template.content if default is not None and default.template else None
+
+        with state.lock:
+            state.default = content
+            state.default_loaded = True
+
+        return content
+
+    def compile(self, source):
+        state = self.state
+
+        with state.lock:
+            template = state.compiled.get(source)
+            if template is not None:
+                state.compiled.move_to_end(source)
+                return template
+
+        template = current_app.jinja_env.from_string(source)
+
+        with state.lock:
+            state.compiled[source] = template
+            while len(state.compiled) > state.max_compiled:
+                state.compiled.popitem(last=False)
+
+        return template
+
+    # same as flask's render_template_string without compiling the source again
+    def render(self, source, **context):
+        current_app.update_template_context(context)
+        return self.compile(source).render(context)
+
+    def invalidate(self):
+        state = self.state
+        with state.lock:
+            state.version = None
+
+
+template_cache = TemplateCache()
@@ -1,21 +1,34 @@
-from flask import request, Response, render_template_string, jsonify, abort
+from flask import request, Response, jsonify, abort, current_app, stream_with_context
 from flask_restplus import Resource, Api, fields
 from sqlalchemy.orm.exc import NoResultFound
-import papermill as pm
-import scrapbook as sb
 import re
 import json
 import os
 import time
 from distutils.util import strtobool
+from urllib.parse import urlencode
 from . import main
-from .. import db as sadb
-from app.models import DefaultTemplate, Template
+from .. import db as sadb, notebook_cache, parsed_notebooks, resident_kernels, warmup
+from app.metrics import metrics
+from app.progress import RunProfile
+from app.models import DefaultTemplate, Template, Job, OutputNotebook
+from .admission import admission
+from .coalesce import coalescer
 from .errors import InvalidUsage
+from .jobs import job_runner, client_error_status
+from .outputs import output_writer
+from .result_cache import result_cache
+from .template_cache import template_cache, bump_template_version, current_template_version
+from . import batch, early_response, runner, serialization, streaming, template_bulk, work_queue
 from botocore.exceptions import ClientError, ParamValidationError
 
 api = Api(main, title="Papermill API", version="1.0")
 
+# options of a run that are only read by the API and kept out of the parameters of a GET run. 'notebook',
+# 'location', 'template', 'outputNotebookPath' and 'returnNotebook' are passed on as they always were.
+RUN_OPTIONS = ("async", "persist", "persistAsync", "stripNotebook", "fields", "pretty", "cache", "cacheTtl",
+               "coalesce", "respondEarly", "stream", "priority", "maxWait", "returnProfile")
+
 # gets the record in the DefaultTemplate table that points to the current default template
 def get_default_template_record():
     return DefaultTemplate.query.first()
@@ -35,7 +48,7 @@ def result_to_dicts(result_rows):
     return result
 
 # saves a list of models of the same type and returns a
-# list with all models now in the databse
+# list with the dictionaries of the saved models
 def save_models(models):
 
     if len(models) < 1:
@@ -43,11 +56,14 @@ def save_models(models):
 
     for each in models:
         sadb.session.add(each)
-    sadb.session.commit()
 
-    response = result_to_dicts(type(models[0]).query.all())
+    # lets every server process know its cached templates are stale
+    if isinstance(models[0], (Template, DefaultTemplate)):
+        bump_template_version()
 
-    return response
+    sadb.session.commit()
+
+    return result_to_dicts(models)
 
 run = api.namespace('run', description='For running notebooks')
 
@@ -68,6 +84,8 @@ run_post_model = run.model('run_post', {
 def get_path(f):
     def wrapper(self):
 
+        started = time.time()
+
         # What type of service the notebook is located on.
         # so far, {'s3','local'}
         data = dict(request.args)
@@ -144,7 +162,9 @@ def get_path(f):
                       "user_out": user_out
                       }
 
-        return f(self, paths_dict)
+        with metrics.run_labels(paths_dict["in_notebook"], location.lower()):
+            metrics.observe("path", time.time() - started)
+            return f(self, paths_dict)
 
     return wrapper
 
@@ -153,7 +173,21 @@ def get_path(f):
 class RunNotebook(Resource):
 
     @api.doc(params={'template': 'name of a template to used to store the resulting notebook',
-                     'outputNotebookPath': 'path to store the output notebook'
+                     'outputNotebookPath': 'path to store the output notebook',
+                     'async': 'return a job id right away and run the notebook in the background',
+                     'persistAsync': 'respond before the output notebook is written',
+                     'persist': "write the output notebook 'always' (default), only on 'errors', or 'none'",
+                     'fields': "comma separated fields of the response to return, like 'result.a,result.b'",
+                     'pretty': 'indent the json response',
+                     'stripNotebook': "leave 'outputs' and/or 'attachments' out of the returned notebook",
+                     'cache': 'reuse the result of an earlier run with the same notebook and parameters',
+                     'cacheTtl': 'seconds to keep the result of this run for reuse',
+                     'coalesce': 'share the scraps of an identical run in flight rather than running the notebook again',
+                     'respondEarly': "respond once the notebook glues 'response_ready' or runs a cell tagged 'respond'",
+                     'stream': 'send the progress of the run as server-sent events',
+                     'priority': 'runs with a higher priority get the next free execution slot first',
+                     'maxWait': 'seconds to wait for an execution slot',
+                     'returnProfile': 'add the time, kernel time and output size of each cell to the result'
                      }
              )
     @api.param('notebook', 'path to the resource on S3', required=True)
@@ -171,55 +205,28 @@ class RunNotebook(Resource):
             response.status_code = error.status_code
             return response
 
-        default = get_default_template()
         template = data.get("template",  None)
         template_args = {}
         template_args.update({"notebook_name": paths_dict["out_notebook_name"]})
-        out_path = render(template, default, paths_dict["user_out"], paths_dict["out_path"], template_args=template_args)
-
-        # TODO this leaves an empty directory if 'execute_notebook' is unsuccessful
-        if "s3://" not in out_path:
-            try:
-                os.makedirs(out_path, mode=0o777, exist_ok=False)
-            except:
-                # directory exists
-                pass
-
-        outfile = os.path.join(out_path, paths_dict["out_notebook_name"])
-
-        try:
-
-            result = pm.execute_notebook(
-                paths_dict["in_notebook"],
-                outfile,
-                parameters=data
-            )
-
-        except ClientError as error:
-            response = Response(json.dumps(error.response["Error"]))
-            response.status_code = int(error.response["Error"]["Code"])
-            return response
-        except ParamValidationError as error:
-            error.kwargs.update({"message": "Check 'location' parameter."})
-            response = Response(json.dumps(error.kwargs))
-            response.status_code = 400
-            return response
-
-        nb = sb.read_notebook(outfile)
-        json_result = {"result": nb.scraps.data_dict}
-
-        if strtobool(request.args.get('returnNotebook') or "false"):
-            json_result["notebook"] = result
-
-        response = Response(json.dumps(json_result, indent=4), content_type="application/json")
-
-        # insert 'statusCode' if defined in scrap data
-        if nb.scraps.data_dict.get("statusCode", None):
-            status = nb.scraps.data_dict.get("statusCode", None)
-            response.status_code = status
-
-        return response
-
+        out_path = render(template, paths_dict["user_out"], paths_dict["out_path"], template_args=template_args)
+
+        parameters = {key: value for key, value in data.items() if key not in RUN_OPTIONS}
+        return run_notebook(paths_dict, out_path, parameters)
+
+    @api.doc(params={'async': 'return a job id right away and run the notebook in the background',
+                     'persistAsync': 'respond before the output notebook is written',
+                     'persist': "write the output notebook 'always' (default), only on 'errors', or 'none'",
+                     'fields': "comma separated fields of the response to return, like 'result.a,result.b'",
+                     'pretty': 'indent the json response',
+                     'stripNotebook': "leave 'outputs' and/or 'attachments' out of the returned notebook",
+                     'cache': 'reuse the result of an earlier run with the same notebook and parameters',
+                     'cacheTtl': 'seconds to keep the result of this run for reuse',
+                     'coalesce': 'share the scraps of an identical run in flight rather than running the notebook again',
+                     'respondEarly': "respond once the notebook glues 'response_ready' or runs a cell tagged 'respond'",
+                     'stream': 'send the progress of the run as server-sent events',
+                     'priority': 'runs with a higher priority get the next free execution slot first',
+                     'maxWait': 'seconds to wait for an execution slot',
+                     'returnProfile': 'add the time, kernel time and output size of each cell to the result'})
     @api.param('notebook', 'path to the resource on S3', required=True)
     @api.param('location', 'specify whether the notebook resides in s3 or local', required=True, enum=["s3", "local"])
     @api.expect(run_post_model)
@@ -242,57 +249,401 @@ class RunNotebook(Resource):
             # parameters sent to notebook
             parameters = data.get("parameters", None)
 
-            default = get_default_template()
             template = data.get("template", None)
             template_args = {}
             template_args.update({"notebook_name": paths_dict["out_notebook_name"]})
-            out_path = render(template, default, paths_dict["user_out"], paths_dict["out_path"], template_args=template_args)
+            out_path = render(template, paths_dict["user_out"], paths_dict["out_path"], template_args=template_args)
 
         else:
             raise InvalidUsage("only application/json supported")
 
-        if "s3://" not in out_path:
-            try:
-                os.makedirs(out_path, mode=0o777, exist_ok=False)
-            except:
-                # directory exists
-                pass
+        return run_notebook(paths_dict, out_path, parameters)
+
+
+run_batch_model = run.model('run_batch', {
+                                     "parameters": fields.List(fields.Raw),
+                                     "grid": fields.Raw,
+                                     "template": fields.Nested(render_template_model)
+                                }
+)
+
+
+@run.route('/batch', methods=['POST'])
+class RunBatch(Resource):
+
+    @api.param('notebook', 'path to the resource on S3', required=True)
+    @api.param('location', 'specify whether the notebook resides in s3 or local', required=True, enum=["s3", "local"])
+    @api.expect(run_batch_model)
+    @get_path
+    def post(self, paths_dict):
+
+        data = request.get_json(force=True)
+
+        try:
+            if not isinstance(data, dict):
+                raise InvalidUsage("only application/json supported")
+            if "template" in data and "outputNotebookPath" in data:
+                raise InvalidUsage("either 'outputNotebookPath' or 'template' is supported not both")
+
+            sets = batch.parameter_sets(data, current_app.config["BATCH_MAX_ITEMS"])
+            priority, max_wait = admission.options(request.args)
 
-        outfile = os.path.join(out_path, paths_dict["out_notebook_name"])
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()))
+            response.status_code = error.status_code
+            return response
+
+        template = data.get("template", None)
+        template_args = {}
+        template_args.update({"notebook_name": paths_dict["out_notebook_name"]})
+        out_path = render(template, paths_dict["user_out"], paths_dict["out_path"], template_args=template_args)
+
+        user = paths_dict.get("user")
 
         try:
 
-            result = pm.execute_notebook(
-                paths_dict["in_notebook"],
-                outfile,
-                parameters=parameters
-            )
+            # every set executes in a slot. The first waits for one like a single run, the others wait as long
+            # as it takes once the batch was admitted.
+            if sets:
+                admission.acquire(user, priority, max_wait)
+                try:
+                    lines = batch.run_batch(paths_dict["in_notebook"], out_path, paths_dict["out_notebook_name"],
+                                            sets, current_app.config["BATCH_PROCESSES"],
+                                            acquire=lambda: admission.acquire(user, priority),
+                                            release=lambda duration: admission.release(user, duration))
+                except:
+                    admission.release(user)
+                    raise
+            else:
+                lines = []
 
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()), headers=error.headers)
+            response.status_code = error.status_code
+            return response
         except ClientError as error:
             response = Response(json.dumps(error.response["Error"]))
-            response.status_code = int(error.response["Error"]["Code"])
+            response.status_code = client_error_status(error)
             return response
         except ParamValidationError as error:
-            error.kwargs.update({"message": "Check 'local' parameter."})
+            error.kwargs.update({"message": "Check 'location' parameter."})
             response = Response(json.dumps(error.kwargs))
             response.status_code = 400
             return response
 
-        nb = sb.read_notebook(outfile)
-        json_result = {"result": nb.scraps.data_dict}
+        return Response(stream_with_context(lines), content_type="application/x-ndjson")
+
 
-        if strtobool(request.args.get('returnNotebook') or "false"):
-            json_result["notebook"] = result
+# executes the notebook and builds the response common to GET and POST runs.
+# with 'async' the notebook is handed to the job runner and only the job is returned,
+# with 'stream' the progress of the run is sent as server-sent events.
+def run_notebook(paths_dict, out_path, parameters):
 
-        response = Response(json.dumps(json_result, indent=4), content_type="application/json")
+    in_notebook = paths_dict["in_notebook"]
+    # fetched and parsed once for the metadata, version and execution of the run
+    source = runner.InputNotebook(in_notebook)
 
-        # insert 'statusCode' if defined in scrap data
-        if nb.scraps.data_dict.get("statusCode", None):
-            status = nb.scraps.data_dict.get("statusCode", None)
-            response.status_code = status
+    try:
 
+        # the notebook's defaults, only read for the options this run leaves to it
+        metadata = source.api_metadata
+
+        # earlier results are only used by runs and notebooks that opt in
+        cache_ttl = result_cache.ttl(metadata, request.args)
+        if cache_ttl:
+            cache_key = result_cache.key(source, parameters)
+            cached = result_cache.get(cache_key)
+            if cached:
+                return scraps_response({"result": json.loads(cached.result), "cached": cached.as_dict()},
+                                       headers={"X-Result-Cache": "hit"})
+
+        persist = request.args.get('persist') or current_app.config["PERSIST"]
+        if persist not in runner.PERSIST_MODES:
+            raise InvalidUsage("'persist' must be one of " + ", ".join(runner.PERSIST_MODES))
+        strip = serialization.parse_strip(request.args.get('stripNotebook'))
+        user = paths_dict.get("user")
+        priority, max_wait = admission.options(request.args)
+
+        if strtobool(request.args.get('async') or "false"):
+            job = job_runner.submit(current_app._get_current_object(), paths_dict, out_path, parameters,
+                                    persist=persist, priority=priority, source=source)
+
+            response = Response(serialization.dumps(job.as_dict(), strtobool(request.args.get('pretty') or "false")),
+                                content_type="application/json")
+            response.status_code = 202
+            response.headers["Location"] = api.url_for(JobRoutes, job_id=job.id)
+            return response
+
+        # runs that may respond before the notebook is over write their output notebook themselves
+        early = not strtobool(request.args.get('stream') or "false") and early_response.enabled(metadata,
+                                                                                                 request.args)
+
+        # only notebooks that are always persisted are left to the output writer
+        persist_async = not early and persist == "always" and strtobool(request.args.get('persistAsync') or
+                                                                        str(current_app.config["PERSIST_ASYNC"]))
+        return_notebook = strtobool(request.args.get('returnNotebook') or "false")
+        profile = RunProfile() if strtobool(request.args.get('returnProfile') or "false") else None
+        observer = profile.observe if profile else None
+        app = current_app._get_current_object()
+
+        # body of the response once the notebook ran, also caches the result and stores the output notebook
+        def finish(outfile, result, scraps):
+            json_result = {"result": scraps}
+
+            if cache_ttl:
+                result_cache.put(cache_key, in_notebook, scraps, outfile if persist == "always" else None, cache_ttl)
+
+            if persist_async:
+                output = output_writer.submit(app, result, outfile)
+                json_result["output"] = output.as_dict()
+
+            if return_notebook:
+                json_result["notebook"] = serialization.strip_notebook(result, strip)
+
+            if profile:
+                json_result["profile"] = profile.as_dict(app.config["PROFILE_TOP_CELLS"])
+
+            return json_result
+
+        # nothing reads the database again until the run is over, so its connection goes back to the pool
+        # rather than staying in an idle transaction for as long as the notebook runs
+        sadb.session.close()
+
+        # waits for an execution slot, or is turned away when too many runs are waiting already
+        if strtobool(request.args.get('stream') or "false"):
+            admission.acquire(user, priority, max_wait)
+            events = streaming.stream_run(app, in_notebook, out_path, paths_dict["out_notebook_name"], parameters,
+                                          not persist_async, finish, current_app.config["STREAM_KEEPALIVE"],
+                                          release=lambda duration: admission.release(user, duration),
+                                          observer=observer, persist=persist, source=source)
+
+            return Response(events, content_type="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+        def execute():
+            with admission.slot(user, priority, max_wait):
+                return runner.execute(
+                    in_notebook,
+                    out_path,
+                    paths_dict["out_notebook_name"],
+                    parameters,
+                    write_output=not persist_async,
+                    observer=observer,
+                    persist=persist,
+                    source=source
+                )
+
+        # the slot is held until the notebook is over, which may be well after the response
+        if early:
+            admission.acquire(user, priority, max_wait)
+            try:
+                job = early_response.start_job(in_notebook, parameters)
+                sadb.session.close()
+            except:
+                admission.release(user)
+                raise
+
+            coalesced = None
+            responded, outcome = early_response.run(app, job["id"], in_notebook, out_path,
+                                                    paths_dict["out_notebook_name"], parameters, persist,
+                                                    release=lambda duration: admission.release(user, duration),
+                                                    observer=observer, source=source)
+            if responded:
+                return scraps_response({"result": outcome, "job": job},
+                                       headers={"Location": api.url_for(JobRoutes, job_id=job["id"])})
+            outfile, result, scraps = outcome
+
+        # followers do not take an execution slot, they only wait for the leader's scraps
+        elif coalescer.enabled(request.args):
+            coalesced, outcome = coalescer.run(coalescer.key(in_notebook, parameters), execute)
+            if coalesced == "follower":
+                return scraps_response({"result": outcome}, headers={"X-Coalesced": coalesced})
+            outfile, result, scraps = outcome
+        else:
+            coalesced = None
+            outfile, result, scraps = execute()
+
+    except InvalidUsage as error:
+        response = Response(json.dumps(error.to_dict()), headers=error.headers)
+        response.status_code = error.status_code
+        return response
+    except ClientError as error:
+        response = Response(json.dumps(error.response["Error"]))
+        response.status_code = client_error_status(error)
+        return response
+    except ParamValidationError as error:
+        error.kwargs.update({"message": "Check 'location' parameter."})
+        response = Response(json.dumps(error.kwargs))
+        response.status_code = 400
         return response
 
+    headers = {}
+    if cache_ttl:
+        headers["X-Result-Cache"] = "miss"
+    if coalesced:
+        headers["X-Coalesced"] = coalesced
+
+    return scraps_response(finish(outfile, result, scraps), headers=headers)
+
+
+# json response for a run, using the 'statusCode' scrap as the status if there is one.
+# 'fields' keeps only the given dotted paths of the body and 'pretty' indents it. Bodies larger than
+# RESPONSE_STREAM_THRESHOLD_MB are encoded and sent in chunks rather than built in memory as a whole.
+def scraps_response(json_result, headers=None):
+
+    status = json_result["result"].get("statusCode", None)
+
+    fields = serialization.parse_fields(request.args.get('fields'))
+    if fields:
+        json_result = serialization.project(json_result, fields)
+
+    pretty = strtobool(request.args.get('pretty') or "false")
+    threshold = current_app.config["RESPONSE_STREAM_THRESHOLD_MB"] * 1024 * 1024
+    if not pretty and serialization.estimate_size(json_result) > threshold:
+        body = serialization.chunks(json_result, current_app.config["RESPONSE_CHUNK_KB"] * 1024)
+    else:
+        body = serialization.dumps(json_result, pretty)
+
+    response = Response(body, content_type="application/json", headers=headers)
+
+    # insert 'statusCode' if defined in scrap data
+    if status:
+        response.status_code = status
+
+    return response
+
+
+jobs_ns = api.namespace('jobs', description='For checking on notebooks run with async=true')
+
+
+@jobs_ns.route('/<string:job_id>', methods=['GET'])
+class JobRoutes(Resource):
+    def get(self, job_id):
+
+        job = Job.query.filter_by(id=job_id).first()
+
+        try:
+            if not job:
+                raise InvalidUsage("Job does not exist", status_code=404)
+
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()))
+            response.status_code = error.status_code
+            return response
+
+        return jsonify(job.as_dict())
+
+
+# runs waiting in the shared execution queue and the workers running them, with JOB_QUEUE=database
+@jobs_ns.route('/queue', methods=['GET'])
+class JobQueueRoutes(Resource):
+    def get(self):
+        return jsonify(work_queue.stats())
+
+
+outputs_ns = api.namespace('outputs', description='For checking on output notebooks written after responding')
+
+
+@outputs_ns.route('/<string:output_id>', methods=['GET'])
+class OutputRoutes(Resource):
+    def get(self, output_id):
+
+        output = OutputNotebook.query.filter_by(id=output_id).first()
+
+        try:
+            if not output:
+                raise InvalidUsage("Output does not exist", status_code=404)
+
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()))
+            response.status_code = error.status_code
+            return response
+
+        return jsonify(output.as_dict())
+
+
+cache_ns = api.namespace('cache', description='For inspecting the caches used when running notebooks')
+
+
+@cache_ns.route('/notebooks', methods=['GET'])
+class NotebookCacheRoutes(Resource):
+    def get(self):
+        return jsonify(notebook_cache.stats())
+
+
+@cache_ns.route('/results', methods=['GET', 'DELETE'])
+class ResultCacheRoutes(Resource):
+    def get(self):
+        return jsonify(result_cache.stats())
+
+    @api.param('notebook', 'input notebook path to remove results for, all results are removed if omitted')
+    def delete(self):
+        return jsonify({"purged": result_cache.purge(request.args.get('notebook'))})
+
+
+@cache_ns.route('/coalesced', methods=['GET'])
+class CoalescedRunsRoutes(Resource):
+    def get(self):
+        return jsonify(coalescer.stats())
+
+
+@cache_ns.route('/parsed', methods=['GET'])
+class ParsedNotebookCacheRoutes(Resource):
+    def get(self):
+        return jsonify(parsed_notebooks.stats())
+
+
+# Prometheus metrics of the run pipeline, outside of the api so it is at the usual /metrics path
+@main.route('/metrics')
+def prometheus_metrics():
+
+    try:
+        if not metrics.enabled:
+            raise InvalidUsage("prometheus_client is not installed", status_code=501)
+    except InvalidUsage as error:
+        response = Response(json.dumps(error.to_dict()))
+        response.status_code = error.status_code
+        return response
+
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
+# readiness probe, 503 until the warm-up of WARMUP_MANIFEST is done so new instances only get traffic once hot
+@main.route('/ready')
+def ready():
+    status = warmup.status()
+    response = Response(json.dumps(status), content_type="application/json")
+    response.status_code = 200 if status["ready"] else 503
+    return response
+
+
+admission_ns = api.namespace('admission', description='For sizing hosts by how long runs wait to be executed')
+
+
+@admission_ns.route('/', methods=['GET'])
+class AdmissionRoutes(Resource):
+    def get(self):
+        return jsonify(admission.stats())
+
+
+resident_ns = api.namespace('resident', description='For the kernels kept for notebooks in resident mode')
+
+
+@resident_ns.route('/', methods=['GET'])
+class ResidentRoutes(Resource):
+    def get(self):
+        return jsonify(resident_kernels.stats())
+
+
+# shuts down resident kernels so the next run of the notebook runs its setup cells again, for example
+# after the data they load changed
+@resident_ns.route('/reload', methods=['POST'])
+class ResidentReloadRoutes(Resource):
+    @api.param('notebook', 'input notebook path as listed at /resident/, all notebooks are reloaded if omitted')
+    def post(self):
+        return jsonify({"reloaded": resident_kernels.reload(request.args.get('notebook'))})
+
 
 templates_ns = api.namespace('template', description='For defining, retrieving and deleting templates')
 # gets and sets the template which is default.
@@ -316,21 +667,36 @@ templates_delete_model = templates_ns.model('template_delete', {
 class TemplatesRoutes(Resource):
     @api.param('default', 'Return only default template. Otherwise return all templates.',
                enum=["true", "false", "t", "f", "yes", "no", "y", "n", "on", "off", "0", "1"])
+    @api.doc(params={'prefix': 'return only templates whose name starts with this',
+                     'limit': 'return at most this many templates, a Link header points to the next page',
+                     'after': 'return templates whose name comes after this one',
+                     'summary': 'return only the names of the templates'})
     def get(self):
 
-        if strtobool(request.args.get('default') or "false"):
-            return jsonify(get_default_template().as_dict() if get_default_template() else [])
-        else:
-            return list_templates()
+        def build():
+            if strtobool(request.args.get('default') or "false"):
+                default = get_default_template()
+                return jsonify(default.as_dict() if default else [])
+            else:
+                return list_templates()
+
+        try:
+            return templates_conditional(build)
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()))
+            response.status_code = error.status_code
+            return response
 
     @templates_ns.expect(templates_delete_model)
     def delete(self):
         data = json.loads(request.data.decode())
         template = Template.query.filter_by(name=data["name"]).first()
+        deleted = template.as_dict()
         sadb.session.delete(template)
+        bump_template_version()
         sadb.session.commit()
 
-        return list_templates()
+        return jsonify(deleted)
 
     @templates_ns.expect(templates_post_model)
     def post(self):
@@ -340,6 +706,9 @@ class TemplatesRoutes(Resource):
         existing = Template.query.filter_by(name=data["name"])
 
         try:
+            message = template_bulk.name_error(data["name"])
+            if message is not None:
+                raise InvalidUsage(message)
             if existing.first():
                 raise InvalidUsage("Template exists")
 
@@ -367,7 +736,7 @@ class TemplatesRoutes(Resource):
             dt.template_id = t.id
             save_models([dt])
 
-        return list_templates()
+        return jsonify(t.as_dict())
 
     @templates_ns.expect(templates_post_model)
     def patch(self):
@@ -401,7 +770,7 @@ class TemplatesRoutes(Resource):
 
         save_models([dt])
 
-        return list_templates()
+        return jsonify(existing.as_dict())
 
 
 template_ns = api.namespace('template', description='For defining and retrieving templates')
@@ -413,9 +782,7 @@ template_ns = api.namespace('template', description='For defining and retrieving
 class TemplateRoutes(Resource):
     def get(self, template):
 
-        response = result_to_dicts(Template.query.filter_by(name=template))
-
-        return jsonify(response)
+        return templates_conditional(lambda: jsonify(result_to_dicts(Template.query.filter_by(name=template))))
 
     def delete(self, template):
 
@@ -430,10 +797,12 @@ class TemplateRoutes(Resource):
             response.status_code = error.status_code
             return response
 
+        deleted = existing.as_dict()
         sadb.session.delete(existing)
+        bump_template_version()
         sadb.session.commit()
 
-        return list_templates()
+        return jsonify(deleted)
 
     @templates_ns.expect(templates_post_model)
     def post(self, template):
@@ -458,22 +827,108 @@ class TemplateRoutes(Resource):
             dt.template_id = t.id
             save_models([dt])
 
-        return list_templates()
+        return jsonify(t.as_dict())
+
+
+# creates or updates many templates at once, in one transaction. The body is a json array or one json
+# object per line, each with 'name', 'content' and optionally 'default'. Every template is checked first,
+# so an invalid one imports nothing.
+@template_ns.route('/bulk', methods=['POST'])
+class TemplateBulkRoutes(Resource):
+    def post(self):
+
+        try:
+            records = template_bulk.parse_records(request.get_data(as_text=True),
+                                                  current_app.config["TEMPLATE_BULK_MAX_ITEMS"])
+            result = template_bulk.upsert(records)
+
+        except InvalidUsage as error:
+            response = Response(json.dumps(error.to_dict()), content_type="application/json")
+            response.status_code = error.status_code
+            return response
+
+        return jsonify(result)
+
+
+# every template as one json object per line, in the format taken by /template/bulk
+@template_ns.route('/export', methods=['GET'])
+class TemplateExportRoutes(Resource):
+    def get(self):
+
+        return templates_conditional(lambda: Response(stream_with_context(template_bulk.export_lines()),
+                                                      content_type="application/x-ndjson"))
 
 
+# the templates ordered by name. 'prefix' keeps those whose name starts with it, 'limit' and 'after' page
+# through them by name and 'summary' leaves out their content. When there are more templates than the
+# limit a Link header points to the next page.
 def list_templates():
-    temp =Template.query.all()
-    return jsonify(result_to_dicts(temp))
+
+    query = Template.query.order_by(Template.name)
+
+    prefix = request.args.get('prefix')
+    if prefix:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(Template.name.like(escaped + "%", escape="\\"))
+
+    after = request.args.get('after')
+    if after:
+        query = query.filter(Template.name > after)
+
+    summary = strtobool(request.args.get('summary') or "false")
+    if summary:
+        query = query.with_entities(Template.name)
+
+    try:
+        limit = int(request.args.get('limit') or 0)
+    except ValueError:
+        raise InvalidUsage("'limit' must be a number")
+    if limit:
+        limit = min(limit, current_app.config["TEMPLATE_PAGE_MAX"])
+        # one more than the page tells whether there is a next one
+        rows = query.limit(limit + 1).all()
+    else:
+        rows = query.all()
+
+    more = bool(limit) and len(rows) > limit
+    if more:
+        rows = rows[:limit]
+
+    if summary:
+        response = jsonify([{"name": row.name} for row in rows])
+    else:
+        response = jsonify(result_to_dicts(rows))
+
+    if more:
+        args = dict(request.args.items(), after=rows[-1].name, limit=limit)
+        response.headers["Link"] = '<{}?{}>; rel="next"'.format(request.base_url, urlencode(args))
+
+    return response
+
+
+# answers 304 Not Modified when the client already has the templates at their current version,
+# otherwise tags the response of build with it. Every change to the templates bumps the version,
+# so the version is checked before anything is listed.
+def templates_conditional(build):
+
+    etag = "templates-{}".format(current_template_version())
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+
+    response.set_etag(etag, weak=True)
+    return response
 
 
 def default_template_parameters(f):
-    def wrapper(template_name, default, user_out, outputpath, template_args):
+    def wrapper(template_name, user_out, outputpath, template_args):
         # some initial default args for things like a time stamp.
         template_args["timestamp"] = time.strftime("%Y%m%d%H%M%S")
         template_args["year"] = time.strftime("%Y")
         template_args["month"] = time.strftime("%m")
         template_args["day"] = time.strftime("%d")
-        return f(template_name, default, user_out, outputpath, template_args=template_args)
+        return f(template_name, user_out, outputpath, template_args=template_args)
 
     return wrapper
 
@@ -483,24 +938,29 @@ def default_template_parameters(f):
 # if the user specifies an output path, render that
 # if neither of these are defined, render the default template
 # If the default template does not exist, use the location of the input notebook
-def render(template_name, default, user_out, outputpath, template_args={}):
+def render(template_name, user_out, outputpath, template_args={}):
 
-    if template_name:
+    # looking up the template is timed as the 'render' phase of the run
+    with metrics.phase("render"):
 
-        try:
-            t = Template.query.filter_by(name=template_name).one()
-        except NoResultFound as error:
-            response = Response(json.dumps({"error": "No template: " + template_name}))
-            response.status_code = 404
-            abort(response)
-
-        rendered_template = render_template_string(t.content, args=template_args)
-
-    elif user_out:
-        rendered_template = render_template_string(user_out, args=template_args)
-    elif default:
-        rendered_template = render_template_string(default.content, args=template_args)
-    else:
-        rendered_template = render_template_string(outputpath, args=template_args)
+        if template_name:
+
+            try:
+                content = template_cache.content(template_name)
+            except NoResultFound as error:
+                response = Response(json.dumps({"error": "No template: " + template_name}))
+                response.status_code = 404
+                abort(response)
+
+            rendered_template = template_cache.render(content, args=template_args)
+
+        elif user_out:
+            rendered_template = template_cache.render(user_out, args=template_args)
+        else:
+            default = template_cache.default_content()
+            if default:
+                rendered_template = template_cache.render(default, args=template_args)
+            else:
+                rendered_template = template_cache.render(outputpath, args=template_args)
 
-    return rendered_template
+        return rendered_template
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from .. import db as sadb
+from app.metrics import metrics
+from app.models import QueuedRun
+from .jobs import run_job, update_job
+
+logger = logging.getLogger(__name__)
+
+
+# claims the next run of the shared execution queue for worker: the queued run with the highest priority
+# that was enqueued first, or a claimed run whose worker stopped extending its lease. Returns None when
+# there is nothing to run. Runs that were claimed max_attempts times already are failed instead.
+def claim(worker, lease_seconds, max_attempts):
+
+    while True:
+        now = datetime.utcnow()
+
+        # other workers skip the row while it is locked. Databases without row locks, like SQLite, leave
+        # it to the update below to make sure only one worker gets the run.
+        run = (QueuedRun.query
+               .filter(or_(QueuedRun.state == "queued",
+                           and_(QueuedRun.state == "claimed", QueuedRun.lease_expires_at < now)))
+               .order_by(QueuedRun.priority.desc(), QueuedRun.enqueued_at)
+               .with_for_update(skip_locked=True)
+               .first())
+
+        if run is None:
+            sadb.session.commit()
+            return None
+
+        if run.attempts >= max_attempts:
+            logger.error("Giving up on run %s, its worker was lost %s times", run.id, run.attempts)
+            sadb.session.delete(run)
+            update_job(run.id, state="failed", status_code=500, finished_at=now,
+                       error=json.dumps({"message": "The run was lost by {} workers".format(run.attempts)}))
+            continue
+
+        claimed = (QueuedRun.query
+                   .filter_by(id=run.id, state=run.state, attempts=run.attempts)
+                   .update({QueuedRun.state: "claimed",
+                            QueuedRun.worker: worker,
+                            QueuedRun.attempts: run.attempts + 1,
+                            QueuedRun.lease_expires_at: now + timedelta(seconds=lease_seconds)},
+                           synchronize_session=False))
+        sadb.session.commit()
+
+        if claimed:
+            return QueuedRun.query.get(run.id)
+
+
+# extends the leases of the runs the worker is executing, returns how many it still holds
+def heartbeat(worker, run_ids, lease_seconds):
+    held = (QueuedRun.query
+            .filter(QueuedRun.id.in_(run_ids), QueuedRun.worker == worker)
+            .update({QueuedRun.lease_expires_at: datetime.utcnow() + timedelta(seconds=lease_seconds)},
+                    synchronize_session=False))
+    sadb.session.commit()
+    return held
+
+
+# takes a finished run off the queue, unless another worker claimed it after this one lost its lease
+def complete(worker, run_id):
+    QueuedRun.query.filter_by(id=run_id, worker=worker).delete(synchronize_session=False)
+    sadb.session.commit()
+
+
+def stats():
+    counts = dict(sadb.session.query(QueuedRun.state, sadb.func.count(QueuedRun.id)).group_by(QueuedRun.state))
+    workers = [worker for worker, in sadb.session.query(QueuedRun.worker)
+               .filter(QueuedRun.state == "claimed").distinct()]
+    return {"queued": counts.get("queued", 0), "claimed": counts.get("claimed", 0), "workers": workers}
+
+
+# drains the shared execution queue with 'concurrency' threads until stop is called. The runs in flight
+# are finished before run returns. Their leases are extended every QUEUE_HEARTBEAT_SECONDS so other
+# workers only take over the runs of a worker that crashed or hung.
+class Worker:
+
+    def __init__(self, app, concurrency, name=None):
+        self.app = app
+        self.concurrency = concurrency
+        self.name = name or "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.done = threading.Event()
+
+    def run(self):
+        logger.info("Worker %s running %s notebooks at once", self.name, self.concurrency)
+
+        heartbeat_thread = threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True)
+        heartbeat_thread.start()
+
+        threads = [threading.Thread(target=self._work, name="queue-worker-{}".format(index), daemon=True)
+                   for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.done.set()
+        heartbeat_thread.join()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _work(self):
+        config = self.app.config
+
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    run = claim(self.name, config["QUEUE_LEASE_SECONDS"], config["QUEUE_MAX_ATTEMPTS"])
+                except Exception:
+                    logger.exception("Failed claiming a run")
+                    sadb.session.rollback()
+                    run = None
+
+                if run is None:
+                    self.stopping.wait(config["QUEUE_POLL_SECONDS"])
+                    continue
+
+                # the row is expired by every commit of the run and may be gone by the time it is over
+                run_id = run.id
+                args = (run.in_notebook, run.out_path, run.out_notebook_name, json.loads(run.parameters or "{}"),
+                        run.persist)
+                labels = json.loads(run.labels or '["", ""]')
+
+                with self.lock:
+                    self.running.add(run_id)
+                try:
+                    with metrics.run_labels(*labels):
+                        run_job(run_id, *args)
+                    complete(self.name, run_id)
+                except Exception:
+                    logger.exception("Failed finishing run %s", run_id)
+                    sadb.session.rollback()
+                finally:
+                    with self.lock:
+                        self.running.discard(run_id)
+
+    def _heartbeat(self):
+        config = self.app.config
+
+        with self.app.app_context():
+            while not self.done.wait(config["QUEUE_HEARTBEAT_SECONDS"]):
+                with self.lock:
+                    run_ids = list(self.running)
+                if not run_ids:
+                    continue
+                try:
+                    held = heartbeat(self.name, run_ids, config["QUEUE_LEASE_SECONDS"])
+                    if held < len(run_ids):
+                        logger.warning("Worker %s lost the lease of %s runs", self.name, len(run_ids) - held)
+                except Exception:
+                    logger.exception("Failed extending leases")
+                    sadb.session.rollback()
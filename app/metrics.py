@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from botocore.exceptions import ClientError, ParamValidationError
+from papermill.exceptions import PapermillExecutionError
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+# seconds, from template lookups to long notebooks
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+# multiprocess mode is used when gunicorn is started with PROMETHEUS_MULTIPROC_DIR set, see boot.sh
+def multiprocess_dir():
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR") or os.environ.get("prometheus_multiproc_dir")
+
+
+# Prometheus metrics of the run pipeline: how long each phase of a run takes and how runs fail,
+# labeled by input notebook and location. The labels of the run in progress are kept per thread
+# and set with run_labels. Nothing is recorded when prometheus_client is not installed.
+class Metrics:
+
+    def __init__(self):
+        self.local = threading.local()
+
+        if prometheus_client is None:
+            return
+
+        self.phase_seconds = prometheus_client.Histogram(
+            "papermill_api_phase_seconds", "Time spent in each phase of a notebook run",
+            ["phase", "notebook", "location"], buckets=BUCKETS)
+        self.errors = prometheus_client.Counter(
+            "papermill_api_errors_total", "Notebook runs that failed, by type of error",
+            ["type", "notebook", "location"])
+
+    @property
+    def enabled(self):
+        return prometheus_client is not None
+
+    # labels of the run on this thread, to be handed to threads that continue the run
+    def labels(self):
+        return getattr(self.local, "labels", ("", ""))
+
+    @contextmanager
+    def run_labels(self, notebook, location):
+        previous = self.labels()
+        self.local.labels = (notebook, location)
+        try:
+            yield
+        finally:
+            self.local.labels = previous
+
+    def observe(self, phase, seconds):
+        if self.enabled:
+            self.phase_seconds.labels(phase, *self.labels()).observe(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started)
+
+    # counts the run the error ended. An error is counted once, also when it passes several places that record it
+    def error(self, error):
+        if not self.enabled or getattr(error, "papermill_api_counted", False):
+            return
+        error.papermill_api_counted = True
+
+        if isinstance(error, PapermillExecutionError):
+            kind = "notebook"
+        elif isinstance(error, (ClientError, ParamValidationError)):
+            kind = type(error).__name__
+        else:
+            kind = "other"
+
+        self.errors.labels(kind, *self.labels()).inc()
+
+    # metrics in the Prometheus text format, collected from every gunicorn worker in multiprocess mode
+    def exposition(self):
+        if multiprocess_dir():
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+metrics = Metrics()
@@ -1,3 +1,4 @@
+import json
 from app import db as sadb
 
 class Template(sadb.Model):
@@ -34,4 +35,155 @@ class DefaultTemplate(sadb.Model):
         return self_dict
 
     def __repr__(self):
-        return f"DefaultTemplate('{self.id}', '{self.template_id}', '{self.template}')"
\ No newline at end of file
+        return f"DefaultTemplate('{self.id}', '{self.template_id}', '{self.template}')"
+
+class Job(sadb.Model):
+
+    id = sadb.Column(sadb.String(32), primary_key=True)
+    # one of 'queued', 'running', 'succeeded' or 'failed'
+    state = sadb.Column(sadb.String(20), nullable=False)
+    in_notebook = sadb.Column(sadb.TEXT, nullable=False)
+    out_notebook = sadb.Column(sadb.TEXT)
+    # json encoded notebook parameters, scraps and error
+    parameters = sadb.Column(sadb.TEXT)
+    result = sadb.Column(sadb.TEXT)
+    error = sadb.Column(sadb.TEXT)
+    status_code = sadb.Column(sadb.INT)
+    submitted_at = sadb.Column(sadb.DateTime, nullable=False)
+    started_at = sadb.Column(sadb.DateTime)
+    finished_at = sadb.Column(sadb.DateTime)
+
+    def as_dict(self):
+
+        duration = None
+        if self.started_at and self.finished_at:
+            duration = (self.finished_at - self.started_at).total_seconds()
+
+        self_dict = {
+                    "id": self.id,
+                    "state": self.state,
+                    "inNotebook": self.in_notebook,
+                    "outNotebook": self.out_notebook,
+                    "result": json.loads(self.result) if self.result else None,
+                    "error": json.loads(self.error) if self.error else None,
+                    "statusCode": self.status_code,
+                    "submitted": self.submitted_at.isoformat() if self.submitted_at else None,
+                    "started": self.started_at.isoformat() if self.started_at else None,
+                    "finished": self.finished_at.isoformat() if self.finished_at else None,
+                    "duration": duration,
+                }
+
+        return self_dict
+
+    def __repr__(self):
+        return f"Job('{self.id}', '{self.state}', '{self.in_notebook}')"
+
+
+# single row counting changes to Template and DefaultTemplate. Server processes compare it with the
+# version their template cache was filled at to know when to drop it.
+class TemplateVersion(sadb.Model):
+
+    id = sadb.Column(sadb.INT, primary_key=True)
+    version = sadb.Column(sadb.INT, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"TemplateVersion('{self.version}')"
+
+
+# output notebook written in the background after the run's response was sent
+class OutputNotebook(sadb.Model):
+
+    id = sadb.Column(sadb.String(32), primary_key=True)
+    path = sadb.Column(sadb.TEXT, nullable=False)
+    # one of 'pending', 'written' or 'failed'
+    state = sadb.Column(sadb.String(20), nullable=False)
+    attempts = sadb.Column(sadb.INT, nullable=False, default=0)
+    error = sadb.Column(sadb.TEXT)
+    created_at = sadb.Column(sadb.DateTime, nullable=False)
+    finished_at = sadb.Column(sadb.DateTime)
+
+    def as_dict(self):
+
+        self_dict = {
+                    "id": self.id,
+                    "path": self.path,
+                    "state": self.state,
+                    "attempts": self.attempts,
+                    "error": self.error,
+                    "created": self.created_at.isoformat() if self.created_at else None,
+                    "finished": self.finished_at.isoformat() if self.finished_at else None,
+                }
+
+        return self_dict
+
+    def __repr__(self):
+        return f"OutputNotebook('{self.id}', '{self.state}', '{self.path}')"
+
+
+# scraps of a run kept for reuse by runs of the same notebook version with the same parameters
+class CachedResult(sadb.Model):
+
+    key = sadb.Column(sadb.String(64), primary_key=True)
+    in_notebook = sadb.Column(sadb.TEXT, nullable=False, index=True)
+    result = sadb.Column(sadb.TEXT, nullable=False)
+    out_notebook = sadb.Column(sadb.TEXT)
+    hits = sadb.Column(sadb.INT, nullable=False, default=0)
+    created_at = sadb.Column(sadb.DateTime, nullable=False)
+    expires_at = sadb.Column(sadb.DateTime, nullable=False, index=True)
+    last_used_at = sadb.Column(sadb.DateTime, nullable=False, index=True)
+
+    def as_dict(self):
+
+        self_dict = {
+                    "inNotebook": self.in_notebook,
+                    "outNotebook": self.out_notebook,
+                    "hits": self.hits,
+                    "created": self.created_at.isoformat(),
+                    "expires": self.expires_at.isoformat(),
+                }
+
+        return self_dict
+
+    def __repr__(self):
+        return f"CachedResult('{self.key}', '{self.in_notebook}')"
+
+
+# async run waiting in the shared execution queue for any worker to claim it, see app.main.work_queue.
+# A claimed run is leased to its worker until lease_expires_at, which the worker keeps extending while
+# the notebook runs. Runs whose lease ran out are claimed again by another worker.
+class QueuedRun(sadb.Model):
+
+    # same as the id of the Job the run reports to
+    id = sadb.Column(sadb.String(32), sadb.ForeignKey('job.id'), primary_key=True)
+    # one of 'queued' or 'claimed'
+    state = sadb.Column(sadb.String(20), nullable=False, index=True)
+    priority = sadb.Column(sadb.INT, nullable=False, default=0)
+    in_notebook = sadb.Column(sadb.TEXT, nullable=False)
+    out_path = sadb.Column(sadb.TEXT, nullable=False)
+    out_notebook_name = sadb.Column(sadb.TEXT, nullable=False)
+    # json encoded notebook parameters and metric labels
+    parameters = sadb.Column(sadb.TEXT)
+    labels = sadb.Column(sadb.TEXT)
+    persist = sadb.Column(sadb.String(20), nullable=False, default="always")
+    user = sadb.Column(sadb.String(255))
+    worker = sadb.Column(sadb.String(255))
+    attempts = sadb.Column(sadb.INT, nullable=False, default=0)
+    enqueued_at = sadb.Column(sadb.DateTime, nullable=False)
+    lease_expires_at = sadb.Column(sadb.DateTime, index=True)
+
+    def as_dict(self):
+
+        self_dict = {
+                    "id": self.id,
+                    "state": self.state,
+                    "inNotebook": self.in_notebook,
+                    "worker": self.worker,
+                    "attempts": self.attempts,
+                    "enqueued": self.enqueued_at.isoformat(),
+                    "leaseExpires": self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+                }
+
+        return self_dict
+
+    def __repr__(self):
+        return f"QueuedRun('{self.id}', '{self.state}', '{self.worker}')"
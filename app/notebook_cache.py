@@ -0,0 +1,240 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import boto3
+from botocore.exceptions import ClientError
+from nbformat import NotebookNode
+from papermill.iorw import load_notebook_node
+
+logger = logging.getLogger(__name__)
+
+
+# splits 's3://bucket/path/to/key' into the bucket and the key
+def split_s3_path(path):
+    bucket, _, key = path.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+# on-disk cache of input notebooks read from S3. Notebook contents are stored under their sha256
+# so processes sharing the directory never write different contents to the same file. A small json
+# record per bucket/key holds the ETag the contents were downloaded with. Entries younger than
+# NOTEBOOK_CACHE_MAX_AGE seconds are used as is, older ones are revalidated with a conditional GET
+# which only transfers the notebook if its ETag changed.
+class NotebookCache:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.max_bytes = 0
+        self.max_age = 0
+        self.entries = {}
+        self.counters = {"hits": 0, "misses": 0, "revalidations": 0, "bytes_saved": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        self._client = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("NOTEBOOK_CACHE", False)
+        self.directory = app.config.get("NOTEBOOK_CACHE_DIR")
+        self.max_bytes = app.config.get("NOTEBOOK_CACHE_MAX_MB", 512) * 1024 * 1024
+        self.max_age = app.config.get("NOTEBOOK_CACHE_MAX_AGE", 0)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client("s3")
+        return self._client
+
+    # returns a local path holding the current contents of the S3 notebook
+    def fetch(self, path):
+        bucket, key = split_s3_path(path)
+        name = hashlib.sha256((bucket + "/" + key).encode()).hexdigest()
+        entry_path = os.path.join(self.directory, name + ".json")
+
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None:
+            entry = self._load_entry(entry_path)
+        if entry is not None and not os.path.exists(entry["file"]):
+            entry = None
+
+        now = time.time()
+
+        if entry is not None and now - entry["validated"] < self.max_age:
+            return self._hit(name, entry)
+
+        kwargs = {"IfNoneMatch": entry["etag"]} if entry is not None else {}
+        try:
+            obj = self.client.get_object(Bucket=bucket, Key=key, **kwargs)
+        except ClientError as error:
+            if entry is not None and error.response["Error"]["Code"] in ("304", "NotModified"):
+                entry = dict(entry, validated=now)
+                self._save_entry(name, entry_path, entry)
+                with self.lock:
+                    self.counters["revalidations"] += 1
+                return self._hit(name, entry)
+            raise
+
+        body = obj["Body"].read()
+        content_path = os.path.join(self.directory, hashlib.sha256(body).hexdigest() + ".ipynb")
+        if not os.path.exists(content_path):
+            self._write(content_path, body)
+
+        entry = {"etag": obj["ETag"], "file": content_path, "size": len(body), "validated": now}
+        self._save_entry(name, entry_path, entry)
+
+        with self.lock:
+            self.counters["misses"] += 1
+
+        self._evict(keep=content_path)
+
+        return content_path
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["enabled"] = self.enabled
+        stats["entries"] = len(self.entries)
+        return stats
+
+    def _hit(self, name, entry):
+        # the modification time of a content file is its last use for eviction
+        try:
+            os.utime(entry["file"])
+        except OSError:
+            pass
+
+        with self.lock:
+            self.entries[name] = entry
+            self.counters["hits"] += 1
+            self.counters["bytes_saved"] += entry["size"]
+
+        return entry["file"]
+
+    def _load_entry(self, entry_path):
+        try:
+            with open(entry_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_entry(self, name, entry_path, entry):
+        with self.lock:
+            self.entries[name] = entry
+        self._write(entry_path, json.dumps(entry).encode())
+
+    # writes to a temporary file first so other processes never read a partial file
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # removes the least recently used notebooks until the cache fits in NOTEBOOK_CACHE_MAX_MB
+    def _evict(self, keep=None):
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".ipynb"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self.lock:
+                self.counters["evictions"] += 1
+
+
+# copy of a notebook that can be executed and parameterized without changing the original.
+# Executing a notebook replaces the outputs list of each cell and writes to its metadata, but
+# never changes sources, attachments or the old outputs themselves, so those are shared.
+def copy_notebook(nb):
+    nb_copy = NotebookNode(nb)
+    nb_copy.metadata = copy.deepcopy(nb.metadata)
+    nb_copy.cells = []
+
+    for cell in nb.cells:
+        cell_copy = NotebookNode(cell)
+        cell_copy.metadata = copy.deepcopy(cell.metadata)
+        if "outputs" in cell:
+            cell_copy.outputs = list(cell.outputs)
+        nb_copy.cells.append(cell_copy)
+
+    return nb_copy
+
+
+# process-local cache of parsed notebooks so a run does not parse the same json again. Entries are
+# keyed by local path and checked against a version, by default the file's modification time and size.
+# Callers get a copy_notebook of the cached notebook.
+class ParsedNotebookCache:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.max_bytes = 0
+        self.notebooks = OrderedDict()
+        self.total_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get("PARSED_NOTEBOOK_CACHE_MAX_MB", 0) * 1024 * 1024
+        self.enabled = self.max_bytes > 0
+
+    def load(self, path, version=None):
+        if not self.enabled:
+            return load_notebook_node(path)
+
+        stat = os.stat(path)
+        version = (version or stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            cached = self.notebooks.get(path)
+            if cached is not None and cached[0] == version:
+                self.notebooks.move_to_end(path)
+                self.counters["hits"] += 1
+                return copy_notebook(cached[1])
+
+        nb = load_notebook_node(path)
+
+        with self.lock:
+            self.counters["misses"] += 1
+            previous = self.notebooks.pop(path, None)
+            if previous is not None:
+                self.total_bytes -= previous[0][1]
+            if stat.st_size <= self.max_bytes:
+                self.notebooks[path] = (version, nb)
+                self.total_bytes += stat.st_size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted_version, _) = self.notebooks.popitem(last=False)
+                self.total_bytes -= evicted_version[1]
+                self.counters["evictions"] += 1
+
+        return copy_notebook(nb)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.notebooks)
+            stats["bytes"] = self.total_bytes
+        stats["enabled"] = self.enabled
+        return stats
@@ -0,0 +1,190 @@
+import heapq
+import json
+import logging
+import dateutil.parser
+import nbformat
+import scrapbook as sb
+from papermill.engines import NBConvertEngine, NotebookExecutionManager, papermill_engines
+from papermill.preprocess import PapermillExecutePreprocessor
+from papermill.utils import merge_kwargs, remove_args
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+# seconds the kernel spent executing a cell, from the start time in the metadata of its execute reply
+def kernel_busy(reply):
+    started = reply.get("metadata", {}).get("started")
+    finished = reply.get("header", {}).get("date")
+    if not started or not finished:
+        return None
+    try:
+        return (finished - dateutil.parser.parse(started)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+# resident memory of the kernel process in bytes, None without psutil or a running kernel
+def kernel_rss(km):
+    if psutil is None or km is None or not getattr(km, "has_kernel", False):
+        return None
+    try:
+        return psutil.Process(km.kernel.pid).memory_info().rss
+    except (psutil.Error, AttributeError):
+        return None
+
+
+# preprocessor that reports how long the kernel was busy with each cell and its memory use after it
+# to the execution manager
+class ObservedPreprocessor(PapermillExecutePreprocessor):
+
+    def preprocess(self, nb_man, resources, km=None):
+        self.nb_man = nb_man
+        return super().preprocess(nb_man, resources, km=km)
+
+    def run_cell(self, cell, cell_index=0, store_history=True):
+        reply, outputs = super().run_cell(cell, cell_index, store_history)
+
+        # only measured for runs someone observes
+        report = getattr(self.nb_man, "cell_resources", None)
+        if report is not None and getattr(self.nb_man, "observer", None) is not None:
+            report(cell_index, kernel_busy(reply), kernel_rss(self.km))
+
+        return reply, outputs
+
+
+# execution manager that tells an observer about each code cell as papermill runs it.
+# observer is called with the name of the event and a dictionary describing it, or is None.
+# on_kernel_ready is called once when the first code cell starts, without describing any cell.
+class ObservedExecutionManager(NotebookExecutionManager):
+
+    # same as papermill's manager without its deep copy of the notebook. Runs are handed a copy_notebook
+    # of the parsed notebook already, which is theirs to change.
+    def __init__(self, observer, nb, output_path=None, log_output=False, progress_bar=True, on_kernel_ready=None):
+        self.nb = nb
+        self.output_path = output_path
+        self.log_output = log_output
+        self.start_time = None
+        self.end_time = None
+        self.pbar = None
+        if progress_bar:
+            from tqdm.auto import tqdm
+            self.pbar = tqdm(total=len(self.nb.cells), unit="cell", desc="Executing")
+        self.observer = observer
+        self.on_kernel_ready = on_kernel_ready
+        self.resources = {}
+
+    def cell_resources(self, cell_index, kernel_busy, kernel_rss):
+        if self.observer is not None:
+            self.resources[cell_index] = (kernel_busy, kernel_rss)
+
+    def cell_start(self, cell, cell_index=None, **kwargs):
+        super().cell_start(cell, cell_index=cell_index, **kwargs)
+        if self.on_kernel_ready is not None and cell.cell_type == "code":
+            on_kernel_ready, self.on_kernel_ready = self.on_kernel_ready, None
+            on_kernel_ready()
+        if self.observer is not None and cell.cell_type == "code":
+            self.observer("cell_start", {"cell": cell_index,
+                                         "startTime": cell.metadata.papermill["start_time"]})
+
+    def cell_complete(self, cell, cell_index=None, **kwargs):
+        super().cell_complete(cell, cell_index=cell_index, **kwargs)
+        if self.observer is None or cell.cell_type != "code":
+            return
+
+        busy, rss = self.resources.pop(cell_index, (None, None))
+        self.observer("cell_complete", {"cell": cell_index,
+                                        "status": cell.metadata.papermill["status"],
+                                        "tags": cell.metadata.get("tags", []),
+                                        "duration": cell.metadata.papermill.get("duration"),
+                                        "kernelBusy": busy,
+                                        "kernelRss": rss,
+                                        "outputBytes": len(json.dumps(cell.get("outputs", [])))})
+
+        # scraps glued by this cell, read from its outputs alone
+        scraps = sb.read_notebook(nbformat.v4.new_notebook(cells=[cell])).scraps.data_dict
+        for name, data in scraps.items():
+            self.observer("scrap", {"cell": cell_index, "name": name, "data": data})
+
+
+# nbconvert engine that takes an 'observer' argument and executes the notebook it is given rather than a copy
+class ObservedEngine(NBConvertEngine):
+
+    preprocessor_class = ObservedPreprocessor
+
+    # same arguments as papermill's NBConvertEngine, returns the preprocessor and the resources to run it with
+    @classmethod
+    def preprocessor(cls, kernel_name, log_output=False, stdout_file=None, stderr_file=None, start_timeout=60,
+                     execution_timeout=None, **kwargs):
+
+        safe_kwargs = remove_args(['timeout', 'startup_timeout'], **kwargs)
+
+        final_kwargs = merge_kwargs(
+            safe_kwargs,
+            timeout=execution_timeout if execution_timeout else kwargs.get('timeout'),
+            startup_timeout=start_timeout,
+            kernel_name=kernel_name,
+            log=logger,
+            log_output=log_output,
+            stdout_file=stdout_file,
+            stderr_file=stderr_file,
+        )
+
+        return cls.preprocessor_class(**final_kwargs), safe_kwargs
+
+    @classmethod
+    def execute_managed_notebook(cls, nb_man, kernel_name, **kwargs):
+        preprocessor, resources = cls.preprocessor(kernel_name, **kwargs)
+        preprocessor.preprocess(nb_man, resources)
+
+    @classmethod
+    def execute_notebook(cls, nb, kernel_name, output_path=None, progress_bar=True, log_output=False,
+                         observer=None, on_kernel_ready=None, **kwargs):
+
+        # same as papermill's Engine.execute_notebook with the observed manager
+        nb_man = ObservedExecutionManager(observer, nb, output_path=output_path, progress_bar=progress_bar,
+                                          log_output=log_output, on_kernel_ready=on_kernel_ready)
+
+        nb_man.notebook_start()
+        try:
+            nb = cls.execute_managed_notebook(nb_man, kernel_name, log_output=log_output, **kwargs)
+            if nb:
+                nb_man.nb = nb
+        finally:
+            nb_man.cleanup_pbar()
+            nb_man.notebook_complete()
+
+        return nb_man.nb
+
+
+# per cell profile of a run, built from the 'cell_complete' events. The events are passed on to observer.
+class RunProfile:
+
+    def __init__(self, observer=None):
+        self.cells = []
+        self.observer = observer
+
+    def observe(self, event, data):
+        if event == "cell_complete":
+            self.cells.append(data)
+        if self.observer is not None:
+            self.observer(event, data)
+
+    # the cells, the top slowest of them, and the peak memory use of the kernel seen after any cell
+    def as_dict(self, top):
+        rss = [cell["kernelRss"] for cell in self.cells if cell["kernelRss"] is not None]
+        return {
+            "cells": self.cells,
+            "slowest": heapq.nlargest(top, self.cells, key=lambda cell: cell["duration"] or 0),
+            "duration": sum(cell["duration"] or 0 for cell in self.cells),
+            "kernelBusy": sum(cell["kernelBusy"] or 0 for cell in self.cells),
+            "outputBytes": sum(cell["outputBytes"] for cell in self.cells),
+            "peakKernelRss": max(rss) if rss else None
+        }
+
+
+papermill_engines.register("observed", ObservedEngine)
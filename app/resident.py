@@ -0,0 +1,274 @@
+import atexit
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from papermill.engines import NotebookExecutionManager, papermill_engines
+from .kernels import PooledKernelManager
+from .progress import ObservedEngine, ObservedPreprocessor
+
+logger = logging.getLogger(__name__)
+
+# cells with this tag run once when a resident kernel starts rather than on every run
+SETUP_TAG = "setup"
+
+
+# whether the notebook opted in to resident kernels with {"papermill_api": {"resident": true}} in its metadata
+def is_resident(nb):
+    return bool(nb.metadata.get("papermill_api", {}).get("resident", False))
+
+
+def setup_cells(nb):
+    return [cell for cell in nb.cells if SETUP_TAG in cell.metadata.get("tags", [])]
+
+
+# identifies the contents of a notebook, its kernel and the sources of its cells. Resident kernels of
+# a notebook whose contents changed are replaced.
+def notebook_version(nb):
+    digest = hashlib.sha256(nb.metadata.kernelspec.name.encode())
+    for cell in nb.cells:
+        digest.update(cell.cell_type.encode() + b"\0" + cell.source.encode() + b"\0")
+    return digest.hexdigest()
+
+
+# preprocessor that leaves the cells in 'skip' alone, they already ran in the resident kernel
+class ResidentPreprocessor(ObservedPreprocessor):
+
+    skip = ()
+
+    def preprocess_cell(self, cell, resources, cell_index, store_history=True):
+        if cell_index in self.skip:
+            return cell, resources
+        return super().preprocess_cell(cell, resources, cell_index, store_history)
+
+
+# a kernel that ran the setup cells of a notebook, with the executed setup cells
+class ResidentKernel:
+
+    def __init__(self, km, cells, setup_seconds):
+        self.km = km
+        self.cells = cells
+        self.setup_seconds = setup_seconds
+        self.runs = 0
+
+
+# the resident kernels of one version of a notebook. stale is set when the notebook changed or was
+# reloaded, its kernels are shut down rather than used again.
+class ResidentNotebook:
+
+    def __init__(self, key, version):
+        self.key = key
+        self.version = version
+        self.idle = []
+        self.kernels = 0
+        self.runs = 0
+        self.setup_seconds = None
+        self.stale = False
+
+
+# kernels kept running for notebooks that opted in, each of which ran the notebook's setup cells once.
+# A run leases one, runs the remaining cells against the state the setup cells left and returns it
+# without resetting it. Each notebook has at most RESIDENT_KERNELS kernels and the kernels of the least
+# recently used notebook are shut down once more than RESIDENT_MAX_NOTEBOOKS notebooks have them.
+# Registered with papermill as the 'resident' engine.
+class ResidentKernels:
+
+    def __init__(self, app=None):
+        self.notebooks = OrderedDict()
+        self.condition = threading.Condition()
+        self.size = 0
+        self.max_notebooks = 0
+        self.registered = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = app.config.get("RESIDENT_KERNELS", 0)
+        self.max_notebooks = app.config.get("RESIDENT_MAX_NOTEBOOKS", 8)
+
+        ResidentEngine.kernels = self
+        papermill_engines.register("resident", ResidentEngine)
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    # leases a kernel of this version of the notebook, starting one and running the setup cells with
+    # setup(km) if none is idle. setup returns the executed setup cells.
+    @contextmanager
+    def lease(self, key, version, kernel_name, setup):
+        notebook, kernel = self._acquire(key, version)
+
+        if kernel is None:
+            kernel = self._start(notebook, kernel_name, setup)
+
+        try:
+            yield kernel
+        except BaseException:
+            # a failed or interrupted execution may leave the kernel busy, do not reuse it
+            self._release(notebook, kernel, healthy=False)
+            raise
+        else:
+            self._release(notebook, kernel)
+
+    # shuts down the kernels of the notebook, or of every notebook, so the next run starts over.
+    # returns the notebooks that had kernels.
+    def reload(self, key=None):
+        with self.condition:
+            keys = [key] if key is not None else list(self.notebooks)
+            dropped = [self.notebooks.pop(each) for each in keys if each in self.notebooks]
+            kernels = [self._drop(notebook) for notebook in dropped]
+            self.condition.notify_all()
+
+        for idle in kernels:
+            for kernel in idle:
+                self._shutdown(kernel)
+
+        return [notebook.key for notebook in dropped]
+
+    def stats(self):
+        with self.condition:
+            return [{"notebook": notebook.key,
+                     "version": notebook.version,
+                     "kernels": notebook.kernels,
+                     "idle": len(notebook.idle),
+                     "runs": notebook.runs,
+                     "setupSeconds": notebook.setup_seconds} for notebook in self.notebooks.values()]
+
+    def shutdown(self):
+        self.reload()
+
+    def _acquire(self, key, version):
+        evicted = []
+
+        with self.condition:
+            notebook = self.notebooks.get(key)
+            if notebook is not None and notebook.version != version:
+                logger.info("Notebook %s changed, replacing its resident kernels", key)
+                evicted.extend(self._drop(self.notebooks.pop(key)))
+                notebook = None
+
+            if notebook is None:
+                if not self.registered:
+                    atexit.register(self.shutdown)
+                    self.registered = True
+                notebook = ResidentNotebook(key, version)
+                self.notebooks[key] = notebook
+                while len(self.notebooks) > self.max_notebooks:
+                    evicted.extend(self._drop(self.notebooks.popitem(last=False)[1]))
+
+            self.notebooks.move_to_end(key)
+
+            while True:
+                if notebook.idle:
+                    kernel = notebook.idle.pop()
+                    break
+                if notebook.kernels < self.size:
+                    notebook.kernels += 1
+                    kernel = None
+                    break
+                self.condition.wait()
+
+        for each in evicted:
+            self._shutdown(each)
+
+        if kernel is not None and not kernel.km.is_alive():
+            self._release(notebook, kernel, healthy=False)
+            return self._acquire(key, version)
+
+        return notebook, kernel
+
+    def _start(self, notebook, kernel_name, setup):
+        km = PooledKernelManager(kernel_name=kernel_name)
+        started = time.time()
+        try:
+            km.start_kernel()
+            cells = setup(km)
+        except BaseException:
+            self._release(notebook, ResidentKernel(km, [], None), healthy=False)
+            raise
+
+        kernel = ResidentKernel(km, cells, time.time() - started)
+        with self.condition:
+            notebook.setup_seconds = kernel.setup_seconds
+        return kernel
+
+    def _release(self, notebook, kernel, healthy=True):
+        kernel.km.stop_clients()
+
+        with self.condition:
+            if healthy:
+                kernel.runs += 1
+                notebook.runs += 1
+            keep = healthy and not notebook.stale
+            if keep:
+                notebook.idle.append(kernel)
+            else:
+                notebook.kernels -= 1
+            self.condition.notify_all()
+
+        if not keep:
+            self._shutdown(kernel)
+
+    # marks the notebook stale and returns its idle kernels to shut down, leased ones are shut down
+    # when they are returned
+    def _drop(self, notebook):
+        notebook.stale = True
+        idle = notebook.idle
+        notebook.kernels -= len(idle)
+        notebook.idle = []
+        return idle
+
+    def _shutdown(self, kernel):
+        try:
+            if kernel.km.has_kernel:
+                kernel.km.shutdown_kernel(now=True)
+        except Exception:
+            logger.exception("Failed shutting down resident kernel")
+
+
+# papermill engine running notebooks on resident kernels, takes resident=(key, version) to identify the
+# notebook. The setup cells of the notebook are not run again, they get the outputs they had when the
+# kernel ran them.
+class ResidentEngine(ObservedEngine):
+
+    kernels = None
+    preprocessor_class = ResidentPreprocessor
+
+    @classmethod
+    def execute_managed_notebook(cls, nb_man, kernel_name, resident=None, **kwargs):
+        key, version = resident
+        preprocessor, resources = cls.preprocessor(kernel_name, **kwargs)
+
+        def setup(km):
+            return cls.run_setup(km, nb_man.nb, kernel_name, **kwargs)
+
+        with cls.kernels.lease(key, version, kernel_name, setup) as kernel:
+            indexes = [index for index, cell in enumerate(nb_man.nb.cells)
+                       if SETUP_TAG in cell.metadata.get("tags", [])]
+            for index, cell in zip(indexes, kernel.cells):
+                nb_man.nb.cells[index] = copy.deepcopy(cell)
+
+            preprocessor.skip = set(indexes)
+            preprocessor.preprocess(nb_man, resources, km=kernel.km)
+
+    # runs the setup cells of the notebook in a new kernel and returns them executed. Raises
+    # PapermillExecutionError if one of them fails.
+    @classmethod
+    def run_setup(cls, km, nb, kernel_name, **kwargs):
+        from app.main.runner import raise_for_errors
+
+        # the execution manager copies the notebook, so the cells are not copied here
+        setup_nb = copy.copy(nb)
+        setup_nb.cells = setup_cells(nb)
+
+        nb_man = NotebookExecutionManager(setup_nb, progress_bar=False)
+        preprocessor, resources = cls.preprocessor(kernel_name, **kwargs)
+        preprocessor.preprocess(nb_man, resources, km=km)
+
+        raise_for_errors(nb_man.nb, None)
+        return nb_man.nb.cells
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+import time
+from jupyter_client import KernelManager
+
+logger = logging.getLogger(__name__)
+
+
+# the WARMUP_MANIFEST setting, a path to a json file or the json itself, like
+# {"notebooks": ["s3://bucket/home/user/report.ipynb"], "kernels": ["python3"]}
+def load_manifest(setting):
+    if not setting:
+        return None
+
+    if setting.lstrip().startswith("{"):
+        manifest = json.loads(setting)
+    else:
+        with open(setting) as f:
+            manifest = json.load(f)
+
+    return {"notebooks": list(manifest.get("notebooks", [])), "kernels": list(manifest.get("kernels", []))}
+
+
+# gets a server process hot before it takes traffic: fetches and parses the notebooks of the warm-up
+# manifest, starts the resident kernels of resident notebooks, and fills the kernel pools of their
+# kernelspecs and of the listed ones. Without a kernel pool a kernel is started and shut down once so
+# its imports are at least in the disk cache. Runs on a background thread of each gunicorn worker, see
+# post_worker_init in gunicorn.conf.py. Each process that is done leaves a file named after its pid in
+# WARMUP_STATE_DIR and the host is ready once WARMUP_PROCESSES processes did.
+class Warmup:
+
+    def __init__(self, app=None):
+        self.manifest = None
+        self.state_dir = None
+        self.processes = 1
+        self.timeout = 300
+        self.state = "pending"
+        self.started_at = None
+        self.seconds = None
+        self.notebooks = {}
+        self.kernels = {}
+        self.lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.manifest = load_manifest(app.config.get("WARMUP_MANIFEST"))
+        self.state_dir = app.config.get("WARMUP_STATE_DIR")
+        self.processes = app.config.get("WARMUP_PROCESSES", 1)
+        self.timeout = app.config.get("WARMUP_TIMEOUT", 300)
+
+    @property
+    def enabled(self):
+        return self.manifest is not None
+
+    def start(self, app):
+        if not self.enabled:
+            return None
+        with self.lock:
+            if self.state != "pending":
+                return None
+            self.state = "running"
+
+        thread = threading.Thread(target=self.run, args=(app,), name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    # warms up the process, items that fail are logged and reported by status without holding it back.
+    # A warm-up that fails altogether ends 'failed', which does not hold the process back either.
+    def run(self, app):
+        with self.lock:
+            self.state = "running"
+            self.started_at = time.time()
+        deadline = self.started_at + self.timeout
+        state = "failed"
+
+        try:
+            with app.app_context():
+                kernel_names = list(self.manifest["kernels"])
+                for path in self.manifest["notebooks"]:
+                    kernel_name = self._warm_notebook(path)
+                    if kernel_name and kernel_name not in kernel_names:
+                        kernel_names.append(kernel_name)
+
+                for kernel_name in kernel_names:
+                    self._warm_kernel(kernel_name, deadline)
+            state = "done"
+        except Exception:
+            logger.exception("Warm-up failed")
+        finally:
+            with self.lock:
+                self.state = state
+                self.seconds = time.time() - self.started_at
+            logger.info("Warm-up %s in %.1f seconds", state, self.seconds)
+
+        if self.state_dir:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(os.path.join(self.state_dir, str(os.getpid())), "w") as f:
+                f.write(str(self.seconds))
+
+    # ready to take traffic: nothing to warm up, or this process and enough others on the host are warm
+    @property
+    def ready(self):
+        if not self.enabled:
+            return True
+        if self.state not in ("done", "failed"):
+            return False
+        if not self.state_dir:
+            return True
+        return len(os.listdir(self.state_dir)) >= self.processes
+
+    def status(self):
+        with self.lock:
+            status = {"ready": self.ready,
+                      "state": self.state if self.enabled else "disabled",
+                      "seconds": self.seconds,
+                      "notebooks": dict(self.notebooks),
+                      "kernels": dict(self.kernels)}
+        if self.enabled and self.state_dir and os.path.isdir(self.state_dir):
+            status["warmProcesses"] = len(os.listdir(self.state_dir))
+            status["processes"] = self.processes
+        return status
+
+    # returns the kernelspec of the notebook, None if it could not be loaded
+    def _warm_notebook(self, path):
+        from app import resident, resident_kernels
+        from app.main import runner
+        from app.resident import ResidentEngine
+
+        try:
+            nb = runner.load_notebook(path)
+            kernel_name = nb.metadata.kernelspec.name
+
+            if resident_kernels.enabled and resident.is_resident(nb):
+                def setup(km):
+                    return ResidentEngine.run_setup(km, nb, kernel_name)
+
+                with resident_kernels.lease(path, resident.notebook_version(nb), kernel_name, setup):
+                    pass
+        except Exception as error:
+            logger.exception("Failed warming up notebook %s", path)
+            self._record(self.notebooks, path, str(error))
+            return None
+
+        self._record(self.notebooks, path, "ok")
+        return kernel_name
+
+    def _warm_kernel(self, kernel_name, deadline):
+        from app import kernel_pools
+
+        try:
+            if kernel_pools.enabled:
+                pool = kernel_pools.get_pool(kernel_name)
+                while pool.stats()["idle"] < pool.size:
+                    if time.time() > deadline:
+                        raise TimeoutError("Kernel pool not filled in time")
+                    time.sleep(0.1)
+            else:
+                km = KernelManager(kernel_name=kernel_name)
+                km.start_kernel()
+                try:
+                    kc = km.client()
+                    kc.start_channels()
+                    kc.wait_for_ready(timeout=max(deadline - time.time(), 1))
+                    kc.stop_channels()
+                finally:
+                    km.shutdown_kernel(now=True)
+        except Exception as error:
+            logger.exception("Failed warming up kernel %s", kernel_name)
+            self._record(self.kernels, kernel_name, str(error))
+            return
+
+        self._record(self.kernels, kernel_name, "ok")
+
+    def _record(self, results, name, outcome):
+        with self.lock:
+            results[name] = outcome
@@ -0,0 +1,238 @@
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import boto3
+import nbformat
+from .notebooks import synthetic_notebooks
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BUCKET = "papermill-api-benchmarks"
+# S3 notebooks sit under <bucket>/<home>/<user>/<path> like get_path expects
+S3_KEY = "home/benchmark/notebooks"
+
+
+# in-process S3 stand-in. moto patches botocore, so every boto3 client made while it is active,
+# including papermill's, talks to it instead of AWS.
+@contextmanager
+def s3_stand_in():
+    try:
+        from moto import mock_aws as mock
+    except ImportError:
+        try:
+            from moto import mock_s3 as mock
+        except ImportError:
+            raise RuntimeError("the benchmarks need moto, see benchmarks/requirements.txt")
+
+    # never reach a real account, whatever the environment has
+    os.environ.update({"AWS_ACCESS_KEY_ID": "benchmark", "AWS_SECRET_ACCESS_KEY": "benchmark",
+                       "AWS_DEFAULT_REGION": "us-east-1"})
+    os.environ.pop("AWS_SESSION_TOKEN", None)
+
+    with mock():
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        yield
+
+
+# highest resident memory of this process and its children, which include the kernels
+class MemorySampler(threading.Thread):
+
+    def __init__(self, interval=0.1):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        if psutil is None:
+            return
+        process = psutil.Process()
+        while not self.done.is_set():
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak = max(self.peak, rss)
+            self.done.wait(self.interval)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+        # without psutil only the largest single process is known
+        if psutil is None:
+            self.peak = 1024 * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return self.peak
+
+
+# nearest-rank percentile of sorted values
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+# requests of each benchmark. A scenario is called with the number of the request and returns the
+# method, path and json body to send.
+def scenarios(names, local_dir, out_dir):
+    available = {}
+
+    for name in names:
+        s3_notebook = "{}/{}/{}.ipynb".format(BUCKET, S3_KEY, name)
+
+        available["run_get_" + name] = lambda index, nb=s3_notebook: (
+            "GET", "/run/?location=s3&notebook={}&num=1".format(nb), None)
+        available["run_post_" + name] = lambda index, nb=s3_notebook: (
+            "POST", "/run/?location=s3&notebook=" + nb, {"parameters": {"num": 1}})
+
+    trivial = os.path.join(local_dir, "trivial.ipynb")
+
+    available["run_template_trivial"] = lambda index: (
+        "POST", "/run/?location=local&notebook=" + trivial, {"parameters": {"num": 1}, "template": "benchmark"})
+    available["batch_trivial"] = lambda index: (
+        "POST", "/run/batch?location=local&notebook=" + trivial,
+        {"grid": {"num": [1, 2, 3, 4]}, "outputNotebookPath": out_dir})
+    available["template_list"] = lambda index: ("GET", "/template/", None)
+    available["template_default"] = lambda index: ("GET", "/template/?default=true", None)
+    available["template_post"] = lambda index: (
+        "POST", "/template/", {"name": "benchmark_{}_{}".format(time.time(), index), "content": "{{args.year}}/"})
+
+    # template runs while other requests create templates, which shows whether lookups stall on database locks
+    available["run_template_with_writes"] = lambda index: (
+        available["run_template_trivial"] if index % 2 else available["template_post"])(index)
+
+    return available
+
+
+def send(client, request):
+    method, path, body = request
+    started = time.time()
+    if method == "GET":
+        response = client.get(path)
+    else:
+        response = client.open(path, method=method, data=json.dumps(body), content_type="application/json")
+    # streamed responses such as batch runs are only done once read
+    response.get_data()
+    return time.time() - started, response.status_code
+
+
+# sends 'requests' requests of one scenario from 'concurrency' threads and summarizes them
+def measure(app, scenario, concurrency, requests, warmup):
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client
+
+    for index in range(warmup):
+        send(app.test_client(), scenario(index))
+
+    sampler = MemorySampler()
+    sampler.start()
+    started = time.time()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda index: send(client(), scenario(warmup + index)), range(requests)))
+
+    elapsed = time.time() - started
+    peak = sampler.stop()
+
+    latencies = sorted(latency for latency, status in results)
+    statuses = {}
+    for latency, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "statusCodes": statuses,
+        "latency": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "max": latencies[-1] if latencies else None
+        },
+        "rps": requests / elapsed if elapsed else None,
+        "seconds": elapsed,
+        "peakRssBytes": peak
+    }
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# runs the selected scenarios, all of them if none are given, at each concurrency and returns the report.
+# progress is called with a line describing each measurement as it starts.
+def run_benchmarks(selected=(), concurrencies=(1, 4), requests=10, warmup=1, config_name="production",
+                   progress=None):
+    from app import create_app, db
+
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    with tempfile.TemporaryDirectory() as local_dir, s3_stand_in():
+
+        notebooks = synthetic_notebooks()
+        s3 = boto3.client("s3")
+        for name, nb in notebooks.items():
+            content = nbformat.writes(nb)
+            s3.put_object(Bucket=BUCKET, Key="{}/{}.ipynb".format(S3_KEY, name), Body=content.encode())
+            with open(os.path.join(local_dir, name + ".ipynb"), "w") as f:
+                f.write(content)
+
+        out_dir = os.path.join(local_dir, "out")
+
+        app = create_app(config_name)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(local_dir, "benchmark.sqlite")
+
+        with app.app_context():
+            db.create_all()
+            # output notebooks of template runs go to <local_dir>/out/<year>/
+            app.test_client().post("/template/", data=json.dumps({"name": "benchmark",
+                                                                  "content": out_dir + "/{{args.year}}/"}))
+
+            available = scenarios(notebooks, local_dir, out_dir)
+            unknown = set(selected) - set(available)
+            if unknown:
+                raise ValueError("unknown scenarios: " + ", ".join(sorted(unknown)) +
+                                 ", choose from " + ", ".join(sorted(available)))
+
+            results = []
+            for name in selected or sorted(available):
+                for concurrency in concurrencies:
+                    if progress is not None:
+                        progress("{} with {} concurrent requests".format(name, concurrency))
+                    result = measure(app, available[name], concurrency, requests, warmup)
+                    result["scenario"] = name
+                    results.append(result)
+
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "startedAt": started_at,
+        "settings": {"requests": requests, "warmup": warmup, "concurrency": list(concurrencies),
+                     "config": config_name},
+        "results": results
+    }
@@ -0,0 +1,39 @@
+import nbformat
+
+# parameters cell shared by the synthetic notebooks, 'num' is what the benchmarks vary
+PARAMETERS = "num = 1\nsize = 1000"
+
+
+def notebook(*sources):
+    cells = [nbformat.v4.new_code_cell("import scrapbook as sb")]
+
+    parameters = nbformat.v4.new_code_cell(PARAMETERS)
+    parameters.metadata["tags"] = ["parameters"]
+    cells.append(parameters)
+
+    # parameters of GET runs are strings
+    cells.append(nbformat.v4.new_code_cell("num, size = int(num), int(size)"))
+
+    cells.extend(nbformat.v4.new_code_cell(source) for source in sources)
+
+    nb = nbformat.v4.new_notebook(cells=cells)
+    nb.metadata.kernelspec = {"name": "python3", "language": "python", "display_name": "Python 3"}
+    nb.metadata.language_info = {"name": "python"}
+    return nb
+
+
+# notebooks the benchmarks run, by name:
+#   trivial       glues its parameter back
+#   cpu_heavy     spends a second or so of CPU in the kernel
+#   large_output  prints about 'size' kilobytes of output
+#   many_scraps   glues 'size' / 10 scraps
+def synthetic_notebooks():
+    return {
+        "trivial": notebook("sb.glue('num', num)"),
+        "cpu_heavy": notebook("total = sum(i * i for i in range(num * 3000000))",
+                              "sb.glue('total', total)"),
+        "large_output": notebook("for line in range(size):\n    print('x' * 1023)",
+                                 "sb.glue('lines', size)"),
+        "many_scraps": notebook("for index in range(size // 10):\n    sb.glue('scrap_%d' % index, index)",
+                                "sb.glue('num', num)"),
+    }
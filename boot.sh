@@ -1,3 +1,12 @@
 #!/bin/sh
 flask deploy
-exec gunicorn -b :5000 papermill_api:app
\ No newline at end of file
+# metrics of all gunicorn workers are collected from this directory, it is emptied on every start
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/papermill-api-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# workers that finished warming up are recorded in this directory, it is emptied on every start
+export WARMUP_STATE_DIR=${WARMUP_STATE_DIR:-/tmp/papermill-api-warmup}
+rm -rf "$WARMUP_STATE_DIR" && mkdir -p "$WARMUP_STATE_DIR"
+# execution slots shared by the gunicorn workers are locks on files in this directory, it is emptied on every start
+export ADMISSION_DIR=${ADMISSION_DIR:-/tmp/papermill-api-admission}
+rm -rf "$ADMISSION_DIR" && mkdir -p "$ADMISSION_DIR"
+exec gunicorn -c gunicorn.conf.py -b :5000 papermill_api:app
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+
+try:
+    from prometheus_client import multiprocess
+except ImportError:
+    multiprocess = None
+
+# worker processes, and how each of them serves requests. 'gthread' workers serve up to GUNICORN_THREADS requests
+# at once on threads, so one process can have many runs in flight that are waiting on kernels or S3. 'sync'
+# workers serve one request at a time.
+workers = int(os.environ.get("GUNICORN_WORKERS") or 1)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or "sync"
+threads = int(os.environ.get("GUNICORN_THREADS") or 1)
+# sync workers are restarted when a request takes longer than this, gthread workers only when they hang
+timeout = int(os.environ.get("GUNICORN_TIMEOUT") or 30)
+
+
+# warms up each worker in the background with the notebooks and kernels of WARMUP_MANIFEST, see app.warmup
+def post_worker_init(worker):
+    from app import warmup
+    warmup.start(worker.wsgi)
+
+
+# drops the live metrics of a worker that exited so /metrics only reports running workers, and its warm-up
+# state so /ready waits for the worker replacing it
+def child_exit(server, worker):
+    if multiprocess is not None and os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
+
+    if os.environ.get("WARMUP_STATE_DIR"):
+        try:
+            os.remove(os.path.join(os.environ["WARMUP_STATE_DIR"], str(worker.pid)))
+        except OSError:
+            pass
@@ -1,7 +1,10 @@
+import json
 import os
+import signal
 from flask_migrate import Migrate, upgrade
-from app import create_app, db
-from app.models import DefaultTemplate, Template
+from app import create_app, db, warmup
+from app.models import DefaultTemplate, Template, TemplateVersion, Job, OutputNotebook, \
+    CachedResult, QueuedRun
 import click
 
 
@@ -11,7 +14,9 @@ migrate = Migrate(app, db)
 
 @app.shell_context_processor
 def make_shell_context():
-    return dict(db=db, DefaultTemplate=DefaultTemplate, Template=Template)
+    return dict(db=db, DefaultTemplate=DefaultTemplate, Template=Template,
+                TemplateVersion=TemplateVersion, Job=Job, OutputNotebook=OutputNotebook,
+                CachedResult=CachedResult, QueuedRun=QueuedRun)
 
 
 @app.cli.command()
@@ -29,5 +34,46 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+@app.cli.command()
+@click.option('--concurrency', '-c', type=int, help='Notebooks run at once, QUEUE_WORKER_CONCURRENCY if not given.')
+@click.option('--name', help='Name the worker claims runs under, host:pid:random if not given.')
+def worker(concurrency, name):
+    """Run async jobs from the shared execution queue (JOB_QUEUE=database)."""
+    from app.main.work_queue import Worker
+    queue_worker = Worker(app, concurrency or app.config['QUEUE_WORKER_CONCURRENCY'], name)
+
+    # finishes the runs in flight before exiting
+    def stop(signum, frame):
+        click.echo('Worker {} stopping'.format(queue_worker.name), err=True)
+        queue_worker.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    if warmup.enabled:
+        warmup.run(app)
+    click.echo('Worker {} started'.format(queue_worker.name), err=True)
+    queue_worker.run()
+
+
+@app.cli.command()
+@click.option('--scenario', '-s', multiple=True, help='Scenario to run, all of them if not given. Repeatable.')
+@click.option('--concurrency', '-c', multiple=True, type=int, help='Concurrent requests, 1 and 4 if not given. '
+                                                                   'Repeatable.')
+@click.option('--requests', '-n', default=10, help='Requests sent per scenario and concurrency.')
+@click.option('--warmup', default=1, help='Requests sent before measuring.')
+@click.option('--output', '-o', type=click.Path(), help='File to write the report to instead of stdout.')
+def benchmark(scenario, concurrency, requests, warmup, output):
+    """Benchmark the API against a local S3 stand-in and report latencies as json."""
+    from benchmarks.harness import run_benchmarks
+    report = run_benchmarks(scenario, concurrency or (1, 4), requests, warmup,
+                            progress=lambda line: click.echo(line, err=True))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        click.echo(json.dumps(report, indent=4))
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0')
\ No newline at end of file
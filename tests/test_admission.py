@@ -0,0 +1,108 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from app import create_app
+from app.main.admission import AdmissionController
+from app.main.errors import InvalidUsage
+
+
+class AdmissionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app.config.update(EXECUTION_SLOTS=1, USER_EXECUTION_SLOTS=0, ADMISSION_QUEUE_SIZE=1,
+                               ADMISSION_DIR=self.directory)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.admission = AdmissionController()
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def wait_in_thread(self, order, name, user=None, priority=0):
+        waiting = self.admission.stats()["waiting"]
+
+        def wait():
+            with self.app.app_context():
+                with self.admission.slot(user, priority, max_wait=5):
+                    order.append(name)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        while self.admission.stats()["waiting"] == waiting:
+            time.sleep(0.01)
+        return thread
+
+    def test_full_queue_and_timeout(self):
+        self.admission.acquire(max_wait=1)
+        thread = self.wait_in_thread([], "queued")
+
+        with self.assertRaises(InvalidUsage) as rejected:
+            self.admission.acquire(max_wait=1)
+        self.assertEqual(rejected.exception.status_code, 429)
+        self.assertIn("Retry-After", rejected.exception.headers)
+
+        self.admission.release()
+        thread.join()
+
+        self.admission.acquire(max_wait=1)
+        with self.assertRaises(InvalidUsage) as timed_out:
+            self.admission.acquire(max_wait=0.05)
+        self.assertEqual(timed_out.exception.status_code, 503)
+        self.assertEqual(self.admission.stats()["timedOut"], 1)
+
+    def test_priority(self):
+        self.app.config.update(ADMISSION_QUEUE_SIZE=5)
+        order = []
+
+        self.admission.acquire(max_wait=1)
+        low = self.wait_in_thread(order, "low", priority=0)
+        high = self.wait_in_thread(order, "high", priority=5)
+
+        self.admission.release()
+        low.join()
+        high.join()
+        self.assertEqual(order, ["high", "low"])
+
+    def test_user_limit(self):
+        self.app.config.update(EXECUTION_SLOTS=2, USER_EXECUTION_SLOTS=1, ADMISSION_QUEUE_SIZE=5)
+        order = []
+
+        self.admission.acquire("alice", max_wait=1)
+        alice = self.wait_in_thread(order, "alice", "alice")
+
+        # the free slot goes to another user although alice asked first
+        self.admission.acquire("bob", max_wait=0.05)
+        self.assertEqual(self.admission.stats()["runningByUser"], {"alice": 1, "bob": 1})
+
+        self.admission.release("bob")
+        self.assertEqual(order, [])
+        self.admission.release("alice")
+        alice.join()
+        self.assertEqual(order, ["alice"])
+
+    def test_slots_are_shared_by_the_processes_of_a_host(self):
+        self.app.config.update(EXECUTION_SLOTS=2, USER_EXECUTION_SLOTS=1)
+        # a controller of another gunicorn worker, locks of separate open files exclude each other like processes
+        other = AdmissionController()
+
+        self.admission.acquire("alice", max_wait=1)
+        with self.assertRaises(InvalidUsage):
+            other.acquire("alice", max_wait=0.1)
+
+        other.acquire("bob", max_wait=1)
+        with self.assertRaises(InvalidUsage):
+            other.acquire("carol", max_wait=0.1)
+
+        # the waiter notices the slot another process released
+        thread = self.wait_in_thread([], "carol", "carol")
+        other.release("bob")
+        thread.join()
+        self.assertEqual(self.admission.stats()["admitted"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
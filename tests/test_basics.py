@@ -26,6 +26,18 @@ class BasicsTestCase(unittest.TestCase):
     def test_app_is_testing(self):
         self.assertTrue(current_app.config['TESTING'])
 
+    def test_kernel_pool_disabled_by_default(self):
+        from app import kernel_pools
+        self.assertIsNone(kernel_pools.engine_name)
+
+    def test_job_not_found(self):
+        response = self.client.get("/jobs/missing")
+        self.assertEqual(response.status_code, 404)
+
+    def test_output_not_found(self):
+        response = self.client.get("/outputs/missing")
+        self.assertEqual(response.status_code, 404)
+
     def test_homepage(self):
         response = self.client.get("/")
         self.assertEqual(response.status_code, 200)
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import nbformat
+from app import create_app, db
+from app.main.admission import admission
+from app.main.batch import parameter_sets
+from app.main.errors import InvalidUsage
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def test_parameter_list(self):
+        sets = parameter_sets({"parameters": [{"a": 1}, {"a": 2}]}, 10)
+        self.assertEqual(sets, [{"a": 1}, {"a": 2}])
+
+    def test_grid(self):
+        sets = parameter_sets({"grid": {"a": [1, 2], "b": ["x", "y"]}}, 10)
+        self.assertEqual(sets, [{"a": 1, "b": "x"}, {"a": 1, "b": "y"}, {"a": 2, "b": "x"}, {"a": 2, "b": "y"}])
+
+    def test_limits(self):
+        with self.assertRaises(InvalidUsage):
+            parameter_sets({"grid": {"a": [1, 2, 3]}}, 2)
+        with self.assertRaises(InvalidUsage):
+            parameter_sets({"grid": {"a": 1}}, 2)
+        with self.assertRaises(InvalidUsage):
+            parameter_sets({"parameters": [{}], "grid": {}}, 2)
+
+
+class BatchAdmissionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app.config.update(EXECUTION_SLOTS=1, BATCH_PROCESSES=2,
+                               ADMISSION_DIR=os.path.join(self.directory, "admission"))
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.notebook = os.path.join(self.directory, "nb.ipynb")
+        parameters = nbformat.v4.new_code_cell("num = 1")
+        parameters.metadata.tags = ["parameters"]
+        nb = nbformat.v4.new_notebook(cells=[parameters,
+                                             nbformat.v4.new_code_cell("import scrapbook as sb\n"
+                                                                       "sb.glue('number', int(num))")])
+        nb.metadata.kernelspec = {"name": "python3", "display_name": "Python 3", "language": "python"}
+        nbformat.write(nb, self.notebook)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_waits_for_execution_slot(self):
+        body = {"parameters": [{"num": 1}, {"num": 2}], "outputNotebookPath": os.path.join(self.directory, "out")}
+        responses = []
+
+        def post():
+            response = self.app.test_client().post("/run/batch?location=local&notebook=" + self.notebook,
+                                                   data=json.dumps(body))
+            responses.append((response.status_code, response.get_data(as_text=True)))
+
+        # every slot is taken, so the batch waits rather than starting its worker processes
+        admission.acquire()
+        try:
+            thread = threading.Thread(target=post)
+            thread.start()
+            for _ in range(100):
+                if admission.stats()["waiting"]:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(admission.stats()["waiting"], 1)
+            self.assertEqual(responses, [])
+        finally:
+            admission.release()
+        thread.join(120)
+
+        status, lines = responses[0]
+        self.assertEqual(status, 200)
+        items = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual(sorted(item["result"]["number"] for item in items), [1, 2])
+
+        # slots are given back by the callbacks of the finished sets
+        for _ in range(20):
+            if not admission.stats()["running"]:
+                break
+            time.sleep(0.05)
+        self.assertEqual(admission.stats()["running"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
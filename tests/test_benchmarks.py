@@ -0,0 +1,30 @@
+import unittest
+from benchmarks.harness import percentile, scenarios
+from benchmarks.notebooks import synthetic_notebooks
+
+
+class BenchmarksTestCase(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([3], 0.99), 3)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_notebooks_are_parameterized(self):
+        for name, nb in synthetic_notebooks().items():
+            tags = [cell.metadata.get("tags", []) for cell in nb.cells]
+            self.assertIn(["parameters"], tags, name)
+
+    def test_scenarios(self):
+        available = scenarios(synthetic_notebooks(), "/tmp/benchmarks", "/tmp/benchmarks/out")
+        method, path, body = available["run_post_trivial"](0)
+        self.assertEqual(method, "POST")
+        self.assertIn("location=s3", path)
+        self.assertEqual(body, {"parameters": {"num": 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from app import create_app
+from app.main.coalesce import Coalescer
+
+
+class CoalesceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app.config["COALESCE_DIR"] = self.directory
+        self.coalescer = Coalescer()
+        self.key = self.coalescer.key("/tmp/nb.ipynb", {"b": 2, "a": 1})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_in_thread(self, execute, outcomes):
+        def target():
+            with self.app.app_context():
+                try:
+                    outcomes.append(self.coalescer.run(self.key, execute))
+                except Exception as error:
+                    outcomes.append(("error", error))
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def test_key_ignores_parameter_order(self):
+        self.assertEqual(self.key, self.coalescer.key("/tmp/../tmp/nb.ipynb", {"a": 1, "b": 2}))
+        self.assertNotEqual(self.key, self.coalescer.key("/tmp/nb.ipynb", {"a": 1, "b": 3}))
+
+    def test_prune_keeps_held_locks(self):
+        paths = [os.path.join(self.directory, name) for name in ("held.lock", "free.lock", "free.json")]
+        for path in paths:
+            open(path, "w").close()
+            os.utime(path, (0, 0))
+
+        # a leader executing for longer than the maximum age
+        with open(paths[0], "a") as held:
+            fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.coalescer.prune(self.directory, 60)
+
+        self.assertEqual(os.listdir(self.directory), ["held.lock"])
+
+    def test_followers_share_the_leaders_scraps(self):
+        started = threading.Event()
+        release = threading.Event()
+        executions = []
+
+        def execute():
+            executions.append(1)
+            started.set()
+            release.wait(5)
+            return "out.ipynb", None, {"number": 1}
+
+        outcomes = []
+        leader = self.run_in_thread(execute, outcomes)
+        started.wait(5)
+        followers = [self.run_in_thread(execute, outcomes) for _ in range(3)]
+        # lets the followers reach the lock the leader holds
+        time.sleep(0.5)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(sorted(role for role, _ in outcomes), ["follower", "follower", "follower", "leader"])
+        self.assertIn(("follower", {"number": 1}), outcomes)
+
+    def test_follower_leads_when_the_leader_fails(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise RuntimeError("kernel died")
+
+        outcomes = []
+        leader = self.run_in_thread(fail, outcomes)
+        started.wait(5)
+        follower = self.run_in_thread(lambda: ("out.ipynb", None, {"number": 2}), outcomes)
+        time.sleep(0.5)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(outcomes[0][0], "error")
+        self.assertEqual(outcomes[1], ("leader", ("out.ipynb", None, {"number": 2})))
+
+    def test_runs_one_after_another_both_lead(self):
+        with self.app.app_context():
+            self.assertEqual(self.coalescer.run(self.key, lambda: (None, None, {}))[0], "leader")
+            self.assertEqual(self.coalescer.run(self.key, lambda: (None, None, {}))[0], "leader")
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import types
+import unittest
+from app import create_app, db
+
+# stands in for pg8000 so an engine for Postgres can be created without the driver, it never connects
+fake_pg8000 = types.ModuleType("pg8000")
+fake_pg8000.paramstyle = "format"
+fake_pg8000.__version__ = "1.16.6"
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sqlite_pragmas(self):
+        app = create_app('testing')
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(self.directory, "test.sqlite")
+
+        with app.app_context():
+            engine = db.get_engine(app)
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute("PRAGMA journal_mode").scalar(), "wal")
+                self.assertEqual(connection.execute("PRAGMA busy_timeout").scalar(), 30000)
+                # NORMAL
+                self.assertEqual(connection.execute("PRAGMA synchronous").scalar(), 1)
+            engine.dispose()
+
+    def test_server_database_pool(self):
+        app = create_app('testing')
+        app.config.update(SQLALCHEMY_DATABASE_URI="postgresql+pg8000://papermill@localhost/papermill",
+                          SQLALCHEMY_ENGINE_OPTIONS={"module": fake_pg8000},
+                          DATABASE_POOL_SIZE=3, DATABASE_MAX_OVERFLOW=7, DATABASE_POOL_RECYCLE=600)
+
+        with app.app_context():
+            engine = db.get_engine(app)
+
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._max_overflow, 7)
+        self.assertEqual(engine.pool._recycle, 600)
+        self.assertTrue(engine.pool._pre_ping)
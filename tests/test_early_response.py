@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import nbformat
+from app import create_app, db
+from app.main import early_response
+from app.models import Job
+
+
+class EarlyResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.finish = threading.Event()
+
+    def tearDown(self):
+        self.finish.set()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # a run that reports the given events, then waits for self.finish and glues 'late'
+    def execute(self, events, error=None):
+        def execute(in_notebook, out_path, out_notebook_name, parameters, observer=None, persist="always",
+                    source=None):
+            for event, data in events:
+                observer(event, data)
+            self.finish.wait(5)
+            if error is not None:
+                raise error
+            return "out.ipynb", None, {"statusCode": 201, "late": 1}
+
+        return mock.patch.object(early_response.runner, "execute", side_effect=execute)
+
+    def run_notebook(self):
+        job = early_response.start_job("nb.ipynb", {})
+        return job["id"], early_response.run(self.app, job["id"], "nb.ipynb", "out", "out.ipynb", {})
+
+    def wait_for_job(self, job_id):
+        for _ in range(50):
+            db.session.remove()
+            job = Job.query.get(job_id)
+            if job.state != "running":
+                return job
+            time.sleep(0.1)
+        self.fail("job did not finish")
+
+    def test_responds_at_response_ready_scrap(self):
+        events = [("scrap", {"cell": 1, "name": "statusCode", "data": 201}),
+                  ("scrap", {"cell": 2, "name": "response_ready", "data": True})]
+
+        with self.execute(events):
+            job_id, (responded, scraps) = self.run_notebook()
+            self.assertTrue(responded)
+            self.assertEqual(scraps, {"statusCode": 201, "response_ready": True})
+            self.assertEqual(Job.query.get(job_id).state, "running")
+
+            self.finish.set()
+            job = self.wait_for_job(job_id)
+
+        self.assertEqual(job.state, "succeeded")
+        self.assertEqual(json.loads(job.result), {"statusCode": 201, "late": 1})
+
+    def test_responds_after_tagged_cell(self):
+        events = [("cell_complete", {"cell": 1, "tags": ["respond"]}),
+                  ("scrap", {"cell": 1, "name": "answer", "data": 42}),
+                  ("cell_start", {"cell": 2})]
+
+        with self.execute(events):
+            job_id, (responded, scraps) = self.run_notebook()
+            self.finish.set()
+            self.wait_for_job(job_id)
+
+        self.assertTrue(responded)
+        self.assertEqual(scraps, {"answer": 42})
+
+    def test_runs_to_the_end_without_respond_point(self):
+        events = [("scrap", {"cell": 1, "name": "response_ready", "data": False})]
+        self.finish.set()
+
+        with self.execute(events):
+            job_id, (responded, outcome) = self.run_notebook()
+
+        self.assertFalse(responded)
+        self.assertEqual(outcome[2], {"statusCode": 201, "late": 1})
+
+    def test_failure_before_respond_point_raises(self):
+        self.finish.set()
+
+        with self.execute([], error=RuntimeError("kernel died")):
+            with self.assertRaises(RuntimeError):
+                self.run_notebook()
+
+        db.session.remove()
+        self.assertEqual(Job.query.filter_by(state="failed").count(), 1)
+
+    # url of a run of a notebook that glues 'response_ready' and sets the given papermill_api metadata
+    def notebook_url(self, metadata):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        notebook = os.path.join(directory, "nb.ipynb")
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell("import scrapbook as sb\n"
+                                                                       "sb.glue('response_ready', True)")])
+        nb.metadata.kernelspec = {"name": "python3", "display_name": "Python 3", "language": "python"}
+        nb.metadata.papermill_api = metadata
+        nbformat.write(nb, notebook)
+        return "/run/?location=local&notebook={}&outputNotebookPath={}".format(notebook,
+                                                                               os.path.join(directory, "out"))
+
+    def test_notebook_is_loaded_once(self):
+        url = self.notebook_url({"respond_early": True})
+
+        with mock.patch.object(early_response.runner, "load_notebook",
+                               wraps=early_response.runner.load_notebook) as load_notebook:
+            response = self.app.test_client().get(url)
+            body = json.loads(response.get_data(as_text=True))
+            self.wait_for_job(body["job"]["id"])
+
+        self.assertEqual(body["result"], {"response_ready": True})
+        self.assertEqual(load_notebook.call_count, 1)
+
+    def test_options_left_to_the_notebook(self):
+        url = self.notebook_url({"respond_early": True, "cache_ttl": 60})
+        client = self.app.test_client()
+
+        response = client.get(url + "&cache=false")
+        body = json.loads(response.get_data(as_text=True))
+        self.wait_for_job(body["job"]["id"])
+        self.assertNotIn("X-Result-Cache", response.headers)
+
+        response = client.get(url + "&respondEarly=false")
+        body = json.loads(response.get_data(as_text=True))
+        self.assertNotIn("job", body)
+        self.assertEqual(response.headers["X-Result-Cache"], "miss")
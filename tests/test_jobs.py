@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import nbformat
+from app import create_app, db
+from app.models import Job
+
+
+class JobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.directory = tempfile.mkdtemp()
+        self.notebook = os.path.join(self.directory, "nb.ipynb")
+        parameters = nbformat.v4.new_code_cell("num = 1")
+        parameters.metadata.tags = ["parameters"]
+        nb = nbformat.v4.new_notebook(cells=[parameters,
+                                             nbformat.v4.new_code_cell("import scrapbook as sb\n"
+                                                                       "sb.glue('number', int(num))")])
+        nb.metadata.kernelspec = {"name": "python3", "display_name": "Python 3", "language": "python"}
+        nbformat.write(nb, self.notebook)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def url(self, query=""):
+        return "/run/?location=local&notebook={}&outputNotebookPath={}{}".format(
+            self.notebook, os.path.join(self.directory, "out"), query)
+
+    def wait_for_job(self, response):
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.get_data(as_text=True))["id"]
+
+        for _ in range(300):
+            job = json.loads(self.client.get("/jobs/" + job_id).get_data(as_text=True))
+            if job["state"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.1)
+        self.fail("job did not finish")
+
+    def test_async_get(self):
+        job = self.wait_for_job(self.client.get(self.url("&num=3&async=true")))
+
+        self.assertEqual(job["state"], "succeeded", job.get("error"))
+        self.assertEqual(job["result"]["number"], 3)
+
+        # query args other than the options added for runs reach the notebook as they always did
+        parameters = json.loads(Job.query.get(job["id"]).parameters)
+        self.assertEqual(parameters["location"], "local")
+        self.assertNotIn("async", parameters)
+
+    def test_async_response_is_compact_unless_pretty(self):
+        compact = self.client.get(self.url("&async=true"))
+        pretty = self.client.get(self.url("&async=true&pretty=true"))
+        self.wait_for_job(compact)
+        self.wait_for_job(pretty)
+
+        self.assertNotIn("\n", compact.get_data(as_text=True))
+        self.assertIn('\n  "', pretty.get_data(as_text=True))
+
+    def test_async_post(self):
+        body = {"parameters": {"num": 3}, "outputNotebookPath": os.path.join(self.directory, "out")}
+        response = self.client.post("/run/?location=local&async=true&notebook=" + self.notebook,
+                                    data=json.dumps(body))
+        job = self.wait_for_job(response)
+
+        self.assertEqual(job["state"], "succeeded", job.get("error"))
+        self.assertEqual(job["result"]["number"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
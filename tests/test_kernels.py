@@ -0,0 +1,148 @@
+import time
+import unittest
+from app.kernels import KernelPool
+
+
+class FakeKernelManager:
+
+    def __init__(self):
+        self.uses = 0
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def stop_clients(self):
+        pass
+
+    def memory_mb(self):
+        return 0
+
+
+# pool that starts, resets and shuts down fake kernels and records which ones it did
+class FakeKernelPool(KernelPool):
+
+    def __init__(self, size, max_uses=0):
+        self.started = []
+        self.reset = []
+        self.shut_down = []
+        super().__init__("python3", size, max_uses, 0, 1)
+
+    def _start_kernel(self):
+        km = FakeKernelManager()
+        self.started.append(km)
+        return km
+
+    def _reset_kernel(self, km):
+        self.reset.append(km)
+        return True
+
+    def _shutdown_kernel(self, km):
+        self.shut_down.append(km)
+
+
+class KernelPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.shutdown()
+
+    def pool(self, size, max_uses=0):
+        pool = FakeKernelPool(size, max_uses)
+        self.pools.append(pool)
+        self.wait_until(lambda: pool.stats()["idle"] == size)
+        return pool
+
+    def wait_until(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("pool did not get there")
+
+    # returns the kernel and waits for the pool to take it back
+    def release(self, pool, km, healthy=True):
+        pool.release(km, healthy)
+        self.wait_until(lambda: km in pool.idle or km in pool.shut_down)
+
+    def test_lease_reuses_kernel(self):
+        pool = self.pool(1)
+
+        km = pool.acquire()
+        # the leased kernel still counts toward the size of the pool
+        time.sleep(0.1)
+        self.assertEqual(len(pool.started), 1)
+
+        self.release(pool, km)
+        self.assertIs(pool.acquire(), km)
+
+        self.assertEqual(km.uses, 2)
+        self.assertEqual(pool.reset, [km])
+        self.assertEqual(len(pool.started), 1)
+
+    def test_recycled_after_max_uses(self):
+        pool = self.pool(1, max_uses=2)
+
+        km = pool.acquire()
+        self.release(pool, km)
+        self.assertIs(pool.acquire(), km)
+        self.release(pool, km)
+
+        self.assertEqual(pool.shut_down, [km])
+        self.wait_until(lambda: pool.stats()["idle"] == 1)
+        self.assertIsNot(pool.acquire(), km)
+
+    def test_unhealthy_kernel_is_retired(self):
+        pool = self.pool(1)
+
+        km = pool.acquire()
+        self.release(pool, km, healthy=False)
+
+        self.assertEqual(pool.shut_down, [km])
+        self.assertEqual(pool.reset, [])
+        self.wait_until(lambda: pool.stats()["idle"] == 1)
+        self.assertIsNot(pool.acquire(), km)
+
+    def test_dead_idle_kernel_is_replaced(self):
+        pool = self.pool(1)
+        dead = pool.started[0]
+        dead.alive = False
+
+        km = pool.acquire()
+
+        self.assertIsNot(km, dead)
+        self.assertEqual(km.uses, 1)
+        self.wait_until(lambda: pool.shut_down == [dead])
+
+    def test_leased_again_until_max_uses(self):
+        pool = self.pool(1, max_uses=3)
+        km = pool.started[0]
+
+        for _ in range(3):
+            self.assertIs(pool.acquire(), km)
+            self.release(pool, km)
+
+        self.assertEqual(pool.reset, [km, km])
+        self.assertEqual(pool.shut_down, [km])
+        self.wait_until(lambda: pool.stats()["idle"] == 1)
+        self.assertEqual(len(pool.started), 2)
+        self.assertIsNot(pool.acquire(), km)
+
+    def test_kernels_past_the_size_are_shut_down(self):
+        pool = self.pool(1)
+
+        # the second lease finds the pool empty and starts a kernel of its own
+        leased = [pool.acquire(), pool.acquire()]
+        for km in leased:
+            self.release(pool, km)
+
+        self.assertEqual(pool.stats()["idle"], 1)
+        self.assertEqual(len(pool.started), 2)
+        self.assertEqual(len(pool.shut_down), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
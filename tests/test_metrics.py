@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+from botocore.exceptions import ClientError
+from app import create_app, notebook_cache
+from app.metrics import metrics
+
+
+@unittest.skipIf(not metrics.enabled, "prometheus_client is not installed")
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_phases_and_errors(self):
+        with metrics.run_labels("metrics_test.ipynb", "local"):
+            with metrics.phase("execute"):
+                pass
+            metrics.error(ValueError())
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+
+        body = response.data.decode()
+        self.assertIn('papermill_api_phase_seconds_count{location="local",notebook="metrics_test.ipynb",'
+                      'phase="execute"} 1.0', body)
+        self.assertIn('papermill_api_errors_total{location="local",notebook="metrics_test.ipynb",type="other"} 1.0',
+                      body)
+
+    def test_missing_notebook_is_an_error(self):
+        notebook = "s3://bucket/home/user/dir/metrics_missing.ipynb"
+        missing = ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."},
+                               "ResponseMetadata": {"HTTPStatusCode": 404}}, "GetObject")
+        with mock.patch.multiple(notebook_cache, enabled=True, fetch=mock.Mock(side_effect=missing)):
+            response = self.client.get("/run/?location=s3&notebook={}&outputNotebookPath={}".format(
+                notebook, "s3://bucket/home/user/dir/out/"))
+        self.assertEqual(response.status_code, 404)
+
+        body = self.client.get("/metrics").data.decode()
+        counter = 'papermill_api_errors_total{{location="s3",notebook="{}",type="ClientError"}} 1.0'.format(notebook)
+        self.assertIn(counter, body)
+
+
+if __name__ == '__main__':
+    unittest.main()
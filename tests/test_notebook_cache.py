@@ -0,0 +1,175 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from botocore.exceptions import ClientError
+import nbformat
+from app import create_app, notebook_cache
+from app.main import runner
+from app.main.runner import InputNotebook
+from app.notebook_cache import NotebookCache, ParsedNotebookCache, copy_notebook, split_s3_path
+
+
+class FakeS3:
+
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.gets += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."},
+                               "ResponseMetadata": {"HTTPStatusCode": 404}}, "GetObject")
+        body, etag = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+class NotebookCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.s3 = FakeS3()
+        self.cache = NotebookCache()
+        self.cache.enabled = True
+        self.cache.directory = self.directory
+        self.cache.max_bytes = 1024 * 1024
+        self.cache._client = self.s3
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_split_s3_path(self):
+        self.assertEqual(split_s3_path("s3://bucket/home/user/nb.ipynb"), ("bucket", "home/user/nb.ipynb"))
+
+    def test_revalidates_with_etag(self):
+        self.s3.objects[("bucket", "nb.ipynb")] = (b"{}", '"v1"')
+
+        first = self.cache.fetch("s3://bucket/nb.ipynb")
+        second = self.cache.fetch("s3://bucket/nb.ipynb")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["bytes_saved"], 2)
+
+        self.s3.objects[("bucket", "nb.ipynb")] = (b'{"a": 1}', '"v2"')
+        third = self.cache.fetch("s3://bucket/nb.ipynb")
+
+        self.assertNotEqual(first, third)
+        with open(third, "rb") as f:
+            self.assertEqual(f.read(), b'{"a": 1}')
+
+    def test_fresh_entries_skip_s3(self):
+        self.cache.max_age = 60
+        self.s3.objects[("bucket", "nb.ipynb")] = (b"{}", '"v1"')
+
+        self.cache.fetch("s3://bucket/nb.ipynb")
+        self.cache.fetch("s3://bucket/nb.ipynb")
+
+        self.assertEqual(self.s3.gets, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 15
+        self.s3.objects[("bucket", "a.ipynb")] = (b"a" * 10, '"a"')
+        self.s3.objects[("bucket", "b.ipynb")] = (b"b" * 10, '"b"')
+
+        a = self.cache.fetch("s3://bucket/a.ipynb")
+        b = self.cache.fetch("s3://bucket/b.ipynb")
+
+        self.assertFalse(os.path.exists(a))
+        self.assertTrue(os.path.exists(b))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+class ParsedNotebookCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "nb.ipynb")
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell("x = 1", outputs=[
+            nbformat.v4.new_output("stream", text="1")])])
+        nbformat.write(nb, self.path)
+        self.cache = ParsedNotebookCache()
+        self.cache.enabled = True
+        self.cache.max_bytes = 1024 * 1024
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_copy_does_not_change_original(self):
+        nb = self.cache.load(self.path)
+        nb.cells[0].outputs = []
+        nb.cells[0].metadata["papermill"] = {"status": "running"}
+        nb.cells.append(nbformat.v4.new_code_cell("y = 2"))
+        nb.metadata.papermill["parameters"] = {"y": 2}
+
+        again = self.cache.load(self.path)
+
+        self.assertEqual(len(again.cells), 1)
+        self.assertEqual(len(again.cells[0].outputs), 1)
+        self.assertEqual(again.cells[0].metadata["papermill"], {})
+        self.assertEqual(again.metadata.papermill["parameters"], {})
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_copy_shares_sources(self):
+        nb = self.cache.load(self.path)
+        nb_copy = copy_notebook(nb)
+        self.assertIs(nb_copy.cells[0].outputs[0], nb.cells[0].outputs[0])
+
+    def test_reparses_changed_file(self):
+        self.cache.load(self.path, version="a")
+        self.cache.load(self.path, version="b")
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+
+class InputNotebookTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.directory = tempfile.mkdtemp()
+        self.s3 = FakeS3()
+        nb = nbformat.v4.new_notebook(metadata={"papermill_api": {"cache_ttl": 60}})
+        self.s3.objects[("bucket", "nb.ipynb")] = (nbformat.writes(nb).encode(), '"v1"')
+
+    def tearDown(self):
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_run_fetches_once(self):
+        with mock.patch.multiple(notebook_cache, enabled=True, directory=self.directory, max_age=0,
+                                 _client=self.s3):
+            source = InputNotebook("s3://bucket/nb.ipynb")
+            self.assertEqual(source.api_metadata(), {"cache_ttl": 60})
+            self.assertEqual(len(source.version()), 64)
+            nb = source.take()
+
+        self.assertEqual(nb.metadata.papermill_api, {"cache_ttl": 60})
+        self.assertEqual(self.s3.gets, 1)
+
+    def test_metadata_without_the_cache(self):
+        nb = nbformat.v4.new_notebook(metadata={"papermill_api": {"respond_early": True}})
+        with mock.patch.object(notebook_cache, "enabled", False), \
+                mock.patch.object(runner, "load_notebook_node", return_value=nb) as load_notebook_node:
+            source = InputNotebook("s3://bucket/nb.ipynb")
+            self.assertEqual(source.api_metadata(), {"respond_early": True})
+            self.assertIs(source.take(), nb)
+
+        self.assertEqual(load_notebook_node.call_count, 1)
+
+    def test_missing_notebook_is_not_found(self):
+        with mock.patch.multiple(notebook_cache, enabled=True, directory=self.directory, max_age=0,
+                                 _client=self.s3):
+            response = self.app.test_client().get("/run/?location=s3&notebook=s3://bucket/home/user/dir/missing.ipynb"
+                                                  "&outputNotebookPath=s3://bucket/home/user/dir/out/")
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.get_data(as_text=True))["Code"], "NoSuchKey")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+import nbformat
+from app import create_app, db
+from app.main import outputs
+from app.main.outputs import OutputWriter
+from app.models import OutputNotebook
+
+
+class OutputWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.nb = nbformat.v4.new_notebook()
+        self.writer = OutputWriter()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    # writes a pending output notebook on this thread
+    def write(self):
+        record = OutputNotebook(id="output", path="out.ipynb", state="pending", attempts=0,
+                                created_at=datetime.utcnow())
+        db.session.add(record)
+        db.session.commit()
+
+        self.writer.write(self.app, record.id, self.nb, record.path)
+        return self.output(record.id)
+
+    def output(self, record_id):
+        db.session.remove()
+        return OutputNotebook.query.get(record_id)
+
+    def wait_for_output(self, record_id):
+        for _ in range(50):
+            output = self.output(record_id)
+            if output.state != "pending":
+                return output
+            time.sleep(0.1)
+        self.fail("output was not written")
+
+    def test_writes_in_background(self):
+        with mock.patch.object(outputs, "write_notebook") as write_notebook:
+            record = self.writer.submit(self.app, self.nb, "out.ipynb")
+            self.assertEqual(record.state, "pending")
+            output = self.wait_for_output(record.id)
+
+        write_notebook.assert_called_once_with(self.nb, "out.ipynb", 8 * 1024 * 1024)
+        self.assertEqual(output.state, "written")
+        self.assertEqual(output.attempts, 1)
+        self.assertIsNotNone(output.finished_at)
+
+    def test_retries_failed_writes(self):
+        errors = [IOError("slow down"), IOError("slow down"), None]
+
+        with mock.patch.object(outputs, "write_notebook", side_effect=errors) as write_notebook, \
+                mock.patch.object(outputs.time, "sleep") as sleep:
+            output = self.write()
+
+        self.assertEqual(write_notebook.call_count, 3)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2])
+        self.assertEqual(output.state, "written")
+        self.assertEqual(output.attempts, 3)
+        self.assertIsNone(output.error)
+
+    def test_fails_after_retries(self):
+        self.app.config["OUTPUT_WRITER_RETRIES"] = 1
+
+        with mock.patch.object(outputs, "write_notebook", side_effect=IOError("access denied")), \
+                mock.patch.object(outputs.time, "sleep"):
+            output = self.write()
+
+        self.assertEqual(output.state, "failed")
+        self.assertEqual(output.attempts, 2)
+        self.assertEqual(output.error, "access denied")
+        self.assertIsNotNone(output.finished_at)
+
+    def test_writes_before_responding_when_queue_is_full(self):
+        # no threads drain the queue, so the second notebook does not fit
+        self.app.config.update(OUTPUT_WRITER_THREADS=0, OUTPUT_WRITER_QUEUE_SIZE=1)
+
+        with mock.patch.object(outputs, "write_notebook") as write_notebook:
+            queued = self.writer.submit(self.app, self.nb, "queued.ipynb")
+            written = self.writer.submit(self.app, self.nb, "written.ipynb")
+
+        write_notebook.assert_called_once_with(self.nb, "written.ipynb", 8 * 1024 * 1024)
+        self.assertEqual(written.state, "written")
+        self.assertEqual(self.output(queued.id).state, "pending")
+
+        response = self.app.test_client().get("/outputs/" + written.id)
+        self.assertEqual(response.get_json()["state"], "written")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import nbformat
+from app.resident import ResidentKernel, ResidentKernels, is_resident, notebook_version, setup_cells
+
+
+class FakeKernelManager:
+    has_kernel = False
+
+    def is_alive(self):
+        return True
+
+    def stop_clients(self):
+        pass
+
+
+def notebook():
+    setup = nbformat.v4.new_code_cell("import pickle")
+    setup.metadata.tags = ["setup"]
+    nb = nbformat.v4.new_notebook(cells=[setup, nbformat.v4.new_code_cell("result = 1")])
+    nb.metadata.kernelspec = {"name": "python3", "language": "python"}
+    nb.metadata.papermill_api = {"resident": True}
+    return nb
+
+
+class ResidentTestCase(unittest.TestCase):
+
+    def test_opt_in_and_setup_cells(self):
+        nb = notebook()
+        self.assertTrue(is_resident(nb))
+        self.assertEqual([cell.source for cell in setup_cells(nb)], ["import pickle"])
+
+        nb.metadata.papermill_api = {}
+        self.assertFalse(is_resident(nb))
+
+    def test_version_follows_contents(self):
+        nb = notebook()
+        version = notebook_version(nb)
+        nb.cells[0].outputs = [nbformat.v4.new_output("stream", text="ignored")]
+        self.assertEqual(notebook_version(nb), version)
+        nb.cells[1].source = "result = 2"
+        self.assertNotEqual(notebook_version(nb), version)
+
+    def test_kernels_are_reused_until_reloaded(self):
+        kernels = ResidentKernels()
+        kernels.size = 1
+        kernels.max_notebooks = 2
+        started = []
+
+        def setup(km):
+            started.append(km)
+            return []
+
+        kernels._start = lambda notebook, kernel_name, setup: ResidentKernel(FakeKernelManager(), setup(None), 0)
+
+        for _ in range(2):
+            with kernels.lease("nb.ipynb", "v1", "python3", setup):
+                pass
+        self.assertEqual(len(started), 1)
+
+        # a new version replaces the kernel
+        with kernels.lease("nb.ipynb", "v2", "python3", setup):
+            pass
+        self.assertEqual(len(started), 2)
+
+        self.assertEqual(kernels.reload(), ["nb.ipynb"])
+        self.assertEqual(kernels.stats(), [])
+        with kernels.lease("nb.ipynb", "v2", "python3", setup):
+            pass
+        self.assertEqual(len(started), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
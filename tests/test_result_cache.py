@@ -0,0 +1,53 @@
+import unittest
+from app import create_app, db
+from app.main.result_cache import canonical_parameters, result_cache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_canonical_parameters(self):
+        self.assertEqual(canonical_parameters({"a": 1, "b": {"d": 2, "c": 3}}),
+                         canonical_parameters({"b": {"c": 3, "d": 2}, "a": 1}))
+
+    def test_ttl(self):
+        metadata = lambda: {"cache_ttl": 300}
+        self.assertEqual(result_cache.ttl(metadata, {}), 300)
+        self.assertEqual(result_cache.ttl(metadata, {"cache": "false"}), 0)
+        self.assertEqual(result_cache.ttl(metadata, {"cacheTtl": "60"}), 60)
+        self.assertEqual(result_cache.ttl(dict, {"cache": "true"}), self.app.config["RESULT_CACHE_TTL"])
+        self.assertEqual(result_cache.ttl(dict, {}), 0)
+
+    def test_put_get_purge(self):
+        result_cache.put("key", "s3://bucket/nb.ipynb", {"answer": 42}, "s3://bucket/out.ipynb", 60)
+
+        cached = result_cache.get("key")
+        self.assertEqual(cached.result, '{"answer": 42}')
+        self.assertEqual(cached.hits, 1)
+
+        self.assertEqual(result_cache.purge("s3://bucket/nb.ipynb"), 1)
+        self.assertIsNone(result_cache.get("key"))
+
+    def test_expired_results_are_not_used(self):
+        result_cache.put("key", "nb.ipynb", {}, None, -1)
+        self.assertIsNone(result_cache.get("key"))
+
+    def test_keeps_most_recently_used(self):
+        self.app.config["RESULT_CACHE_MAX_ENTRIES"] = 1
+        result_cache.put("first", "nb.ipynb", {}, None, 60)
+        result_cache.put("second", "nb.ipynb", {}, None, 60)
+        self.assertIsNone(result_cache.get("first"))
+        self.assertIsNotNone(result_cache.get("second"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import nbformat
+from papermill.exceptions import PapermillExecutionError
+from app import create_app
+from app.main.runner import raise_for_errors, read_scraps
+
+
+def notebook(failed):
+    cell = nbformat.v4.new_code_cell("assert num != 13", execution_count=1)
+    if failed:
+        cell.outputs = [nbformat.v4.new_output("error", ename="AssertionError", evalue="", traceback=[])]
+    nb = nbformat.v4.new_notebook(cells=[cell])
+    nb.metadata.papermill = {}
+    return nb
+
+
+# notebook with a cell that glued answer
+def glued(answer):
+    output = nbformat.v4.new_output("display_data", data={
+        "application/scrapbook.scrap.json+json": {"name": "answer", "data": answer, "encoder": "json", "version": 1}
+    }, metadata={"scrapbook": {"name": "answer", "data": True, "display": False}})
+    cell = nbformat.v4.new_code_cell("sb.glue('answer', answer)", execution_count=1, outputs=[output])
+    return nbformat.v4.new_notebook(cells=[cell])
+
+
+class RaiseForErrorsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.outfile = os.path.join(self.directory.name, "out", "notebook_out.ipynb")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_success_writes_nothing(self):
+        raise_for_errors(notebook(False), self.outfile)
+        self.assertFalse(os.path.exists(os.path.dirname(self.outfile)))
+
+    def test_failure_is_written(self):
+        with self.assertRaises(PapermillExecutionError):
+            raise_for_errors(notebook(True), self.outfile)
+        self.assertTrue(os.path.exists(self.outfile))
+
+    def test_failure_without_outfile(self):
+        with self.assertRaises(PapermillExecutionError) as raised:
+            raise_for_errors(notebook(True), None)
+        self.assertEqual(raised.exception.ename, "AssertionError")
+        self.assertFalse(os.path.exists(os.path.dirname(self.outfile)))
+
+
+class ReadScrapsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.directory = tempfile.TemporaryDirectory()
+        self.outfile = os.path.join(self.directory.name, "notebook_out.ipynb")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        self.app_context.pop()
+
+    def test_reads_the_executed_notebook(self):
+        # nothing was written, so the scraps can only come from the notebook in memory
+        self.assertEqual(read_scraps(glued(42), self.outfile), {"answer": 42})
+
+    def test_verify_uses_the_written_notebook_when_they_differ(self):
+        self.app.config["VERIFY_SCRAPS"] = True
+        nbformat.write(glued(41), self.outfile)
+
+        with self.assertLogs("app.main.runner", "WARNING"):
+            self.assertEqual(read_scraps(glued(42), self.outfile), {"answer": 41})
+        self.assertEqual(read_scraps(glued(41), self.outfile), {"answer": 41})
+        self.assertEqual(read_scraps(glued(42), self.outfile, verify=False), {"answer": 42})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import unittest
+from unittest import mock
+import nbformat
+from app.main import serialization
+from app.main.errors import InvalidUsage
+from app.main.serialization import chunks, dumps, parse_fields, parse_strip, project, strip_notebook
+
+
+class SerializationTestCase(unittest.TestCase):
+
+    def test_compact(self):
+        self.assertEqual(dumps({"result": {"a": [1, 2]}}), '{"result":{"a":[1,2]}}')
+        self.assertEqual(json.loads(dumps({"result": {"a": 1}}, pretty=True)), {"result": {"a": 1}})
+
+    def test_pretty_without_orjson(self):
+        body = {"result": {"a": [1, 2], "b": "c"}}
+        pretty = dumps(body, pretty=True)
+        with mock.patch.object(serialization, "orjson", None):
+            self.assertEqual(dumps(body, pretty=True), pretty)
+            self.assertEqual(dumps(body), '{"result":{"a":[1,2],"b":"c"}}')
+
+    def test_chunks(self):
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell("x = {}".format(i)) for i in range(50)])
+        body = {"result": {"a": 1}, "notebook": nb}
+        pieces = list(chunks(body, 256))
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(json.loads("".join(pieces)), json.loads(dumps(body)))
+
+    def test_project(self):
+        body = {"result": {"a": 1, "b": {"c": 2}, "d": 3}, "notebook": {}}
+        fields = parse_fields("result.a, result.b.c,result.missing")
+        self.assertEqual(project(body, fields), {"result": {"a": 1, "b": {"c": 2}}})
+        self.assertIsNone(parse_fields(""))
+
+    def test_strip_notebook(self):
+        cell = nbformat.v4.new_code_cell("print(1)", execution_count=1)
+        cell.outputs = [nbformat.v4.new_output("stream", text="1")]
+        markdown = nbformat.v4.new_markdown_cell("![image](attachment:image.png)",
+                                                 attachments={"image.png": {"image/png": "..."}})
+        nb = nbformat.v4.new_notebook(cells=[cell, markdown])
+
+        stripped = strip_notebook(nb, parse_strip("outputs,attachments"))
+        self.assertEqual(stripped.cells[0].outputs, [])
+        self.assertNotIn("attachments", stripped.cells[1])
+        # the executed notebook itself is unchanged
+        self.assertEqual(len(nb.cells[0].outputs), 1)
+        self.assertIn("attachments", nb.cells[1])
+
+        with self.assertRaises(InvalidUsage):
+            parse_strip("images")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import nbformat
+from datetime import datetime, timezone
+from app.progress import ObservedExecutionManager, RunProfile, kernel_busy
+from app.main.streaming import server_sent_event
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    def test_cell_events(self):
+        glued = nbformat.v4.new_output("display_data", data={
+            "application/scrapbook.scrap.json+json": {"name": "answer", "data": 42, "encoder": "json", "version": 1}
+        }, metadata={"scrapbook": {"name": "answer", "data": True, "display": False}})
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell("notes"),
+                                             nbformat.v4.new_code_cell("sb.glue('answer', 42)")])
+        nb.metadata.papermill = {}
+
+        events = []
+        nb_man = ObservedExecutionManager(lambda event, data: events.append((event, data)), nb, progress_bar=False)
+        # runs hand the manager their own copy of the notebook, it is not copied again
+        self.assertIs(nb_man.nb, nb)
+        nb_man.notebook_start()
+        for index, cell in enumerate(nb_man.nb.cells):
+            nb_man.cell_start(cell, index)
+            if cell.cell_type == "code":
+                cell.outputs.append(glued)
+            nb_man.cell_complete(cell, cell_index=index)
+
+        self.assertEqual([event for event, data in events], ["cell_start", "cell_complete", "scrap"])
+        self.assertEqual(events[1][1]["status"], "completed")
+        self.assertEqual(events[2][1], {"cell": 1, "name": "answer", "data": 42})
+
+    def test_kernel_ready_without_observer(self):
+        nb = nbformat.v4.new_notebook(cells=[nbformat.v4.new_markdown_cell("notes"),
+                                             nbformat.v4.new_code_cell("x = 1"), nbformat.v4.new_code_cell("y = 2")])
+        nb.metadata.papermill = {}
+
+        ready = []
+        nb_man = ObservedExecutionManager(None, nb, progress_bar=False, on_kernel_ready=lambda: ready.append(True))
+        nb_man.notebook_start()
+        for index, cell in enumerate(nb_man.nb.cells):
+            nb_man.cell_start(cell, index)
+            self.assertEqual(ready, [True] if index else [])
+            nb_man.cell_resources(index, 0.1, 100)
+            nb_man.cell_complete(cell, cell_index=index)
+
+        # nothing is collected for cells no one observes
+        self.assertEqual(nb_man.resources, {})
+
+    def test_profile(self):
+        profile = RunProfile()
+        for cell, duration in enumerate([0.5, 2.0, 1.0]):
+            profile.observe("cell_complete", {"cell": cell, "status": "completed", "duration": duration,
+                                              "kernelBusy": duration / 2, "kernelRss": cell * 100,
+                                              "outputBytes": 10})
+
+        summary = profile.as_dict(2)
+        self.assertEqual([cell["cell"] for cell in summary["slowest"]], [1, 2])
+        self.assertEqual(summary["duration"], 3.5)
+        self.assertEqual(summary["outputBytes"], 30)
+        self.assertEqual(summary["peakKernelRss"], 200)
+
+    def test_kernel_busy(self):
+        reply = {"header": {"date": datetime(2019, 4, 25, 7, 44, 17, 500000, tzinfo=timezone.utc)},
+                 "metadata": {"started": "2019-04-25T07:44:16.000000Z"}}
+        self.assertEqual(kernel_busy(reply), 1.5)
+        self.assertIsNone(kernel_busy({"header": {}, "metadata": {}}))
+
+    def test_server_sent_event(self):
+        self.assertEqual(server_sent_event("result", {"result": {}}), 'event: result\ndata: {"result":{}}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
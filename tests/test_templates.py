@@ -0,0 +1,117 @@
+import json
+import unittest
+from app import create_app, db
+from app.models import TemplateVersion
+
+
+class TemplatesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post_template(self, name, content, default="false"):
+        return self.client.post("/template/", data=json.dumps({"name": name, "content": content, "default": default}))
+
+    def render(self, template_name=None, user_out=None):
+        from app.main.views import render
+        with self.app.test_request_context():
+            return render(template_name, user_out, "./in/", template_args={"notebook_name": "nb"})
+
+    def test_render_sees_template_changes(self):
+        self.post_template("daily", "{{args.notebook_name}}/first", default="true")
+        self.assertEqual(self.render("daily"), "nb/first")
+
+        self.client.patch("/template/", data=json.dumps({"name": "daily", "content": "{{args.notebook_name}}/second"}))
+        self.assertEqual(self.render("daily"), "nb/second")
+
+    def test_render_sees_default_changes(self):
+        self.assertEqual(self.render(), "./in/")
+
+        self.post_template("default", "{{args.year}}", default="true")
+        self.assertEqual(len(self.render()), 4)
+
+        self.client.delete("/template/default")
+        self.assertEqual(self.render(), "./in/")
+
+    def test_changes_bump_version(self):
+        self.post_template("daily", "a")
+        self.post_template("weekly", "b")
+        self.assertEqual(TemplateVersion.query.one().version, 2)
+
+    def test_default_template(self):
+        self.post_template("daily", "a", default="true")
+        response = self.client.get("/template/?default=true")
+        self.assertEqual(response.get_json(), {"name": "daily", "content": "a"})
+
+    def test_mutations_return_the_record(self):
+        self.post_template("daily", "a")
+        response = self.post_template("weekly", "b")
+        self.assertEqual(response.get_json(), {"name": "weekly", "content": "b"})
+
+        response = self.client.delete("/template/daily")
+        self.assertEqual(response.get_json(), {"name": "daily", "content": "a"})
+
+    def test_list_pages(self):
+        for name in ("a_1", "a_2", "a_3", "ab", "b_1"):
+            self.post_template(name, "content")
+
+        response = self.client.get("/template/?prefix=a_&limit=2&summary=true")
+        self.assertEqual(response.get_json(), [{"name": "a_1"}, {"name": "a_2"}])
+        self.assertIn("after=a_2", response.headers["Link"])
+
+        response = self.client.get("/template/?prefix=a_&limit=2&after=a_2")
+        self.assertEqual(response.get_json(), [{"name": "a_3", "content": "content"}])
+        self.assertNotIn("Link", response.headers)
+
+        self.assertEqual(self.client.get("/template/?limit=x").status_code, 400)
+
+    def test_not_modified(self):
+        self.post_template("daily", "a")
+        etag = self.client.get("/template/").headers["ETag"]
+
+        response = self.client.get("/template/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.post_template("weekly", "b")
+        response = self.client.get("/template/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_bulk_import(self):
+        self.post_template("daily", "a")
+        lines = [{"name": "daily", "content": "{{args.year}}"}, {"name": "weekly", "content": "b", "default": "true"}]
+        response = self.client.post("/template/bulk", data="\n".join(json.dumps(line) for line in lines))
+        self.assertEqual(response.get_json(), {"created": 1, "updated": 1, "default": "weekly"})
+
+        exported = [json.loads(line) for line in self.client.get("/template/export").get_data(as_text=True).splitlines()]
+        self.assertEqual(exported, [{"name": "daily", "content": "{{args.year}}"},
+                                    {"name": "weekly", "content": "b", "default": "true"}])
+        self.assertEqual(self.render(), "b")
+
+    def test_bulk_import_is_all_or_nothing(self):
+        response = self.client.post("/template/bulk", data=json.dumps([{"name": "daily", "content": "a"},
+                                                                        {"name": "weekly", "content": "{{ b"}]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["errors"][0]["name"], "weekly")
+        self.assertEqual(self.client.get("/template/").get_json(), [])
+
+    def test_bulk_import_rejects_names_a_template_cannot_have(self):
+        response = self.client.post("/template/bulk", data=json.dumps([{"name": "a" * 51, "content": "a"},
+                                                                        {"name": "export", "content": "b"},
+                                                                        {"name": "daily", "content": "c"}]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.get_json()["errors"]], [0, 1])
+        self.assertEqual(self.post_template("bulk", "d").status_code, 400)
+        self.assertEqual(self.client.get("/template/").get_json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from app import create_app, warmup
+from app.warmup import load_manifest
+
+NOTEBOOK = os.path.join(os.path.dirname(__file__), "..", "examples", "test.ipynb")
+
+
+class WarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+        warmup.__init__()
+
+    def create_app(self, manifest, processes=1):
+        app = create_app('testing')
+        app.config.update(WARMUP_MANIFEST=json.dumps(manifest), WARMUP_STATE_DIR=self.state_dir,
+                          WARMUP_PROCESSES=processes)
+        warmup.__init__(app)
+        return app
+
+    def test_load_manifest(self):
+        self.assertIsNone(load_manifest(None))
+        self.assertEqual(load_manifest('{"kernels": ["python3"]}'), {"notebooks": [], "kernels": ["python3"]})
+
+        path = os.path.join(self.state_dir, "manifest.json")
+        with open(path, "w") as f:
+            json.dump({"notebooks": ["nb.ipynb"]}, f)
+        self.assertEqual(load_manifest(path), {"notebooks": ["nb.ipynb"], "kernels": []})
+
+    def test_ready_without_manifest(self):
+        app = create_app('testing')
+        warmup.__init__(app)
+        self.assertEqual(app.test_client().get("/ready").status_code, 200)
+
+    def test_ready_once_warm(self):
+        app = self.create_app({"notebooks": [NOTEBOOK, "missing.ipynb"]})
+        client = app.test_client()
+        self.assertEqual(client.get("/ready").status_code, 503)
+
+        warmup.run(app)
+
+        response = client.get("/ready")
+        status = json.loads(response.get_data(as_text=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(status["notebooks"][NOTEBOOK], "ok")
+        self.assertNotEqual(status["notebooks"]["missing.ipynb"], "ok")
+        self.assertEqual(status["kernels"], {"python3": "ok"})
+        self.assertEqual(os.listdir(self.state_dir), [str(os.getpid())])
+
+    def test_failed_warmup_does_not_hold_back(self):
+        app = self.create_app({"notebooks": [NOTEBOOK]})
+
+        with mock.patch.object(warmup, "_warm_notebook", side_effect=RuntimeError("manifest gone")):
+            warmup.run(app)
+
+        status = json.loads(app.test_client().get("/ready").get_data(as_text=True))
+        self.assertEqual(status["state"], "failed")
+        self.assertTrue(status["ready"])
+        self.assertEqual(os.listdir(self.state_dir), [str(os.getpid())])
+
+    def test_waits_for_the_other_processes(self):
+        app = self.create_app({"notebooks": []}, processes=2)
+        warmup.run(app)
+        self.assertFalse(warmup.ready)
+
+        open(os.path.join(self.state_dir, "1"), "w").close()
+        self.assertTrue(warmup.ready)
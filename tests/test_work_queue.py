@@ -0,0 +1,91 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from app import create_app, db
+from app.main import work_queue
+from app.main.jobs import job_runner
+from app.models import Job, QueuedRun
+
+
+class WorkQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config["JOB_QUEUE"] = "database"
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def submit(self, name, priority=0):
+        paths_dict = {"in_notebook": "s3://bucket/{}.ipynb".format(name), "out_notebook_name": name + "-out.ipynb"}
+        return job_runner.submit(self.app, paths_dict, "s3://bucket/out/", {"num": 1}, priority=priority)
+
+    def expire(self, run_id):
+        QueuedRun.query.filter_by(id=run_id).update({"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+    def test_submit_enqueues(self):
+        job = self.submit("a")
+
+        run = QueuedRun.query.get(job.id)
+        self.assertEqual(run.state, "queued")
+        self.assertEqual(json.loads(run.parameters), {"num": 1})
+        self.assertEqual(Job.query.get(job.id).state, "queued")
+
+    def test_claim_is_exclusive(self):
+        job = self.submit("a")
+
+        run = work_queue.claim("a", 60, 3)
+        self.assertEqual((run.id, run.worker, run.attempts), (job.id, "a", 1))
+        self.assertIsNone(work_queue.claim("b", 60, 3))
+
+    def test_claim_by_priority(self):
+        self.submit("low")
+        high = self.submit("high", priority=5)
+
+        self.assertEqual(work_queue.claim("a", 60, 3).id, high.id)
+
+    def test_expired_lease_is_claimed_again(self):
+        job = self.submit("a")
+        work_queue.claim("a", 60, 3)
+        self.expire(job.id)
+
+        run = work_queue.claim("b", 60, 3)
+        self.assertEqual((run.id, run.worker, run.attempts), (job.id, "b", 2))
+
+        # the first worker lost the run, it neither extends the lease nor takes the run off the queue
+        self.assertEqual(work_queue.heartbeat("a", [job.id], 60), 0)
+        work_queue.complete("a", job.id)
+        self.assertIsNotNone(QueuedRun.query.get(job.id))
+
+        work_queue.complete("b", job.id)
+        self.assertIsNone(QueuedRun.query.get(job.id))
+
+    def test_gives_up_after_max_attempts(self):
+        job = self.submit("a")
+        work_queue.claim("a", 60, 1)
+        self.expire(job.id)
+
+        self.assertIsNone(work_queue.claim("b", 60, 1))
+        self.assertIsNone(QueuedRun.query.get(job.id))
+        self.assertEqual(Job.query.get(job.id).state, "failed")
+
+    def test_worker_runs_queued_jobs(self):
+        job_id = self.submit("a").id
+        worker = work_queue.Worker(self.app, 1, "test")
+
+        def run_job(job_id, *args):
+            work_queue.update_job(job_id, state="succeeded", result="{}")
+            worker.stop()
+
+        with mock.patch.object(work_queue, "run_job", side_effect=run_job):
+            worker.run()
+
+        db.session.remove()
+        self.assertEqual(Job.query.get(job_id).state, "succeeded")
+        self.assertIsNone(QueuedRun.query.get(job_id))